@@ -0,0 +1,139 @@
+import csv
+import itertools
+import json
+import multiprocessing as mp
+import random
+import time
+from engine import ARRIVAL, AVG_RULES, DEPART, FREE, Junction, JunctionEngine
+from metrics import LatencyHistogram
+from traffic_generator import VehicleGenerator
+
+# monte carlo sweeps of the signal policy
+#
+# every combination of the parameter grid is run for many seeds on a
+# process pool, each run is a headless single junction, and the runs are
+# aggregated into one row per configuration
+
+PARAMS = ["priority_on", "priority_off", "priority_keep", "avg_rule"]
+COLUMNS = PARAMS + ["runs", "throughput_mean", "throughput_std",
+                    "wait_mean", "wait_p95", "max_queue"]
+
+# collects wait times and the longest lit/free lane queue for one run
+class RunStats:
+    def __init__(self, junction):
+        self.waits = LatencyHistogram()
+        self.max_queue = 0
+        # L1 lanes only feed the others, the policy doesn't decide how long they get
+        self.watched = set(junction.light_lanes + junction.free_lanes)
+
+    def __call__(self, engine, kind, data):
+        if kind == ARRIVAL:
+            if data.lane in self.watched:
+                size = engine.queues[data.lane].size()
+                if size > self.max_queue:
+                    self.max_queue = size
+        elif kind == DEPART or kind == FREE:
+            self.waits.record(data.wait_time)
+
+def run_one(job):
+    config, seed, duration = job
+    random.seed(seed)
+    junction = Junction(**config)
+    engine = JunctionEngine([junction])
+    stats = RunStats(junction)
+    engine.add_observer(stats)
+    engine.attach_generator(VehicleGenerator(make_files=False))
+    engine.run(duration)
+    return (tuple(config[p] for p in PARAMS),
+            engine.total_served * 3600.0 / duration,
+            stats.waits.mean(),
+            stats.waits.percentile(95),
+            stats.max_queue)
+
+def aggregate(results):
+    by_config = {}
+    for key, throughput, wait_mean, wait_p95, max_queue in results:
+        by_config.setdefault(key, []).append((throughput, wait_mean, wait_p95, max_queue))
+    rows = []
+    for key in sorted(by_config, key=str):
+        runs = by_config[key]
+        n = len(runs)
+        tp = [r[0] for r in runs]
+        tp_mean = sum(tp) / n
+        tp_std = (sum((x - tp_mean) ** 2 for x in tp) / (n - 1)) ** 0.5 if n > 1 else 0.0
+        row = dict(zip(PARAMS, key))
+        row.update({
+            "runs": n,
+            "throughput_mean": round(tp_mean, 2),
+            "throughput_std": round(tp_std, 2),
+            "wait_mean": round(sum(r[1] for r in runs) / n, 3),
+            "wait_p95": round(sum(r[2] for r in runs) / n, 3),  # mean of per-run p95
+            "max_queue": max(r[3] for r in runs),
+        })
+        rows.append(row)
+    return rows
+
+def write_csv(rows, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def write_columnar(rows, path):
+    # parquet if pyarrow is around, otherwise a column-per-key JSON file
+    columns = {c: [row[c] for row in rows] for c in COLUMNS}
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("pyarrow is needed for .parquet output (pip install pyarrow), or use .json")
+        pyarrow.parquet.write_table(pyarrow.table(columns), path)
+    else:
+        with open(path, 'w') as f:
+            json.dump(columns, f)
+
+def parse_list(text, kind):
+    return [kind(x) for x in text.split(',')]
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Monte Carlo sweep of the signal policy")
+    parser.add_argument("--runs", type=int, default=100, help="seeded replications per configuration")
+    parser.add_argument("--duration", type=float, default=3600, help="junction seconds per run")
+    parser.add_argument("--priority-on", default="10", help="comma list, priority mode above this")
+    parser.add_argument("--priority-off", default="5", help="comma list, normal mode below this")
+    parser.add_argument("--priority-keep", default="4", help="comma list, vehicles left when priority serves")
+    parser.add_argument("--avg-rule", default="floor", help="comma list of floor, ceil, round")
+    parser.add_argument("--seed", type=int, default=0, help="first seed")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--out", default="sweep.csv", help="CSV results")
+    parser.add_argument("--columnar", default=None, help="also write columns to .json or .parquet")
+    args = parser.parse_args()
+
+    avg_rules = parse_list(args.avg_rule, str)
+    for rule in avg_rules:
+        if rule not in AVG_RULES:
+            parser.error(f"unknown --avg-rule {rule} (have: {', '.join(AVG_RULES)})")
+    grid = list(itertools.product(parse_list(args.priority_on, int), parse_list(args.priority_off, int),
+                                  parse_list(args.priority_keep, int), avg_rules))
+    configs = [dict(zip(PARAMS, values)) for values in grid]
+    # same seeds for every configuration so they see the same arrivals
+    jobs = [(config, args.seed + r, args.duration) for config in configs for r in range(args.runs)]
+
+    print(f"{len(configs)} configurations x {args.runs} runs = {len(jobs)} runs")
+    start = time.perf_counter()
+    with mp.Pool(args.workers) as pool:
+        results = []
+        for i, res in enumerate(pool.imap_unordered(run_one, jobs, chunksize=max(1, len(jobs) // 200))):
+            results.append(res)
+            if (i + 1) % max(1, len(jobs) // 10) == 0:
+                print(f"  {i + 1}/{len(jobs)} runs, {time.perf_counter() - start:.0f}s")
+    rows = aggregate(results)
+    elapsed = time.perf_counter() - start
+
+    write_csv(rows, args.out)
+    if args.columnar:
+        write_columnar(rows, args.columnar)
+    print(f"Done in {elapsed:.1f}s ({len(jobs) / elapsed:.1f} runs/s), wrote {args.out}")
@@ -0,0 +1,298 @@
+import argparse
+import cProfile
+import json
+import os
+import platform
+import pstats
+import random
+import shutil
+import sys
+import tempfile
+import time
+from engine import Junction, JunctionEngine, LaneQueue, Vehicle, VehicleQueue
+from ingest import LaneFileReader
+from network import build_engine, grid_topology
+from traffic_generator import VehicleGenerator
+
+# benchmark suite for the hot paths - ingest, generation, scheduling,
+# the headless engine and frame drawing
+#
+# every scenario sets up from a fixed seed, then the timed part runs
+# --repeat times and the best run counts. results go out as JSON and can be
+# checked against a saved baseline:
+#   python bench.py --out base.json
+#   python bench.py --baseline base.json     # exit code 1 on a regression
+
+SCENARIOS = {}
+
+def scenario(name, unit, needs_display=False):
+    # a scenario is setup(seed) -> (work, n) or (work, n, cleanup): work()
+    # is what gets timed, n is how many units it gets through (or a function
+    # giving that once work has run) and cleanup() runs after the timing.
+    # needs_display scenarios are skipped without tkinter or a display,
+    # anything else that goes wrong fails the run
+    def register(fn):
+        SCENARIOS[name] = (fn, unit, needs_display)
+        return fn
+    return register
+
+def display_errors():
+    try:
+        import tkinter
+    except ImportError:
+        return (ImportError,)
+    return (ImportError, tkinter.TclError)
+
+def lane_files(directory, lines, seed, fmt="json"):
+    # a seeded generator writing at least `lines` vehicles into directory
+    gen = VehicleGenerator(make_files=False, batched=True, log='quiet', fmt=fmt, seed=seed)
+    gen.files = {os.path.join(directory, f): lanes for f, lanes in gen.files.items()}
+    while gen.total_written < lines:
+        gen.random_generation()
+    gen.close()
+    return gen.total_written
+
+def ingest(lines, fmt="json"):
+    def setup(seed):
+        from live import LiveSimulation
+        directory = tempfile.mkdtemp(prefix="bench-")
+        n = lane_files(directory, lines, seed, fmt)
+        live = LiveSimulation(JunctionEngine([Junction()]), LaneFileReader(directory=directory, fmt=fmt))
+
+        def cleanup():
+            live.reader.close()
+            shutil.rmtree(directory)
+        return live.load_vehicles_from_file, n, cleanup
+    return setup
+
+scenario("ingest-10k", "lines/s")(ingest(10000))
+scenario("ingest-1m", "lines/s")(ingest(1000000))
+scenario("ingest-1m-binary", "records/s")(ingest(1000000, "binary"))
+
+def generate(batched, cycles=2000):
+    def setup(seed):
+        directory = tempfile.mkdtemp(prefix="bench-")
+        gen = VehicleGenerator(make_files=False, batched=batched, log='quiet', seed=seed)
+        gen.files = {os.path.join(directory, f): lanes for f, lanes in gen.files.items()}
+
+        def work():
+            for _ in range(cycles):
+                gen.random_generation()
+            gen.close()
+        return work, lambda: gen.total_written, lambda: shutil.rmtree(directory)
+    return setup
+
+scenario("generate-write", "vehicles/s")(generate(False))
+scenario("generate-batched", "vehicles/s")(generate(True))
+
+@scenario("schedule-lanequeue", "decisions/s")
+def schedule_lanequeue(seed, decisions=200000, n_lanes=12):
+    # get_next_lane with a few arrivals and the odd priority flip between
+    rng = random.Random(seed)
+    lane_q = LaneQueue()
+    queues = []
+    for i in range(n_lanes):
+        q = VehicleQueue(f"L{i}")
+        queues.append(q)
+        lane_q.add_lane(q.lane, q)
+    v = Vehicle("V0", "L0")
+    picks = [rng.randrange(n_lanes) for _ in range(3 * decisions)]
+    flips = [(rng.random() < 0.1, f"L{rng.randrange(n_lanes)}", rng.choice([0, 100])) for _ in range(decisions)]
+
+    def work():
+        for k in range(decisions):
+            for i in picks[3 * k:3 * k + 3]:
+                queues[i].add_vehicle(v)
+            flip, lane, priority = flips[k]
+            if flip:
+                lane_q.update_priority(lane, priority)
+            lane_q.get_next_lane()[2].remove_vehicle()
+    return work, decisions
+
+def decisions(controller, count=100000):
+    # the controller's light decision on a junction whose lane 2 queues
+    # change between calls
+    def setup(seed):
+        rng = random.Random(seed)
+        engine = build_engine(grid_topology(1, 3), controller=controller)
+        j = engine.junctions["J0_1"]
+        lanes = j.light_lanes + j.incoming_lanes
+        n = 0
+        for lane in lanes:
+            for _ in range(rng.randint(0, 15)):
+                n += 1
+                j.queues[lane].add_vehicle(Vehicle(f"V{n}", lane))
+        changes = [(lanes[rng.randrange(len(lanes))], rng.random() < 0.5) for _ in range(count)]
+
+        def work():
+            vid = 0
+            for lane, add in changes:
+                q = j.queues[lane]
+                if add or q.size() == 0:
+                    vid += 1
+                    q.add_vehicle(Vehicle(f"W{vid}", lane))
+                else:
+                    q.remove_vehicle()
+                j.controller.next_lane(engine, j)
+        return work, count
+    return setup
+
+scenario("decide-priority", "decisions/s")(decisions("priority"))
+scenario("decide-max-pressure", "decisions/s")(decisions("max-pressure"))
+
+@scenario("engine-hour", "events/s")
+def engine_hour(seed):
+    # an hour of junction time headless, counting every event
+    engine = JunctionEngine([Junction()])
+    counter = [0]
+    engine.add_observer(lambda e, kind, data: counter.__setitem__(0, counter[0] + 1))
+    engine.attach_generator(VehicleGenerator(make_files=False, seed=seed), 5.0)
+    return (lambda: engine.run(3600)), lambda: counter[0]
+
+def render(rows, cols, scale, frames=200):
+    # draw() with the engine moving a second between frames - skipped
+    # without a display
+    def setup(seed):
+        import tkinter as tk
+        from live import LiveSimulation
+        from simulator import TrafficSimulator
+        if rows * cols == 1:
+            engine = JunctionEngine([Junction()])
+            engine.attach_generator(VehicleGenerator(make_files=False, seed=seed), 5.0)
+        else:
+            engine = build_engine(grid_topology(rows, cols))
+            generator = VehicleGenerator(make_files=False, seed=seed)
+            for name in engine.junctions:
+                engine.attach_generator(generator, junction=name)
+        root = tk.Tk()
+        root.withdraw()
+        app = TrafficSimulator(root, LiveSimulation(engine), scale)
+
+        def work():
+            for k in range(frames):
+                engine.run_until(k + 1.0)
+                app.draw()
+        return work, frames, root.destroy
+    return setup
+
+scenario("render", "frames/s", needs_display=True)(render(1, 1, 1.0))
+scenario("render-grid", "frames/s", needs_display=True)(render(10, 10, 0.3))
+
+def profiled(work, name, profiler, directory):
+    # run work once under a profiler and save what it found
+    if profiler == "cprofile":
+        prof = cProfile.Profile()
+        prof.runcall(work)
+        path = os.path.join(directory, f"bench-{name}.prof")
+        prof.dump_stats(path)
+        print(f"\n{name}: cProfile saved to {path} (top 10 by cumulative time)")
+        pstats.Stats(prof).sort_stats("cumulative").print_stats(10)
+        return
+    try:
+        import pyinstrument
+    except ImportError:
+        raise RuntimeError("pyinstrument is needed for --profile sample (pip install pyinstrument), or use cprofile")
+    sampler = pyinstrument.Profiler()
+    sampler.start()
+    work()
+    sampler.stop()
+    path = os.path.join(directory, f"bench-{name}.html")
+    with open(path, 'w') as f:
+        f.write(sampler.output_html())
+    print(f"\n{name}: sampling profile saved to {path}")
+    print(sampler.output_text())
+
+def run_scenario(name, seed, repeat, profiler=None, profile_dir="."):
+    setup, unit, needs_display = SCENARIOS[name]
+    skippable = display_errors() if needs_display else ()
+    best = None
+    for _ in range(repeat):
+        try:
+            parts = setup(seed)
+        except skippable as e:
+            return {"unit": unit, "skipped": f"{type(e).__name__}: {e}"}
+        try:
+            work, n = parts[:2]
+            start = time.perf_counter()
+            work()
+            took = time.perf_counter() - start
+            best = took if best is None else min(best, took)
+            if callable(n):
+                n = n()
+        finally:
+            if len(parts) > 2:
+                parts[2]()
+    if profiler:
+        parts = setup(seed)
+        try:
+            profiled(parts[0], name, profiler, profile_dir)
+        finally:
+            if len(parts) > 2:
+                parts[2]()
+    return {"unit": unit, "n": n, "seconds": round(best, 6), "rate": round(n / best, 1)}
+
+def machine_info():
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(),
+            "machine": platform.machine(), "system": platform.system(), "cpus": os.cpu_count()}
+
+def compare(results, baseline, tolerance):
+    # scenario -> (baseline rate, rate, change) and the names that got slower
+    # by more than tolerance
+    rows = {}
+    regressions = []
+    for name, r in results["scenarios"].items():
+        b = baseline["scenarios"].get(name)
+        if b is None or "rate" not in r or "rate" not in b:
+            continue
+        change = r["rate"] / b["rate"] - 1
+        rows[name] = (b["rate"], r["rate"], change)
+        if change < -tolerance:
+            regressions.append(name)
+    return rows, regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the simulator hot paths")
+    parser.add_argument("--only", default=None, help=f"comma separated scenarios (have: {', '.join(SCENARIOS)})")
+    parser.add_argument("--skip", default=None, help="comma separated scenarios to leave out, e.g. ingest-1m")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per scenario, the best one counts")
+    parser.add_argument("--out", default=None, help="write results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="slowdown that counts as a regression")
+    parser.add_argument("--profile", choices=["cprofile", "sample"], default=None,
+                        help="profile each scenario once more after timing it")
+    parser.add_argument("--profile-dir", default=".", help="where profiles are saved")
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name!r} (have: {', '.join(SCENARIOS)})")
+    if args.skip:
+        names = [n for n in names if n not in args.skip.split(',')]
+
+    results = {"machine": machine_info(), "seed": args.seed, "repeat": args.repeat, "scenarios": {}}
+    print(f"{'scenario':<22} {'rate':>16} {'unit':<14} {'best s':>9}")
+    for name in names:
+        r = run_scenario(name, args.seed, args.repeat, args.profile, args.profile_dir)
+        results["scenarios"][name] = r
+        if "skipped" in r:
+            print(f"{name:<22} {'skipped':>16} {r['skipped']}")
+        else:
+            print(f"{name:<22} {r['rate']:>16,.0f} {r['unit']:<14} {r['seconds']:>9.3f}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline, args.tolerance)
+        print(f"\n{'scenario':<22} {'baseline':>16} {'now':>16} {'change':>8}")
+        for name, (base_rate, rate, change) in rows.items():
+            flag = "  REGRESSION" if name in regressions else ""
+            print(f"{name:<22} {base_rate:>16,.0f} {rate:>16,.0f} {change * 100:>+7.1f}%{flag}")
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance * 100:.0f}%: {', '.join(regressions)}")
+            sys.exit(1)
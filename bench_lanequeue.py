@@ -0,0 +1,60 @@
+import argparse
+import random
+import time
+from engine import LaneQueue, Vehicle, VehicleQueue
+
+# decisions/s for the heap LaneQueue vs the old sort-every-time version
+
+# the original LaneQueue - full sort on every decision, linear priority update
+class SortedLaneQueue:
+    def __init__(self):
+        self.lanes = []
+
+    def add_lane(self, lane_name, q, priority=0):
+        self.lanes.append([priority, lane_name, q])
+
+    def update_priority(self, lane_name, new_priority):
+        for lane_data in self.lanes:
+            if lane_data[1] == lane_name:
+                lane_data[0] = new_priority
+                break
+
+    def get_next_lane(self):
+        self.lanes.sort(key=lambda x: (-x[0], -x[2].size()))
+        if len(self.lanes) > 0:
+            return self.lanes[0]
+        return None
+
+def run(lane_q_class, n_lanes, decisions, seed=1):
+    rng = random.Random(seed)
+    lane_q = lane_q_class()
+    queues = []
+    for i in range(n_lanes):
+        q = VehicleQueue(f"L{i}")
+        queues.append(q)
+        lane_q.add_lane(q.lane, q)
+    v = Vehicle("V0", "L0")
+
+    start = time.perf_counter()
+    for _ in range(decisions):
+        # a few arrivals, an occasional priority flip, then serve the best lane
+        for _ in range(3):
+            queues[rng.randrange(n_lanes)].add_vehicle(v)
+        if rng.random() < 0.1:
+            lane_q.update_priority(f"L{rng.randrange(n_lanes)}", rng.choice([0, 100]))
+        best = lane_q.get_next_lane()
+        best[2].remove_vehicle()
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark LaneQueue scheduling")
+    parser.add_argument("--decisions", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'lanes':>8} {'sorted (dec/s)':>16} {'heap (dec/s)':>16} {'speedup':>9}")
+    for n_lanes in [4, 100, 10000]:
+        # the sort is O(n log n) per decision, keep the big case short
+        decisions = args.decisions if n_lanes < 10000 else max(1, args.decisions // 100)
+        t_sort = run(SortedLaneQueue, n_lanes, decisions)
+        t_heap = run(LaneQueue, n_lanes, decisions)
+        print(f"{n_lanes:>8} {decisions / t_sort:>16,.0f} {decisions / t_heap:>16,.0f} {t_sort / t_heap:>8.1f}x")
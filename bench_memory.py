@@ -0,0 +1,78 @@
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from collections import deque
+from engine import CompactVehicleQueue, Vehicle, VehicleQueue
+
+# bytes per queued vehicle and add/remove speed for each way of storing a lane
+
+# the original vehicle - attribute dict and a colour picked when it's made
+class DictVehicle:
+    def __init__(self, vid, lane, junction=None):
+        self.id = vid
+        self.lane = lane
+        self.junction = junction
+        self.wait_time = 0
+        self.generated_at = None
+        self.enqueued_at = None
+        self.departed_at = None
+        self.color = random.choice(['red', 'blue', 'green', 'yellow', 'orange', 'purple'])
+
+# the original queue - a plain deque of vehicle objects
+class DequeQueue:
+    def __init__(self, lane_name):
+        self.lane = lane_name
+        self.q = deque()
+
+    def add_vehicle(self, v):
+        self.q.append(v)
+
+    def remove_vehicle(self):
+        return self.q.popleft()
+
+STORAGE = {
+    "dict vehicles": (DictVehicle, DequeQueue),
+    "slotted vehicles": (Vehicle, VehicleQueue),
+    "compact buffers": (Vehicle, CompactVehicleQueue),
+}
+
+def fill(vehicle_class, queue_class, n, lanes=12):
+    queues = [queue_class(f"L{i}") for i in range(lanes)]
+    for i in range(n):
+        v = vehicle_class(f"V{i}", queues[i % lanes].lane)
+        v.enqueued_at = float(i)
+        v.generated_at = float(i)
+        queues[i % lanes].add_vehicle(v)
+    return queues
+
+def bytes_per_vehicle(vehicle_class, queue_class, n):
+    gc.collect()
+    tracemalloc.start()
+    queues = fill(vehicle_class, queue_class, n)
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del queues
+    return used / n
+
+def ops_per_second(vehicle_class, queue_class, n):
+    # time to queue n vehicles and serve them all again
+    start = time.perf_counter()
+    queues = fill(vehicle_class, queue_class, n)
+    for q in queues:
+        for _ in range(n // len(queues)):
+            q.remove_vehicle()
+    return 2 * n / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory per queued vehicle for each lane storage")
+    parser.add_argument("-n", type=int, default=1000000, help="vehicles queued over 12 lanes")
+    args = parser.parse_args()
+
+    print(f"{args.n:,} queued vehicles over 12 lanes\n")
+    print(f"{'storage':<18} {'bytes/vehicle':>14} {'MB total':>10} {'add+remove/s':>14}")
+    for name, (vehicle_class, queue_class) in STORAGE.items():
+        per = bytes_per_vehicle(vehicle_class, queue_class, args.n)
+        rate = ops_per_second(vehicle_class, queue_class, args.n)
+        print(f"{name:<18} {per:>14.1f} {per * args.n / 1e6:>10.1f} {rate:>14,.0f}")
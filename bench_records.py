@@ -0,0 +1,57 @@
+import argparse
+import os
+import tempfile
+import time
+from records import RECORD_SIZE, decode_binary, decode_json, encode_binary, encode_json, iter_records_mmap
+from traffic_generator import VehicleGenerator
+
+# records/s for JSON lines vs binary records, encoding and decoding
+
+def make_vehicles(n):
+    gen = VehicleGenerator(make_files=False)
+    vehicles = []
+    while len(vehicles) < n:
+        for _, v in gen.generate_cycle():
+            v['time'] = time.time()
+            vehicles.append(v)
+    return vehicles[:n]
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+def report(name, n, seconds, nbytes=None):
+    line = f"{name:<28} {n / seconds:>14,.0f} records/s"
+    if nbytes is not None:
+        line += f"   {nbytes / n:5.1f} bytes/record"
+    print(line)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the lane file encodings")
+    parser.add_argument("-n", type=int, default=500000, help="records per run")
+    args = parser.parse_args()
+    n = args.n
+
+    vehicles = make_vehicles(n)
+    print(f"{n:,} records\n")
+
+    t, json_data = timed(lambda: b''.join(encode_json(v) for v in vehicles))
+    report("encode json", n, t, len(json_data))
+    t, bin_data = timed(lambda: b''.join(encode_binary(v) for v in vehicles))
+    report("encode binary", n, t, len(bin_data))
+
+    t, (out, _) = timed(lambda: decode_json(json_data))
+    assert len(out) == n
+    report("decode json", n, t)
+    t, (out, _) = timed(lambda: decode_binary(bin_data))
+    assert len(out) == n
+    report("decode binary (dicts)", n, t)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "lanea.bin")
+        with open(path, 'wb') as f:
+            f.write(bin_data)
+        t, count = timed(lambda: sum(1 for _ in iter_records_mmap(path)))
+        assert count == len(bin_data) // RECORD_SIZE
+        report("decode binary (mmap tuples)", n, t)
@@ -0,0 +1,378 @@
+import gc
+import json
+import os
+import random
+import struct
+import threading
+import time
+from array import array
+from engine import (ARRIVAL, FEED, FREE, GENERATE, LIGHT, DEPART, NO_TIME, CompactVehicleQueue,
+                    Vehicle)
+from tracing import build_from_config, engine_config
+
+# snapshots of a running engine, so a long scenario survives the window
+# closing or the process dying
+#
+# file: 4 byte magic, uint32 length + JSON state, then each lane's vehicles
+# as raw arrays in the order the JSON lists the lanes - ids (int64 vehicle
+# numbers for compact lanes, newline separated text otherwise), enqueue and
+# generation times (float64, NaN = none) and a byte per vehicle that's 1 if
+# it carried its junction's name. the JSON holds everything small: the
+# engine setup and counters, junction state (priority mode, lights, what's
+# being served, lane priorities), the event heap, generator state and the
+# lane file offsets
+#
+# compact lanes (Junction(compact=True)) are already those arrays, so big
+# queues are written and read back in milliseconds. plain lanes have to be
+# walked vehicle by vehicle, so they take time in proportion to the queue
+
+MAGIC = b"JCK1"
+LENGTH = struct.Struct('<I')
+
+def time_or_nan(t):
+    return NO_TIME if t is None else t
+
+def lane_arrays(q):
+    # (ids, id format, enqueued, generated, named) for one lane in queue order
+    if isinstance(q, CompactVehicleQueue):
+        ids, enqueued, generated, named = q.export()
+        return ids.tobytes(), "numbers", enqueued, generated, named
+    vehicles = q.get_all()
+    enqueued = array('d', [time_or_nan(v.enqueued_at) for v in vehicles])
+    generated = array('d', [time_or_nan(v.generated_at) for v in vehicles])
+    named = bytearray(v.junction is not None for v in vehicles)
+    ids = "\n".join(v.id for v in vehicles).encode()
+    return ids, "text", enqueued, generated, named
+
+def vehicle_state(v):
+    return [v.id, v.lane, v.junction, v.generated_at]
+
+def rng_state(rng):
+    # random.Random and numpy generators - None for the shared random module
+    if isinstance(rng, random.Random):
+        return ["random", rng.getstate()]
+    bit_generator = getattr(rng, "bit_generator", None)
+    if bit_generator is not None:
+        return ["numpy", bit_generator.state]
+    return None
+
+def set_rng_state(rng, state):
+    if state is None:
+        return
+    kind, value = state
+    if kind == "random":
+        version, internal, gauss = value
+        rng.setstate((version, tuple(internal), gauss))
+    else:
+        rng.bit_generator.state = value
+
+def generator_state(g):
+    state = {"vehicle_counter": g.vehicle_counter, "rng": rng_state(g.rng)}
+    demand = getattr(g, "demand", None)
+    if demand is not None:
+        state["demand"] = {"t": demand.t, "next_id": demand.next_id, "rng": rng_state(demand.rng)}
+    return state
+
+def set_generator_state(g, state):
+    g.vehicle_counter = state["vehicle_counter"]
+    set_rng_state(g.rng, state["rng"])
+    if "demand" in state and getattr(g, "demand", None) is not None:
+        g.demand.t = state["demand"]["t"]
+        g.demand.next_id = state["demand"]["next_id"]
+        set_rng_state(g.demand.rng, state["demand"]["rng"])
+
+def reader_state(reader):
+    # lane file offsets - a stream has nothing to go back to
+    state = getattr(reader, "state", None)
+    if state is None:
+        return None
+    return {"files": json.loads(json.dumps(state)), "rotated": json.loads(json.dumps(reader.rotated))}
+
+def snapshot(engine, reader=None):
+    # everything as (JSON state, [lane array blobs]) - call from the thread
+    # that runs the engine, with engine.lock held and nothing being handed
+    # over from the reader at the time (LiveSimulation.call does all that)
+    engine.drain_inbox()  # handed over but not taken in yet - make them events
+    generators = []
+    events = []
+    for t, seq, kind, data in sorted(engine.events):
+        if kind == ARRIVAL:
+            ref = vehicle_state(data)
+        elif kind == GENERATE:
+            generator, interval, junction = data
+            if generator not in generators:
+                generators.append(generator)
+            ref = [generators.index(generator), interval, junction]
+        else:
+            ref = data.name
+        events.append([t, seq, kind, ref])
+
+    junctions = []
+    lanes = []
+    blobs = []
+    for j in engine.junctions.values():
+        junctions.append({
+            "name": j.name, "serving": j.serving, "light_pending": j.light_pending,
+            "serve_count": j.serve_count, "vehicles_to_serve": j.vehicles_to_serve,
+            "current_serving_lane": j.current_serving_lane, "green_since": j.green_since,
+            "is_priority_mode": j.is_priority_mode, "total_served": j.total_served,
+            "light": [j.lights.state, j.lights.current_lane],
+            "priorities": {lane_data[1]: lane_data[0] for lane_data in j.lane_q.lanes},
+            "rejected": j.rejected, "spilled": j.spilled, "served": j.served,
+        })
+        for lane, q in j.queues.items():
+            ids, id_format, enqueued, generated, named = lane_arrays(q)
+            lanes.append({"junction": j.name, "lane": lane, "count": len(named), "ids": id_format,
+                          "id_bytes": len(ids)})
+            blobs.extend([ids, enqueued.tobytes(), generated.tobytes(), bytes(named)])
+
+    state = {
+        "version": 1,
+        "saved_at": time.time(),
+        "config": engine_config(engine),
+        "clock": engine.clock, "seq": engine.seq,
+        "counters": {k: getattr(engine, k) for k in ("total_served", "exited", "arrived", "dropped", "rejected")},
+        "junctions": junctions,
+        "lanes": lanes,
+        "events": events,
+        "generators": [generator_state(g) for g in generators],
+        "reader": reader_state(reader) if reader is not None else None,
+    }
+    return state, blobs
+
+def save_checkpoint(engine, path, reader=None):
+    # written to a temp file and renamed over the old one, so a crash mid-save
+    # leaves the previous checkpoint
+    with engine.lock:
+        state, blobs = snapshot(engine, reader)
+    write_checkpoint(path, state, blobs)
+    return state
+
+def write_checkpoint(path, state, blobs):
+    blob = json.dumps(state).encode()
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + LENGTH.pack(len(blob)) + blob)
+        for b in blobs:
+            f.write(b)
+    os.replace(tmp, path)
+
+def read_checkpoint(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != MAGIC:
+        raise ValueError(f"{path} is not a checkpoint file")
+    (length,) = LENGTH.unpack_from(data, 4)
+    start = 4 + LENGTH.size
+    state = json.loads(data[start:start + length])
+    return state, memoryview(data)[start + length:]
+
+def fill_lane(j, q, spec, raw, offset):
+    # one lane's arrays from raw starting at offset - returns the new offset
+    n = spec["count"]
+    ids_raw = raw[offset:offset + spec["id_bytes"]]
+    offset += spec["id_bytes"]
+    enqueued = array('d')
+    enqueued.frombytes(raw[offset:offset + 8 * n])
+    offset += 8 * n
+    generated = array('d')
+    generated.frombytes(raw[offset:offset + 8 * n])
+    offset += 8 * n
+    named = bytearray(raw[offset:offset + n])
+    offset += n
+    if n == 0:
+        return offset
+
+    if spec["ids"] == "numbers":
+        ids = array('q')
+        ids.frombytes(ids_raw)
+    else:
+        ids = bytes(ids_raw).decode().split("\n")
+    if isinstance(q, CompactVehicleQueue):
+        if spec["ids"] != "numbers":
+            ids = array('q', [int(vid[1:]) for vid in ids])
+        q.load(ids, enqueued, generated, named)
+        return offset
+
+    if spec["ids"] == "numbers":
+        ids = [f"V{num}" for num in ids]
+    name = j.name
+    lane = q.lane
+    vehicles = []
+    # a million new objects would set the collector off over and over
+    gc.disable()
+    try:
+        for vid, enq, gen, has_name in zip(ids, enqueued, generated, named):
+            v = Vehicle(vid, lane, name if has_name else None)
+            v.enqueued_at = None if enq != enq else enq
+            v.generated_at = None if gen != gen else gen
+            vehicles.append(v)
+    finally:
+        gc.enable()
+    q.extend(vehicles)
+    return offset
+
+def restore_checkpoint(path, engine=None, reader=None, generators=None):
+    # load a checkpoint into engine (built from the saved setup if None) and
+    # put the lane file offsets back into reader, so vehicles read after the
+    # snapshot are read again. generators are the objects to carry on the
+    # saved generator events with, in the order they were first attached -
+    # without them those events are dropped. returns the engine
+    state, raw = read_checkpoint(path)
+    if engine is None:
+        engine = build_from_config(state["config"])
+
+    with engine.lock:
+        for spec in state["junctions"]:
+            if spec["name"] not in engine.junctions:
+                raise ValueError(f"checkpoint has junction {spec['name']} that this engine doesn't")
+        offset = 0
+        for spec in state["lanes"]:
+            j = engine.junctions[spec["junction"]]
+            q = j.queues.get(spec["lane"])
+            if q is None:
+                raise ValueError(f"checkpoint has lane {spec['junction']}/{spec['lane']} that this engine doesn't")
+            if q.size() > 0:
+                raise ValueError("restore needs empty queues")
+            offset = fill_lane(j, q, spec, raw, offset)
+
+        for spec in state["junctions"]:
+            j = engine.junctions[spec["name"]]
+            for key in ("serving", "light_pending", "serve_count", "vehicles_to_serve",
+                        "current_serving_lane", "green_since", "is_priority_mode", "total_served"):
+                setattr(j, key, spec[key])
+            j.lights.state, j.lights.current_lane = spec["light"]
+            for lane, priority in spec["priorities"].items():
+                j.lane_q.update_priority(lane, priority)
+            j.rejected = dict(spec["rejected"])
+            j.spilled = dict(spec["spilled"])
+            j.served.update(spec.get("served", {}))  # older checkpoints don't have it
+
+        engine.clock = state["clock"]
+        for key, value in state["counters"].items():
+            setattr(engine, key, value)
+
+        # the heap starts over from what was pending
+        chains = {}
+        engine.events = []
+        for t, seq, kind, ref in state["events"]:
+            if kind == ARRIVAL:
+                vid, lane, junction, generated_at = ref
+                data = Vehicle(vid, lane, junction)
+                data.generated_at = generated_at
+            elif kind == GENERATE:
+                index, interval, junction = ref
+                if generators is None or index >= len(generators):
+                    continue
+                g = generators[index]
+                if index not in chains:
+                    set_generator_state(g, state["generators"][index])
+                    chains[index] = g
+                data = (g, interval, junction)
+            elif kind in (LIGHT, DEPART, FREE, FEED):
+                data = engine.junctions[ref]
+            engine.events.append((t, seq, kind, data))
+        engine.events.sort(key=lambda ev: (ev[0], ev[1]))  # sorted is a valid heap
+        engine.seq = state["seq"]
+
+    if reader is not None and state["reader"] is not None and hasattr(reader, "state"):
+        reader.state = state["reader"]["files"]
+        reader.rotated = state["reader"]["rotated"]
+        reader.adopt_rotated()
+        reader.save_offsets()
+    return engine
+
+# snapshots a LiveSimulation every interval seconds on its own thread, and
+# once more on close()
+class Checkpointer:
+    def __init__(self, live, path, interval=30.0):
+        self.live = live
+        self.path = path
+        self.interval = interval
+        self.saves = 0
+        self.last_took = None  # seconds the last save took
+        self.failures = 0
+        # rotated lane files stay until a checkpoint is past them, or a crash
+        # between a rotation and the next save would lose their tail
+        if hasattr(live.reader, "keep_rotated"):
+            live.reader.keep_rotated = True
+        self.running = True
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def loop(self):
+        while self.running:
+            self.wake.wait(self.interval)
+            if self.running:
+                try:
+                    self.save()
+                except Exception as e:
+                    # disk full and the like - the next interval tries again
+                    self.failures += 1
+                    print(f"Checkpoint to {self.path} failed: {type(e).__name__}: {e}")
+
+    def save(self):
+        start = time.perf_counter()
+        live = self.live
+        reader = live.reader
+
+        def take():
+            # on the engine's own thread, between an ingest pass and the next
+            # one, so the offsets match the vehicles the engine has got
+            return list(getattr(reader, "held", ())), snapshot(live.engine, reader)
+        held, (state, blobs) = live.call(take)
+        write_checkpoint(self.path, state, blobs)
+        if held:
+            with live.load_lock:
+                reader.release_rotated(held)
+        self.last_took = time.perf_counter() - start
+        self.saves += 1
+
+    def close(self):
+        self.running = False
+        self.wake.set()
+        self.thread.join()
+        self.save()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect a checkpoint, or time save/restore of a big one")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("info", help="what a checkpoint holds")
+    p.add_argument("path")
+    p = sub.add_parser("bench", help="save and restore an engine with this many queued vehicles")
+    p.add_argument("-n", type=int, default=1000000)
+    p.add_argument("--compact", action="store_true", help="use compact lane queues")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        state, raw = read_checkpoint(args.path)
+        print(f"saved at:    {time.ctime(state['saved_at'])}")
+        print(f"engine time: {state['clock']:.1f}s")
+        print(f"junctions:   {len(state['junctions'])}")
+        print(f"queued:      {sum(lane['count'] for lane in state['lanes'])}")
+        print(f"events:      {len(state['events'])}")
+        print(f"served:      {state['counters']['total_served']}")
+        print(f"offsets:     {'yes' if state['reader'] else 'no'}")
+    else:
+        import tempfile
+        from engine import Junction, JunctionEngine
+        engine = JunctionEngine([Junction(compact=args.compact)])
+        lanes = list(engine.junction.queues)
+        with engine.lock:
+            for i in range(args.n):
+                engine.enqueue(Vehicle(f"V{i}", lanes[i % len(lanes)]))
+        path = os.path.join(tempfile.mkdtemp(), "bench.ckpt")
+        start = time.perf_counter()
+        save_checkpoint(engine, path)
+        saved = time.perf_counter() - start
+        start = time.perf_counter()
+        restored = restore_checkpoint(path)
+        loaded = time.perf_counter() - start
+        size = os.path.getsize(path)
+        os.remove(path)
+        print(f"{args.n:,} queued vehicles ({'compact' if args.compact else 'plain'} lanes): "
+              f"{size / 1e6:.1f}MB, save {saved * 1000:.0f}ms, restore {loaded * 1000:.0f}ms, "
+              f"{restored.queued():,} back")
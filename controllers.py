@@ -0,0 +1,78 @@
+from engine import STRAIGHT, PriorityController
+
+# signal controllers for Junction(controller=...)
+#
+# a controller has next_lane(engine, j) -> lane or None, keep_green(engine, j),
+# headway(engine, j) and config(). the engine spends one headway finding out a
+# lane is done before it switches, so every switch costs a slot - controllers
+# that switch less often serve more vehicles
+
+# max-pressure with minimum and maximum green times
+#
+# pressure of a lane 2 = its queue minus the queue it feeds at the next
+# junction (just its queue if it leads out of the network). the highest
+# pressure lane goes green and keeps it for at least min_green seconds, then
+# until it empties, another lane's pressure gets switch_ratio times bigger,
+# or max_green runs out. switching on every small lead throws away a slot
+# per switch, which costs more than it saves
+class MaxPressureController:
+    name = "max-pressure"
+
+    def __init__(self, min_green=10.0, max_green=90.0, switch_ratio=4.0):
+        self.min_green = min_green
+        self.max_green = max_green
+        self.switch_ratio = switch_ratio
+
+    def pressure(self, engine, j, lane):
+        p = j.queues[lane].size()
+        link = j.exits.get(STRAIGHT.get(lane[:-2]))
+        if link is not None:
+            downstream = engine.junctions.get(link[0])
+            if downstream is not None:
+                q = downstream.queues.get(f"{link[1]}L1")
+                if q is not None:
+                    p -= q.size()
+        return p
+
+    def next_lane(self, engine, j):
+        best = None
+        best_pressure = None
+        for lane in j.light_lanes:
+            if j.queues[lane].size() == 0:
+                continue
+            p = self.pressure(engine, j, lane)
+            if best is None or p > best_pressure:
+                best, best_pressure = lane, p
+        return best
+
+    def keep_green(self, engine, j):
+        green = engine.clock - j.green_since
+        if green < self.min_green:
+            return True
+        if green >= self.max_green:
+            return False
+        lane = j.current_serving_lane
+        limit = self.switch_ratio * max(self.pressure(engine, j, lane), 1)
+        return all(self.pressure(engine, j, other) <= limit for other in j.light_lanes if other != lane)
+
+    def headway(self, engine, j):
+        return engine.serve_interval
+
+    def config(self):
+        return {"name": self.name, "min_green": self.min_green, "max_green": self.max_green,
+                "switch_ratio": self.switch_ratio}
+
+CONTROLLERS = {
+    PriorityController.name: PriorityController,
+    MaxPressureController.name: MaxPressureController,
+}
+
+def make_controller(spec):
+    # spec is a name or a config() dict
+    if isinstance(spec, str):
+        spec = {"name": spec}
+    params = dict(spec)
+    name = params.pop("name")
+    if name not in CONTROLLERS:
+        raise ValueError(f"unknown controller {name!r} (have: {', '.join(CONTROLLERS)})")
+    return CONTROLLERS[name](**params)
@@ -0,0 +1,211 @@
+import bisect
+import math
+import random
+from network import load_config
+from records import LANE_CODES, LANES, RECORD
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # pure Python draws instead, same model but much slower
+
+# stochastic demand for the generator - Poisson arrivals per lane whose rate
+# follows a time-of-day curve, drawn for every lane at once each tick
+#
+# profile file (JSON, or YAML if PyYAML is installed):
+# {
+#   "rates": {"L1": 24, "L2": 30, "L3": 24, "AL2": 39},   # vehicles per minute
+#   "curve": "rush-hour",            # or [[hour, multiplier], ...], flat if left out
+#   "start": 6                       # hour of day the scenario starts at
+# }
+# a rate keyed by lane name beats one keyed by lane number ("L2" = every L2).
+# the curve is linear between points and wraps at midnight
+
+# the old hardcoded generator on average - 1-3 per L1/L3 and 1-4 per L2 every
+# 5s, AL2 bursting to 4-7 35% of the time
+DEFAULT_RATES = {"L1": 24.0, "L2": 30.0, "L3": 24.0, "AL2": 38.7}
+
+RUSH_HOUR = [
+    [0, 0.2], [5, 0.3], [7, 1.0], [8, 1.8], [9.5, 1.1], [12, 1.0],
+    [16, 1.3], [17.5, 1.9], [19, 1.0], [22, 0.5], [24, 0.2],
+]
+CURVES = {"flat": [[0, 1.0], [24, 1.0]], "rush-hour": RUSH_HOUR}
+
+# one binary lane record (records.RECORD) as a numpy dtype, so a whole batch
+# is written with one tobytes()
+if numpy is not None:
+    RECORD_DTYPE = numpy.dtype([('num', '<u8'), ('lane', 'u1'), ('time', '<f8')])
+
+LANE_NUMBERS = ["L1", "L2", "L3"]
+
+def check_lanes(rates=None, lanes=None):
+    # rates are keyed by a lane of records.LANES or a lane number, lanes
+    # come from records.LANES - anything else has no lane file to go to
+    for key in rates or {}:
+        if key not in LANE_CODES and key not in LANE_NUMBERS:
+            raise ValueError(f"demand rate for unknown lane {key!r} (have: {', '.join(LANES + LANE_NUMBERS)})")
+    for lane in lanes or []:
+        if lane not in LANE_CODES:
+            raise ValueError(f"unknown demand lane {lane!r} (have: {', '.join(LANES)})")
+
+def load_profile(path):
+    profile = load_config(path, "profiles")
+    check_lanes(profile.get("rates"), profile.get("lanes"))
+    return profile
+
+def lane_rate(rates, lane):
+    if lane in rates:
+        return rates[lane]
+    return rates.get(lane[-2:], 0.0)
+
+def poisson(rng, lam):
+    # Knuth's method for small means, a rounded normal for big ones
+    if lam <= 0:
+        return 0
+    if lam >= 30:
+        return max(0, int(round(rng.gauss(lam, math.sqrt(lam)))))
+    limit = math.exp(-lam)
+    k = 0
+    p = rng.random()
+    while p > limit:
+        k += 1
+        p *= rng.random()
+    return k
+
+class DemandModel:
+    def __init__(self, rates=None, curve=None, start=0.0, cycle=5.0, lanes=None, seed=None, backend=None,
+                 scale=1.0):
+        self.lanes = list(lanes or LANES)
+        self.rates = dict(rates or DEFAULT_RATES)
+        check_lanes(self.rates, self.lanes)
+        # per-second rate of every lane at multiplier 1 (scale blows every
+        # rate up for big offline loads)
+        self.base = [lane_rate(self.rates, lane) * scale / 60.0 for lane in self.lanes]
+        if isinstance(curve, str):
+            if curve not in CURVES:
+                raise ValueError(f"unknown demand curve {curve!r} (have: {', '.join(CURVES)})")
+            curve = CURVES[curve]
+        self.curve = sorted((float(h), float(m)) for h, m in (curve or CURVES["flat"]))
+        self.hours = [h for h, _ in self.curve]
+        self.start = start
+        self.cycle = cycle
+        self.t = 0.0        # scenario seconds drawn so far
+        self.next_id = 1    # vehicle numbers carry on across batches
+        self.backend = backend or ("numpy" if numpy is not None else "python")
+        if self.backend == "numpy":
+            if numpy is None:
+                raise RuntimeError("numpy is needed for the numpy backend (pip install numpy)")
+            self.rng = numpy.random.default_rng(seed)
+            self.base_array = numpy.array(self.base)
+        else:
+            self.rng = random.Random(seed)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        profile = load_profile(path)
+        for key in ("rates", "curve", "start", "lanes"):
+            if key in profile:
+                kwargs.setdefault(key, profile[key])
+        return cls(**kwargs)
+
+    def multiplier(self, t):
+        # curve value t scenario seconds in
+        hour = (self.start + t / 3600.0) % 24
+        i = bisect.bisect_right(self.hours, hour)
+        if i == 0:
+            return self.curve[0][1]
+        if i == len(self.curve):
+            return self.curve[-1][1]
+        (h0, m0), (h1, m1) = self.curve[i - 1], self.curve[i]
+        return m0 + (m1 - m0) * (hour - h0) / (h1 - h0)
+
+    def means(self, ticks):
+        # expected vehicles per lane for each of the next ticks, taking the
+        # curve at the middle of the tick
+        mids = [self.t + (k + 0.5) * self.cycle for k in range(ticks)]
+        if self.backend == "numpy":
+            hours = (self.start + numpy.array(mids) / 3600.0) % 24
+            mult = numpy.interp(hours, self.hours, [m for _, m in self.curve])
+            return mult[:, None] * self.base_array[None, :] * self.cycle
+        return [[self.multiplier(t) * rate * self.cycle for rate in self.base] for t in mids]
+
+    def counts(self, ticks=1):
+        # vehicles per lane for the next ticks - a ticks x lanes array
+        # (lists of lists without numpy)
+        means = self.means(ticks)
+        self.t += ticks * self.cycle
+        if self.backend == "numpy":
+            return self.rng.poisson(means)
+        return [[poisson(self.rng, lam) for lam in row] for row in means]
+
+    def next_counts(self):
+        # one tick as plain ints, for the live generator
+        return [int(n) for n in self.counts(1)[0]]
+
+    def arrivals(self, ticks):
+        # every arrival in the next ticks as binary lane records (see
+        # records.py), time = scenario seconds, spread evenly at random over
+        # its tick. within a tick records are grouped by lane
+        t0 = self.t
+        codes = [LANE_CODES[lane] for lane in self.lanes]
+        counts = self.counts(ticks)
+        if self.backend == "numpy":
+            flat = counts.ravel()
+            total = int(flat.sum())
+            out = numpy.empty(total, dtype=RECORD_DTYPE)
+            out['num'] = numpy.arange(self.next_id, self.next_id + total, dtype=numpy.uint64)
+            out['lane'] = numpy.repeat(numpy.tile(numpy.array(codes, dtype=numpy.uint8), ticks), flat)
+            tick_start = t0 + numpy.arange(ticks) * self.cycle
+            out['time'] = numpy.repeat(tick_start, counts.sum(axis=1)) + self.rng.random(total) * self.cycle
+            self.next_id += total
+            return out.tobytes(), total
+        buf = bytearray()
+        total = 0
+        for k, row in enumerate(counts):
+            tick_start = t0 + k * self.cycle
+            for code, n in zip(codes, row):
+                for _ in range(n):
+                    buf += RECORD.pack(self.next_id, code, tick_start + self.rng.random() * self.cycle)
+                    self.next_id += 1
+            total += sum(row)
+        return bytes(buf), total
+
+def write_scenario(model, path, hours, chunk_ticks=720):
+    # offline scenario straight to one binary record file, a chunk at a time
+    # so memory stays flat however long the scenario is
+    ticks = int(math.ceil(hours * 3600 / model.cycle))
+    total = 0
+    with open(path, 'wb') as f:
+        while ticks > 0:
+            n = min(chunk_ticks, ticks)
+            data, count = model.arrivals(n)
+            f.write(data)
+            total += count
+            ticks -= n
+    return total
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Draw an offline arrival scenario from a demand profile")
+    parser.add_argument("out", help="binary record file to write (read it with records.iter_records_mmap)")
+    parser.add_argument("--profile", default=None, help="JSON/YAML demand profile (default: the old generator's rates)")
+    parser.add_argument("--curve", choices=list(CURVES), default=None, help="override the profile's curve")
+    parser.add_argument("--hours", type=float, default=24.0, help="scenario length")
+    parser.add_argument("--cycle", type=float, default=5.0, help="seconds per tick")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every rate (for big offline loads)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--backend", choices=["numpy", "python"], default=None)
+    args = parser.parse_args()
+
+    kwargs = {"cycle": args.cycle, "seed": args.seed, "backend": args.backend, "scale": args.scale}
+    if args.curve:
+        kwargs["curve"] = args.curve
+    model = DemandModel.from_file(args.profile, **kwargs) if args.profile else DemandModel(**kwargs)
+
+    start = time.perf_counter()
+    total = write_scenario(model, args.out, args.hours)
+    elapsed = time.perf_counter() - start
+    print(f"{total:,} arrivals over {args.hours:g}h ({model.backend}) in {elapsed:.2f}s "
+          f"- {total / elapsed:,.0f} arrivals/s")
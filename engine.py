@@ -0,0 +1,782 @@
+import math
+import random
+import heapq
+import itertools
+from array import array
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+
+COLORS = ['red', 'blue', 'green', 'yellow', 'orange', 'purple']
+
+def vehicle_color(vid):
+    # picked from the id so the same vehicle looks the same in every run
+    # (and drawing one doesn't use up the global random stream)
+    return COLORS[zlib.crc32(vid.encode()) % len(COLORS)]
+
+def turns_left(vid, left_share):
+    # whether a vehicle on L1 heads for L3 (left) or L2 (straight) - also from
+    # the id, salted so it doesn't follow the colour, so replays stay exact
+    return zlib.crc32(vid.encode(), 0x5EED) % 1000 < left_share * 1000
+
+# vehicle class - slotted, a million queued vehicles shouldn't mean a
+# million attribute dicts
+class Vehicle:
+    __slots__ = ('id', 'lane', 'junction', 'wait_time', 'generated_at', 'enqueued_at', 'departed_at')
+
+    def __init__(self, vid, lane, junction=None):
+        self.id = vid
+        self.lane = lane
+        self.junction = junction  # junction name, None = the engine's first junction
+        self.wait_time = 0        # time spent in the last lane queue, set when it leaves
+        # timestamps on the engine clock
+        self.generated_at = None
+        self.enqueued_at = None
+        self.departed_at = None
+
+    @property
+    def color(self):
+        # worked out when drawn instead of stored
+        return vehicle_color(self.id)
+
+    def to_dict(self):
+        return {'id': self.id, 'lane': self.lane}
+
+# queue for vehicles
+class VehicleQueue:
+    def __init__(self, lane_name):
+        self.lane = lane_name
+        self.q = deque()
+        self.on_change = None  # set by LaneQueue so size changes reorder the heap
+        self.version = 0       # bumped on every change so readers can skip unchanged lanes
+
+    def add_vehicle(self, v):
+        self.q.append(v)
+        self.version += 1
+        if self.on_change is not None:
+            self.on_change(self.lane)
+
+    def remove_vehicle(self):
+        if len(self.q) > 0:
+            v = self.q.popleft()
+            self.version += 1
+            if self.on_change is not None:
+                self.on_change(self.lane)
+            return v
+        return None
+
+    def extend(self, vehicles):
+        # bulk add (e.g. restoring a checkpoint) - one change instead of one per vehicle
+        self.q.extend(vehicles)
+        self.version += 1
+        if self.on_change is not None:
+            self.on_change(self.lane)
+
+    def size(self):
+        return len(self.q)
+
+    def get_all(self):
+        return list(self.q)
+
+    def head(self, n):
+        # first n vehicles without copying the whole queue
+        return list(itertools.islice(self.q, n))
+
+# same interface as VehicleQueue, but the lane is kept as ring buffers of
+# plain numbers - vehicle number, enqueue time and generation time, 24 bytes a
+# vehicle - and Vehicle objects are only rebuilt when one leaves or is looked
+# at. needs "V<number>" ids, like the binary lane files
+NO_TIME = float('nan')
+
+class CompactVehicleQueue:
+    def __init__(self, lane_name, junction=None, size=64):
+        self.lane = lane_name
+        self.junction = junction  # name given back to vehicles that had one
+        self.on_change = None
+        self.version = 0
+        self.alloc(size)
+        self.start = 0
+        self.count = 0
+
+    def alloc(self, size):
+        self.mask = size - 1  # size is always a power of two
+        self.ids = array('q', bytes(8 * size))
+        self.enqueued = array('d', bytes(8 * size))
+        self.generated = array('d', bytes(8 * size))
+        self.named = bytearray(size)  # 1 if the vehicle carried the junction name
+
+    def resize(self, size):
+        # copy out in queue order into new buffers
+        order = [(self.start + k) & self.mask for k in range(self.count)]
+        ids, enqueued, generated, named = self.ids, self.enqueued, self.generated, self.named
+        self.alloc(size)
+        for k, i in enumerate(order):
+            self.ids[k] = ids[i]
+            self.enqueued[k] = enqueued[i]
+            self.generated[k] = generated[i]
+            self.named[k] = named[i]
+        self.start = 0
+
+    def changed(self):
+        self.version += 1
+        if self.on_change is not None:
+            self.on_change(self.lane)
+
+    def add_vehicle(self, v):
+        if self.count > self.mask:
+            self.resize(2 * (self.mask + 1))
+        i = (self.start + self.count) & self.mask
+        self.ids[i] = int(v.id[1:])
+        self.enqueued[i] = NO_TIME if v.enqueued_at is None else v.enqueued_at
+        self.generated[i] = NO_TIME if v.generated_at is None else v.generated_at
+        self.named[i] = v.junction is not None
+        self.count += 1
+        self.changed()
+
+    def vehicle(self, i):
+        v = Vehicle(f"V{self.ids[i]}", self.lane, self.junction if self.named[i] else None)
+        t = self.enqueued[i]
+        v.enqueued_at = None if t != t else t
+        t = self.generated[i]
+        v.generated_at = None if t != t else t
+        return v
+
+    def remove_vehicle(self):
+        if self.count == 0:
+            return None
+        v = self.vehicle(self.start)
+        self.start = (self.start + 1) & self.mask
+        self.count -= 1
+        # give memory back once a long queue has drained
+        if self.mask >= 256 and self.count < (self.mask + 1) // 4:
+            self.resize((self.mask + 1) // 2)
+        self.changed()
+        return v
+
+    def size(self):
+        return self.count
+
+    def export(self):
+        # (ids, enqueued, generated, named) in queue order, straight off the
+        # buffers - what a checkpoint stores
+        first = min(self.count, self.mask + 1 - self.start)
+        parts = []
+        for buf in (self.ids, self.enqueued, self.generated, self.named):
+            parts.append(buf[self.start:self.start + first] + buf[:self.count - first])
+        return tuple(parts)
+
+    def load(self, ids, enqueued, generated, named):
+        # replace the contents with exported buffers
+        size = 64
+        while size < len(ids):
+            size *= 2
+        self.alloc(size)
+        n = len(ids)
+        self.ids[:n] = ids
+        self.enqueued[:n] = enqueued
+        self.generated[:n] = generated
+        self.named[:n] = named
+        self.start = 0
+        self.count = n
+        self.changed()
+
+    def get_all(self):
+        return self.head(self.count)
+
+    def head(self, n):
+        return [self.vehicle((self.start + k) & self.mask) for k in range(min(n, self.count))]
+
+# priority queue for lanes - indexed binary max-heap on (priority, size)
+# pos maps lane name -> heap index so a priority or size change only
+# sifts that one lane, O(log n) instead of re-sorting every lane
+class LaneQueue:
+    def __init__(self):
+        self.lanes = []  # heap of [priority, lane_name, queue, order]
+        self.pos = {}
+
+    def key(self, lane_data):
+        # smaller key = served first, ties go to the lane added first
+        return (-lane_data[0], -lane_data[2].size(), lane_data[3])
+
+    def swap(self, i, j):
+        lanes = self.lanes
+        lanes[i], lanes[j] = lanes[j], lanes[i]
+        self.pos[lanes[i][1]] = i
+        self.pos[lanes[j][1]] = j
+
+    def sift_up(self, i):
+        while i > 0:
+            parent = (i - 1) // 2
+            if self.key(self.lanes[i]) < self.key(self.lanes[parent]):
+                self.swap(i, parent)
+                i = parent
+            else:
+                break
+        return i
+
+    def sift_down(self, i):
+        n = len(self.lanes)
+        while True:
+            best = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < n and self.key(self.lanes[child]) < self.key(self.lanes[best]):
+                    best = child
+            if best == i:
+                return i
+            self.swap(i, best)
+            i = best
+
+    def reposition(self, lane_name):
+        i = self.pos.get(lane_name)
+        if i is not None:
+            if self.sift_up(i) == i:
+                self.sift_down(i)
+
+    def add_lane(self, lane_name, q, priority=0):
+        self.lanes.append([priority, lane_name, q, len(self.pos)])
+        self.pos[lane_name] = len(self.lanes) - 1
+        self.sift_up(len(self.lanes) - 1)
+        q.on_change = self.reposition
+
+    def update_priority(self, lane_name, new_priority):
+        i = self.pos.get(lane_name)
+        if i is not None and self.lanes[i][0] != new_priority:
+            self.lanes[i][0] = new_priority
+            self.reposition(lane_name)
+
+    def get_next_lane(self):
+        # highest priority, then longest queue - just the top of the heap
+        if len(self.lanes) > 0:
+            return self.lanes[0]
+        return None
+
+# traffic light
+class TrafficLight:
+    def __init__(self):
+        self.state = 1  # 1=red, 2=green
+        self.current_lane = None
+
+    def set_green(self, lane):
+        self.state = 2
+        self.current_lane = lane
+
+    def set_red(self):
+        self.state = 1
+        self.current_lane = None
+
+# event types on the engine heap
+ARRIVAL = 0
+LIGHT = 1      # pick the next lane and turn its light green
+DEPART = 2     # serve one vehicle from the green lane
+FREE = 3       # L3 lanes turn left freely
+GENERATE = 4   # pull a cycle of vehicles from an attached generator
+FEED = 5       # L1 lanes move their front vehicle into L2 or L3
+
+# roads are A (top), B (left), C (bottom), D (right)
+ROADS = ["A", "B", "C", "D"]
+# which road a vehicle leaves by - L2 goes straight on, L3 turns left
+STRAIGHT = {"A": "C", "B": "D", "C": "A", "D": "B"}
+LEFT = {"A": "D", "B": "A", "C": "B", "D": "C"}
+# how the lane average is rounded when picking how many to serve
+AVG_RULES = ["floor", "ceil", "round"]
+
+# signal controller - the engine asks it which lane gets the green light,
+# whether to keep it after every departure, and how far apart departures are
+#
+# this one is the original policy: the longest lane 2 goes green for the
+# average lane 2 length, and once AL2 has more than priority_on vehicles it
+# goes first and is served down to priority_keep (see controllers.py for others)
+class PriorityController:
+    name = "priority"
+
+    def next_lane(self, engine, j):
+        # lane name to turn green, or None to stay red
+        j.check_priority_condition()
+        top = j.lane_q.get_next_lane()
+        if top is None or top[2].size() == 0:
+            return None
+        priority, lane_name, q = top[0], top[1], top[2]
+        if lane_name == j.priority_lane and priority > 0:
+            j.vehicles_to_serve = max(0, q.size() - j.priority_keep)
+        else:
+            j.vehicles_to_serve = j.calc_vehicles_to_serve()
+        return lane_name
+
+    def keep_green(self, engine, j):
+        # called before each departure while the lane still has vehicles
+        return j.serve_count < j.vehicles_to_serve
+
+    def headway(self, engine, j):
+        # seconds until the next vehicle through the light
+        return engine.serve_interval
+
+    def config(self):
+        return {"name": self.name}
+
+# one junction - its lane queues live in a registry keyed by lane name
+# ("AL1".."DL3") so junctions can have any set of roads
+class Junction:
+    def __init__(self, name="J", roads=None, priority_lane="AL2",
+                 priority_on=10, priority_off=5, priority_keep=4, avg_rule="floor", controller=None,
+                 capacity=None, overflow="reject", left_share=0.3, compact=False):
+        self.name = name
+        self.roads = list(roads or ROADS)
+
+        # signal policy knobs (defaults are the original rules)
+        self.priority_on = priority_on      # priority mode when the priority lane has more than this
+        self.priority_off = priority_off    # ...and back to normal below this
+        self.priority_keep = priority_keep  # priority mode serves all but this many
+        if avg_rule not in AVG_RULES:
+            raise ValueError(f"unknown avg_rule: {avg_rule}")
+        self.avg_rule = avg_rule            # how the lane average is rounded: floor, ceil or round
+
+        # 3 lanes per road: L1 incoming, L2 needs the light, L3 free left turn
+        # (compact=True keeps them as number buffers, see CompactVehicleQueue)
+        self.compact = compact
+        self.queues = {}
+        for road in self.roads:
+            for n in (1, 2, 3):
+                lane = f"{road}L{n}"
+                self.queues[lane] = CompactVehicleQueue(lane, name) if compact else VehicleQueue(lane)
+        self.incoming_lanes = [f"{road}L1" for road in self.roads]
+        self.light_lanes = [f"{road}L2" for road in self.roads]
+        self.free_lanes = [f"{road}L3" for road in self.roads]
+        self.left_share = left_share  # share of L1 vehicles that move to L3 to turn left
+
+        # lane capacity - None (unbounded), a number for every lane, or a dict
+        # of lane -> number. a vehicle arriving at a full lane is rejected, or
+        # with overflow="spill" goes to another lane of the same road with room
+        if overflow not in ("reject", "spill"):
+            raise ValueError(f"unknown overflow policy: {overflow}")
+        self.capacity = capacity
+        self.overflow = overflow
+        self.rejected = {}  # lane -> vehicles turned away
+        self.spilled = {}   # lane -> vehicles sent to another lane
+        if priority_lane not in self.queues:
+            priority_lane = None
+        self.priority_lane = priority_lane
+
+        # lane priority queue - only for lane 2s that need traffic lights
+        self.lane_q = LaneQueue()
+        for lane in self.light_lanes:
+            self.lane_q.add_lane(lane, self.queues[lane], priority=0)
+
+        self.lights = TrafficLight()
+        self.controller = controller or PriorityController()
+
+        # exit road -> (downstream junction, road it enters on, travel time)
+        # roads without a link lead out of the network
+        self.exits = {}
+
+        self.serving = False
+        self.light_pending = False
+        self.serve_count = 0
+        self.vehicles_to_serve = 0
+        self.current_serving_lane = None  # lane name while a light is green
+        self.green_since = 0.0
+
+        self.is_priority_mode = False
+        self.total_served = 0
+        # lane -> vehicles served through the light or the free left turn
+        self.served = {lane: 0 for lane in self.light_lanes + self.free_lanes}
+
+    def lane_capacity(self, lane):
+        if isinstance(self.capacity, dict):
+            return self.capacity.get(lane)
+        return self.capacity
+
+    def full(self, lane):
+        cap = self.lane_capacity(lane)
+        return cap is not None and self.queues[lane].size() >= cap
+
+    def spill_lane(self, lane):
+        # first other lane on the same road with room
+        road = lane[:-2]
+        for n in (1, 2, 3):
+            other = f"{road}L{n}"
+            if other != lane and not self.full(other):
+                return other
+        return None
+
+    def link(self, road, to_junction, to_road, travel_time=0.0):
+        self.exits[road] = (to_junction, to_road, travel_time)
+
+    def calc_vehicles_to_serve(self):
+        # calculate average based on normal lanes (excluding the priority lane if it's long)
+        normal_lanes = []
+
+        for lane in self.light_lanes:
+            size = self.queues[lane].size()
+            if lane == self.priority_lane and size > self.priority_off:
+                continue
+            normal_lanes.append(size)
+
+        if len(normal_lanes) > 0:
+            avg = sum(normal_lanes) / len(normal_lanes)
+            if self.avg_rule == "ceil":
+                avg = math.ceil(avg)
+            elif self.avg_rule == "round":
+                avg = round(avg)
+            return max(1, int(avg))
+        return 1
+
+    def check_priority_condition(self):
+        if self.priority_lane is None:
+            return False
+        size = self.queues[self.priority_lane].size()
+        if size > self.priority_on:
+            self.lane_q.update_priority(self.priority_lane, 100)
+            self.is_priority_mode = True
+            return True
+        elif size < self.priority_off:
+            self.lane_q.update_priority(self.priority_lane, 0)
+            self.is_priority_mode = False
+            return False
+        return self.is_priority_mode
+
+    def queued(self):
+        return sum(q.size() for q in self.queues.values())
+
+# junction logic driven by a virtual clock and an event heap
+# no tkinter and no sleeping - call run_until() to advance time
+# one engine runs any number of linked junctions on a shared clock
+#
+# threading: only the thread calling run_until() ever changes queue state or
+# the counters (single writer). other threads hand arrivals over through
+# arrive()/arrive_many(), which go into a thread-safe inbox, and readers
+# like the tkinter view hold engine.lock while they look at the queues
+class JunctionEngine:
+    def __init__(self, junctions=None, serve_interval=1.5, free_interval=2.0, feed_interval=1.0):
+        # timing stuff (seconds of junction time)
+        self.serve_interval = serve_interval
+        self.free_interval = free_interval
+        self.feed_interval = feed_interval  # None = L1 lanes are never served
+        self.clock = 0.0
+        self.events = []
+        self.seq = 0
+        self.inbox = queue.SimpleQueue()  # batches of (time, vehicle) from other threads
+        self.lock = threading.RLock()     # held while events are processed
+
+        self.junctions = {}
+        self.junction = None  # the first junction - what the tkinter view shows
+        self.total_served = 0  # vehicles through any junction's light or free lane
+        self.exited = 0        # vehicles that left the network
+        self.arrived = 0       # vehicles handed to the engine from outside
+        self.dropped = 0       # arrivals for a junction/lane that doesn't exist
+        self.rejected = 0      # arrivals turned away from a full lane
+        # set to a list when this engine only runs part of a network (see
+        # parallel.py) - vehicles heading to a junction it doesn't own are
+        # collected here as (arrival time, vehicle) instead of scheduled
+        self.outbox = None
+        # set by tracing.TraceRecorder - gets every vehicle that enters from outside
+        self.recorder = None
+        # called from arrive()/arrive_many() on whatever thread handed the
+        # vehicles over, so a driver sleeping until the next event can wake up
+        self.waker = None
+
+        # callbacks fn(engine, kind, data) - e.g. the tkinter view or a logger
+        self.observers = []
+
+        for j in junctions or [Junction()]:
+            self.add_junction(j)
+
+    # single junction shortcuts
+    @property
+    def queues(self):
+        return self.junction.queues
+
+    @property
+    def lights(self):
+        return self.junction.lights
+
+    @property
+    def is_priority_mode(self):
+        return self.junction.is_priority_mode
+
+    def add_junction(self, j):
+        self.junctions[j.name] = j
+        if self.junction is None:
+            self.junction = j
+        self.schedule(self.clock + self.free_interval, FREE, j)
+        if self.feed_interval is not None:
+            self.schedule(self.clock + self.feed_interval, FEED, j)
+
+    def add_observer(self, fn):
+        self.observers.append(fn)
+
+    def notify(self, kind, data=None):
+        for fn in self.observers:
+            fn(self, kind, data)
+
+    def schedule(self, t, kind, data=None):
+        # seq keeps the heap stable for events at the same time
+        self.seq += 1
+        heapq.heappush(self.events, (t, self.seq, kind, data))
+
+    def next_event_time(self):
+        if len(self.events) > 0:
+            return self.events[0][0]
+        return None
+
+    def arrive(self, v, t=None):
+        # queue an arrival - defaults to the current clock, safe from any thread
+        self.inbox.put([(t, v)])
+        if self.waker is not None:
+            self.waker()
+
+    def arrive_many(self, vehicles):
+        # a whole batch lands together, so a light decision never sees half of it
+        self.inbox.put([(None, v) for v in vehicles])
+        if self.waker is not None:
+            self.waker()
+
+    def drain_inbox(self):
+        while True:
+            try:
+                batch = self.inbox.get_nowait()
+            except queue.Empty:
+                return
+            self.arrived += len(batch)
+            for t, v in batch:
+                if t is None or t < self.clock:
+                    t = self.clock
+                if self.recorder is not None:
+                    self.recorder.input(self.clock, t, v)
+                self.schedule(t, ARRIVAL, v)
+
+    def attach_generator(self, generator, interval=5.0, junction=None):
+        # generator must have generate_cycle() -> [(fname, {'id', 'lane'}), ...]
+        data = (generator, interval, junction)
+        if self.recorder is not None:
+            self.recorder.attach(self.clock, data)
+        self.schedule(self.clock, GENERATE, data)
+
+    def run_until(self, t, limit=None):
+        # process every event up to time t then park the clock there. with a
+        # limit, stop after that many events instead (the clock stays at the
+        # last one) and return False, so the caller can let go of the lock
+        with self.lock:
+            self.drain_inbox()
+            n = 0
+            while len(self.events) > 0 and self.events[0][0] <= t:
+                if limit is not None and n >= limit:
+                    return False
+                ev_time, _, kind, data = heapq.heappop(self.events)
+                self.clock = ev_time
+                self.handle(kind, data)
+                n += 1
+            if t > self.clock:
+                self.clock = t
+            return True
+
+    def run(self, duration):
+        self.run_until(self.clock + duration)
+
+    def handle(self, kind, data):
+        if kind == ARRIVAL:
+            self.enqueue(data)
+        elif kind == LIGHT:
+            data.light_pending = False
+            self.start_serving(data)
+        elif kind == DEPART:
+            self.serve_one(data)
+        elif kind == FREE:
+            self.serve_free_lanes(data)
+            self.schedule(self.clock + self.free_interval, FREE, data)
+        elif kind == GENERATE:
+            generator, interval, junction = data
+            for _, v_data in generator.generate_cycle():
+                self.arrived += 1
+                v = Vehicle(v_data['id'], v_data['lane'], junction)
+                v.generated_at = self.clock
+                if self.recorder is not None:
+                    self.recorder.generated(self.clock, data, v)
+                self.enqueue(v)
+            self.schedule(self.clock + interval, GENERATE, data)
+        elif kind == FEED:
+            self.feed_lanes(data)
+            self.schedule(self.clock + self.feed_interval, FEED, data)
+
+    def enqueue(self, v):
+        j = self.junctions.get(v.junction) if v.junction is not None else self.junction
+        if j is None:
+            self.dropped += 1
+            return
+        if v.lane not in j.queues:
+            self.dropped += 1
+            return
+        if j.full(v.lane):
+            lane = j.spill_lane(v.lane) if j.overflow == "spill" else None
+            if lane is None:
+                j.rejected[v.lane] = j.rejected.get(v.lane, 0) + 1
+                self.rejected += 1
+                return
+            j.spilled[v.lane] = j.spilled.get(v.lane, 0) + 1
+            v.lane = lane
+        self.join_lane(j, v)
+
+    def join_lane(self, j, v):
+        v.enqueued_at = self.clock
+        j.queues[v.lane].add_vehicle(v)
+        self.notify(ARRIVAL, v)
+        # an idle junction picks a lane once the current batch of arrivals is in
+        if not j.serving and not j.light_pending and 'L2' in v.lane:
+            j.light_pending = True
+            self.schedule(self.clock, LIGHT, j)
+
+    def stamp_departure(self, v):
+        v.departed_at = self.clock
+        v.wait_time = self.clock - v.enqueued_at
+
+    def route(self, j, v):
+        # served vehicles join the next junction's incoming lane or leave the network
+        road = v.lane[:-2]
+        out = (STRAIGHT if 'L2' in v.lane else LEFT).get(road)  # None for roads beyond A-D
+        link = j.exits.get(out)
+        if link is None:
+            self.exited += 1
+            return
+        to_junction, to_road, travel_time = link
+        v.junction = to_junction
+        v.lane = f"{to_road}L1"
+        if self.outbox is not None and to_junction not in self.junctions:
+            self.outbox.append((self.clock + travel_time, v))
+            return
+        self.schedule(self.clock + travel_time, ARRIVAL, v)
+
+    def start_serving(self, j):
+        if j.serving:
+            return
+
+        # the junction's controller picks the lane
+        lane_name = j.controller.next_lane(self, j)
+        if lane_name is None:
+            return
+
+        # set green light
+        j.lights.set_green(lane_name)
+        j.current_serving_lane = lane_name
+        j.green_since = self.clock
+        j.serve_count = 0
+        j.serving = True
+        self.notify(LIGHT, (j.name, lane_name))
+        self.schedule(self.clock + j.controller.headway(self, j), DEPART, j)
+
+    def serve_one(self, j):
+        q = j.queues[j.current_serving_lane]
+        if q.size() > 0 and j.controller.keep_green(self, j):
+            v = q.remove_vehicle()
+            self.stamp_departure(v)
+            j.serve_count += 1
+            j.served[j.current_serving_lane] += 1
+            j.total_served += 1
+            self.total_served += 1
+            self.notify(DEPART, v)
+            self.route(j, v)
+            self.schedule(self.clock + j.controller.headway(self, j), DEPART, j)
+        else:
+            # done with this lane - back to red and pick again
+            j.serving = False
+            j.lights.set_red()
+            j.current_serving_lane = None
+            self.notify(LIGHT, (j.name, None))
+            self.start_serving(j)
+
+    def feed_lanes(self, j):
+        # each L1 moves its front vehicle up into L2 (straight on) or L3
+        # (left turn) - if that lane is full it waits in L1
+        for lane in j.incoming_lanes:
+            q = j.queues[lane]
+            if q.size() == 0:
+                continue
+            v = q.head(1)[0]
+            target = f"{lane[:-2]}L3" if turns_left(v.id, j.left_share) else f"{lane[:-2]}L2"
+            if j.full(target):
+                continue
+            q.remove_vehicle()
+            self.stamp_departure(v)
+            self.notify(FEED, v)
+            v.lane = target
+            self.join_lane(j, v)
+
+    def serve_free_lanes(self, j):
+        # AL3, BL3, CL3, DL3 can turn left freely without waiting
+        for lane in j.free_lanes:
+            v = j.queues[lane].remove_vehicle()
+            if v:
+                self.stamp_departure(v)
+                j.served[lane] += 1
+                j.total_served += 1
+                self.total_served += 1
+                self.notify(FREE, v)
+                self.route(j, v)
+
+    def queued(self):
+        return sum(j.queued() for j in self.junctions.values())
+
+if __name__ == "__main__":
+    import argparse
+    from controllers import CONTROLLERS, make_controller
+    from metrics import MetricsCollector
+    from traffic_generator import VehicleGenerator
+    from tracing import TraceRecorder
+
+    parser = argparse.ArgumentParser(description="Run the junction headless on a virtual clock")
+    parser.add_argument("--duration", type=float, default=3600, help="junction seconds to simulate")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--metrics", default=None, help="write per-lane wait percentiles to .json or .csv")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between generator cycles (higher = lighter traffic)")
+    parser.add_argument("--trace", default=None, help="record the run to this file (replay with tracing.py)")
+    parser.add_argument("--controller", choices=list(CONTROLLERS), default="priority", help="signal controller")
+    parser.add_argument("--capacity", type=int, default=None, help="vehicles per lane before arrivals overflow")
+    parser.add_argument("--overflow", choices=["reject", "spill"], default="reject",
+                        help="turn overflow away or move it to another lane of the road")
+    parser.add_argument("--compact", action="store_true", help="keep lane queues as number buffers")
+    parser.add_argument("--demand", default=None, help="JSON/YAML demand profile (Poisson arrivals, see demand.py)")
+    parser.add_argument("--history", default=None, help="sample every second and write the history to .json or .csv")
+    parser.add_argument("--history-step", type=int, choices=[1, 60, 3600], default=1, help="bucket seconds for a .csv history")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    engine = JunctionEngine([Junction(controller=make_controller(args.controller),
+                                      capacity=args.capacity, overflow=args.overflow,
+                                      compact=args.compact)])
+    metrics = MetricsCollector()
+    engine.add_observer(metrics)
+    recorder = TraceRecorder(engine, args.trace) if args.trace else None
+    demand = None
+    if args.demand:
+        from demand import DemandModel
+        demand = DemandModel.from_file(args.demand, cycle=args.interval, seed=args.seed)
+    engine.attach_generator(VehicleGenerator(make_files=False, seed=args.seed, demand=demand), args.interval)
+
+    history = None
+    if args.history:
+        from history import HistoryStore
+        history = HistoryStore(engine)
+
+    start = time.perf_counter()
+    if history is not None:
+        history.advance(engine.clock + args.duration)
+    else:
+        engine.run(args.duration)
+    elapsed = time.perf_counter() - start
+
+    print(f"Simulated {args.duration:.0f}s of junction time in {elapsed * 1000:.1f}ms")
+    print(f"Total served: {engine.total_served}, still queued: {engine.queued()}")
+    if args.capacity is not None:
+        j = engine.junction
+        print(f"Rejected: {engine.rejected}, spilled: {sum(j.spilled.values())}, "
+              f"longest lane: {max(q.size() for q in j.queues.values())}")
+    print(f"Priority mode: {engine.is_priority_mode}\n")
+    metrics.print_table()
+    if args.metrics:
+        metrics.write(args.metrics)
+    if recorder is not None:
+        recorder.close()
+    if history is not None:
+        history.write(args.history, args.history_step)
@@ -0,0 +1,307 @@
+import json
+import os
+import select
+import struct
+import time
+from records import FORMATS, data_file, decode
+
+# tail-following reader for the lane files
+# - remembers a byte offset per file (saved to disk) so every read is O(new bytes)
+# - never truncates: big files are rotated (renamed) and drained, so nothing a
+#   writer appends while we read is lost
+# - wakes up on inotify on linux, otherwise polls the file sizes
+# - reads JSON lines (lanea.txt) or fixed-width binary records (lanea.bin)
+
+LANE_FILES = ["lanea.txt", "laneb.txt", "lanec.txt", "laned.txt"]
+
+# inotify flags (linux/inotify.h)
+IN_MODIFY = 0x2
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_NONBLOCK = 0o4000
+# struct inotify_event: wd, mask, cookie, len, then len bytes of name
+EVENT = struct.Struct('iIII')
+
+# watches a directory, but only changes to names (None = any file) count -
+# our own offsets and checkpoint writes there shouldn't wake the reader
+class Inotify:
+    def __init__(self, path, names=None):
+        self.names = set(names) if names is not None else None
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # every append is an IN_MODIFY - a close after it would only wake us
+        # a second time for the same bytes
+        mask = IN_MODIFY | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def changed(self):
+        # read every queued event - true if one was about a watched name
+        names = set()
+        try:
+            while True:
+                data = os.read(self.fd, 4096)
+                if not data:
+                    break
+                pos = 0
+                while pos + EVENT.size <= len(data):
+                    length = EVENT.unpack_from(data, pos)[3]
+                    names.add(os.fsdecode(data[pos + EVENT.size:pos + EVENT.size + length].rstrip(b'\0')))
+                    pos += EVENT.size + length
+        except BlockingIOError:
+            pass
+        return len(names) > 0 and (self.names is None or len(names & self.names) > 0)
+
+    def wait(self, timeout):
+        end = time.time() + timeout
+        while True:
+            ready, _, _ = select.select([self.fd], [], [], max(0, end - time.time()))
+            if not ready:
+                return False
+            if self.changed():
+                return True
+
+    def drain(self):
+        return self.changed()
+
+    def close(self):
+        os.close(self.fd)
+
+class LaneFileReader:
+    def __init__(self, files=None, directory=".", offsets_file=None,
+                 compact_bytes=1 << 20, rotate_grace=1.0, poll_interval=0.05, fmt="json"):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown lane file format: {fmt}")
+        self.fmt = fmt
+        self.directory = directory
+        self.files = [data_file(f, fmt) for f in (files or LANE_FILES)]
+        if offsets_file is None:
+            offsets_file = ".ingest_offsets.json" if fmt == "json" else f".ingest_offsets.{fmt}.json"
+        self.offsets_path = os.path.join(directory, offsets_file)
+        self.compact_bytes = compact_bytes  # rotate once a file is this big and fully read
+        self.rotate_grace = rotate_grace    # how long to keep draining a rotated file
+        self.poll_interval = poll_interval
+
+        # fname -> {'offset': int, 'inode': int}
+        self.state = {}
+        # fname -> [old path, offset, time it was rotated]
+        self.rotated = {}
+        # with keep_rotated set (a checkpoint is being kept) drained rotated
+        # files wait in held (fname -> old path) until release_rotated() says
+        # a checkpoint past them has been written
+        self.keep_rotated = False
+        self.held = {}
+        self.load_offsets()
+
+        self.watcher = None
+        try:
+            self.watcher = Inotify(directory, self.files)
+        except (OSError, AttributeError):
+            self.watcher = None  # not linux - fall back to polling
+
+    def path(self, fname):
+        return os.path.join(self.directory, fname)
+
+    def load_offsets(self):
+        try:
+            with open(self.offsets_path, 'r') as f:
+                saved = json.load(f)
+            self.state = saved['files']
+            self.rotated = saved['rotated']
+        except (OSError, ValueError, KeyError):
+            self.state = {}
+            self.rotated = {}
+        for fname in self.files:
+            self.state.setdefault(fname, {'offset': 0, 'inode': None})
+        self.adopt_rotated()
+    
+    def adopt_rotated(self):
+        # a file that was rotated after these offsets were saved (a crash
+        # before the next save, or a checkpoint from before the rotation) -
+        # if the old file is still there, finish it from the saved offset
+        for fname in self.files:
+            s = self.state[fname]
+            if fname in self.rotated or s['inode'] is None:
+                continue
+            old_path = self.path(fname) + ".old"
+            try:
+                st = os.stat(old_path)
+            except OSError:
+                continue
+            if st.st_ino == s['inode']:
+                self.rotated[fname] = [old_path, s['offset'], time.time()]
+                self.held.pop(fname, None)
+                s['offset'] = 0
+                s['inode'] = None
+
+    def save_offsets(self):
+        # write then rename so a crash never leaves half a file behind
+        tmp = self.offsets_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'files': self.state, 'rotated': self.rotated}, f)
+        os.replace(tmp, self.offsets_path)
+
+    def pending(self):
+        # true if any file has bytes we haven't read yet
+        for fname in self.files:
+            try:
+                st = os.stat(self.path(fname))
+            except OSError:
+                continue
+            s = self.state[fname]
+            if st.st_ino != s['inode'] or st.st_size != s['offset']:
+                return True
+        return False
+
+    backlog_unit = "bytes"
+
+    def backlog(self):
+        # bytes in the lane files that haven't been read yet - safe to call
+        # from another thread, it only looks
+        total = 0
+        for fname in self.files:
+            try:
+                st = os.stat(self.path(fname))
+            except OSError:
+                continue
+            s = self.state[fname]
+            total += st.st_size - (s['offset'] if st.st_ino == s['inode'] else 0)
+        for old_path, offset, _ in list(self.rotated.values()):
+            try:
+                total += os.stat(old_path).st_size - offset
+            except OSError:
+                pass
+        return max(0, total)
+
+    def wait(self, timeout):
+        # block until a lane file changes or the timeout runs out
+        if self.pending():
+            return True
+        if len(self.rotated) > 0:
+            # come back in time to finish off the rotated files
+            timeout = min(timeout, self.rotate_grace)
+        if self.watcher is not None:
+            return self.watcher.wait(timeout) or self.pending()
+        end = time.time() + timeout
+        while time.time() < end:
+            time.sleep(min(self.poll_interval, max(0, end - time.time())))
+            if self.pending():
+                return True
+        return False
+
+    # for an event loop instead of wait(): wake_fd() turns readable when a
+    # lane file changes (None = no inotify, poll), clear_wake() resets it and
+    # says whether a lane file was what changed, idle_timeout() is how long
+    # to sleep with nothing to read
+    def wake_fd(self):
+        return self.watcher.fd if self.watcher is not None else None
+
+    def clear_wake(self):
+        if self.watcher is not None:
+            return self.watcher.drain()
+        return False
+
+    def idle_timeout(self):
+        if self.watcher is None:
+            return self.poll_interval
+        if len(self.rotated) > 0:
+            return self.rotate_grace  # come back to finish off the rotated files
+        return None
+
+    def read_from(self, path, offset):
+        # decode whole lines/records from offset - a partial one is left for next time
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            chunk = f.read()
+        vehicles, used = decode(chunk, self.fmt)
+        return vehicles, offset + used
+
+    def read_new(self):
+        # returns the vehicle dicts appended since the last call
+        vehicles = []
+        changed = False
+        now = time.time()
+
+        # finish rotated files first so arrivals stay in order
+        for fname in list(self.rotated.keys()):
+            old_path, offset, rotated_at = self.rotated[fname]
+            try:
+                new, offset = self.read_from(old_path, offset)
+            except OSError:
+                del self.rotated[fname]
+                changed = True
+                continue
+            vehicles.extend(new)
+            self.rotated[fname][1] = offset
+            if now - rotated_at >= self.rotate_grace:
+                if self.keep_rotated:
+                    self.held[fname] = old_path
+                else:
+                    try:
+                        os.remove(old_path)
+                    except OSError:
+                        pass  # already gone - nothing left to lose
+                del self.rotated[fname]
+            changed = True
+
+        for fname in self.files:
+            path = self.path(fname)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            s = self.state[fname]
+            if st.st_ino != s['inode'] or st.st_size < s['offset']:
+                # new or replaced file - start from the top
+                s['inode'] = st.st_ino
+                s['offset'] = 0
+                changed = True
+            if st.st_size == s['offset']:
+                continue
+
+            new, offset = self.read_from(path, s['offset'])
+            if offset != s['offset']:
+                vehicles.extend(new)
+                s['offset'] = offset
+                changed = True
+
+            if (s['offset'] >= self.compact_bytes and s['offset'] == st.st_size and fname not in self.rotated
+                    and fname not in self.held):
+                self.rotate(fname)
+
+        if changed:
+            self.save_offsets()
+        return vehicles
+
+    def release_rotated(self, fnames):
+        # a checkpoint that no longer points into these held files is on
+        # disk, they can go
+        for fname in fnames:
+            old_path = self.held.pop(fname, None)
+            if old_path is not None:
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+    
+    def rotate(self, fname):
+        # move the file aside - writers open by name so their next append
+        # creates a fresh file, anything already in flight lands in the old
+        # one and is picked up while we drain it
+        path = self.path(fname)
+        old_path = path + ".old"
+        os.replace(path, old_path)
+        s = self.state[fname]
+        self.rotated[fname] = [old_path, s['offset'], time.time()]
+        s['offset'] = 0
+        s['inode'] = None
+
+    def close(self):
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
@@ -0,0 +1,134 @@
+import math
+import re
+
+# screen geometry for junctions, generated from the junction itself
+# (its roads and their lanes) instead of hand-placed per lane
+#
+# roads are spread evenly around the junction starting from the top and
+# going anticlockwise, so the usual four come out as A top, B left, C bottom
+# and D right. everything is in pixels at scale 1 and multiplied by scale
+
+LANE_WIDTH = 60
+JUNCTION_SIZE = 200
+QUEUE_START = 300    # distance from the centre to the first vehicle slot
+SLOT_STEP = 30       # distance between vehicle slots
+ROAD_LENGTH = 700    # how far roads are drawn out from the centre
+LIGHT_DISTANCE = 115
+LABEL_OFFSET = 35    # light label distance from its light, along the road
+JUNCTION_SPACING = 800
+
+def road_of(lane):
+    # "AL2" -> "A"
+    return lane.rsplit('L', 1)[0]
+
+# where one lane's queue and light go
+class LaneLayout:
+    def __init__(self, lane, anchor, step, vertical, scale=1.0, light=None, label=None):
+        self.lane = lane
+        self.anchor = anchor      # top/left corner of slot 0
+        self.step = step          # (dx, dy) from one slot to the next
+        self.vertical = vertical  # vehicles are drawn 30 wide x 25 tall if true
+        self.scale = scale
+        self.light = light        # oval box for the traffic light, or None
+        self.label = label        # where the light's label goes
+
+    def slot_box(self, idx):
+        # rectangle for the idx'th vehicle waiting in the lane
+        x = self.anchor[0] + self.step[0] * idx
+        y = self.anchor[1] + self.step[1] * idx
+        half = 15 * self.scale
+        long_side = 25 * self.scale
+        if self.vertical:
+            return (x - half, y, x + half, y + long_side)
+        return (x, y - half, x + long_side, y + half)
+
+# everything needed to draw one junction
+class JunctionLayout:
+    def __init__(self, name, center, scale):
+        self.name = name
+        self.center = center
+        self.scale = scale
+        self.lanes = {}   # lane name -> LaneLayout
+        self.roads = []   # (road, polygon points, divider lines)
+        self.box = None   # the junction square
+        self.bounds = None
+
+def junction_layout(junction, center=(700, 425), scale=1.0):
+    cx, cy = center
+    layout = JunctionLayout(junction.name, center, scale)
+    half = JUNCTION_SIZE / 2 * scale
+    layout.box = (cx - half, cy - half, cx + half, cy + half)
+
+    lanes_by_road = {}
+    for lane in junction.queues:
+        lanes_by_road.setdefault(road_of(lane), []).append(lane)
+
+    roads = list(junction.roads)
+    for i, road in enumerate(roads):
+        # outward direction of the road, then the direction across it
+        # (the across direction is the mirror of the inward one, which is
+        # what puts L1 on the left of road A and on top of road B)
+        angle = math.pi / 2 + i * 2 * math.pi / len(roads)
+        ux, uy = round(math.cos(angle), 6), round(-math.sin(angle), 6)
+        lx, ly = -uy, -ux
+        vertical = abs(uy) >= abs(ux)
+        lanes = lanes_by_road.get(road, [])
+        width = len(lanes) * LANE_WIDTH * scale
+
+        def point(along, across):
+            return (cx + ux * along * scale + lx * across * scale,
+                    cy + uy * along * scale + ly * across * scale)
+
+        # road surface from the junction edge outwards
+        near = JUNCTION_SIZE / 2
+        polygon = [point(near, -width / 2 / scale), point(ROAD_LENGTH, -width / 2 / scale),
+                   point(ROAD_LENGTH, width / 2 / scale), point(near, width / 2 / scale)]
+        dividers = []
+        for k in range(1, len(lanes)):
+            across = (k - len(lanes) / 2) * LANE_WIDTH
+            dividers.append(point(near, across) + point(ROAD_LENGTH, across))
+        layout.roads.append((road, polygon, dividers))
+
+        for k, lane in enumerate(lanes):
+            across = (k - (len(lanes) - 1) / 2) * LANE_WIDTH
+            anchor = point(QUEUE_START, across)
+            step = (-ux * SLOT_STEP * scale, -uy * SLOT_STEP * scale)
+            light = label = None
+            if lane in junction.light_lanes:
+                lx_, ly_ = point(LIGHT_DISTANCE, across)
+                r = 20 * scale
+                light = (lx_ - r, ly_ - r, lx_ + r, ly_ + r)
+                # labels go on the screen down/right side of the light, so
+                # inside it on roads pointing up or left and outside otherwise
+                side = 1 if ux + uy >= 0 else -1
+                label = point(LIGHT_DISTANCE + side * LABEL_OFFSET, across)
+            layout.lanes[lane] = LaneLayout(lane, anchor, step, vertical, scale, light, label)
+
+    layout.bounds = junction_bounds(center, scale)
+    return layout
+
+def junction_bounds(center, scale=1.0):
+    reach = ROAD_LENGTH * scale
+    return (center[0] - reach, center[1] - reach, center[0] + reach, center[1] + reach)
+
+def grid_position(name, index, columns):
+    # J<row>_<col> names from network.grid_topology keep their place,
+    # anything else is laid out row by row
+    m = re.match(r"J(\d+)_(\d+)$", name)
+    if m:
+        return int(m.group(1)), int(m.group(2))
+    return index // columns, index % columns
+
+def network_centers(names, origin=(700, 425), scale=1.0):
+    # junction name -> centre in world coordinates. only the centres are
+    # worked out up front, full layouts are built for what's on screen
+    columns = max(1, math.ceil(math.sqrt(len(names))))
+    spacing = JUNCTION_SPACING * scale
+    centers = {}
+    for index, name in enumerate(names):
+        row, col = grid_position(name, index, columns)
+        centers[name] = (origin[0] + col * spacing, origin[1] + row * spacing)
+    return centers
+
+def overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
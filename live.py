@@ -0,0 +1,176 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+from engine import Vehicle
+
+# runs the engine against the wall clock and feeds it from the lane files
+# (or anything with the same wake_fd()/clear_wake()/idle_timeout()/read_new()
+# interface, e.g. StreamReceiver). reader=None runs only what the engine
+# generates itself
+class LiveSimulation:
+    def __init__(self, engine, reader=None):
+        self.engine = engine
+        self.reader = reader
+        self.running = False
+        self.start_time = time.time()
+        # how long each background loop spends working, for the metrics
+        # endpoint: loop -> [passes, total seconds, worst seconds]
+        self.loop_stats = {"serve": [0, 0.0, 0.0], "load": [0, 0.0, 0.0]}
+        self.last_load = None      # wall time of the last batch handed over
+        self.ingest_delay = None   # generation -> hand-over of that batch, if known
+        # held from reading the lane files until the batch is handed over, so
+        # a checkpoint never has offsets past vehicles the engine hasn't got
+        self.load_lock = threading.Lock()
+        self.checkpointer = None
+        self.history = None  # a HistoryStore sampling every engine second
+        self.loop = None
+    
+    def start(self):
+        self.running = True
+        self.start_time = time.time() - self.engine.clock
+        self.start_background_tasks()
+    
+    def stop(self):
+        self.running = False
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+            self.thread.join(2.0)
+            if not self.thread.is_alive():
+                self.loop.close()
+            self.loop = None
+    
+    def now(self):
+        return time.time() - self.start_time
+    
+    def timed(self, loop, fn):
+        start = time.perf_counter()
+        fn()
+        took = time.perf_counter() - start
+        stats = self.loop_stats[loop]
+        stats[0] += 1
+        stats[1] += took
+        stats[2] = max(stats[2], took)
+    
+    def advance(self, t):
+        if self.history is not None:
+            self.history.advance(t)
+        else:
+            self.engine.run_until(t)
+    
+    def call(self, fn):
+        # run fn on the loop thread, between passes, and wait for its result -
+        # that thread is the engine's only writer, so fn can drain the inbox
+        # or read anything without racing it. directly if no loop is running
+        loop = self.loop
+        if loop is None:
+            return self.locked(fn)
+        future = concurrent.futures.Future()
+
+        def run():
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(self.locked(fn))
+                except BaseException as e:
+                    future.set_exception(e)
+        loop.call_soon_threadsafe(run)
+        while True:
+            try:
+                return future.result(0.5)
+            except concurrent.futures.TimeoutError:
+                # the loop stopped before it got to us
+                if not self.thread.is_alive() and future.cancel():
+                    return self.locked(fn)
+
+    def locked(self, fn):
+        with self.load_lock, self.engine.lock:
+            return fn()
+    
+    def start_background_tasks(self):
+        # one asyncio loop on its own thread does the ingest and moves the
+        # engine clock - the only thread that touches queue state. the
+        # caller (e.g. the tkinter window in simulator.py) keeps the main thread
+        self.loop = asyncio.new_event_loop()
+        self.wake = asyncio.Event()     # vehicles were handed to the engine
+        self.stopped = asyncio.Event()
+        self.thread = threading.Thread(target=self.loop.run_until_complete, args=(self.main(),), daemon=True)
+        self.thread.start()
+    
+    async def main(self):
+        loop = asyncio.get_running_loop()
+        self.engine.waker = lambda: loop.call_soon_threadsafe(self.wake.set)
+        tasks = [asyncio.create_task(self.serve())]
+        if self.reader is not None:
+            tasks.append(asyncio.create_task(self.ingest()))
+        try:
+            await self.stopped.wait()
+        finally:
+            self.engine.waker = None
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def serve(self):
+        # moves the engine clock along with the wall clock, then sleeps until
+        # its next event, the next history sample or until new vehicles come
+        # in (serving and the free L3 lanes are events on the engine heap)
+        while self.running:
+            self.wake.clear()
+            self.timed("serve", lambda: self.advance(self.now()))
+            next_time = self.engine.next_event_time()
+            if self.history is not None:
+                next_time = self.history.next_tick if next_time is None else min(next_time, self.history.next_tick)
+            delay = None if next_time is None else max(0.001, next_time - self.now())
+            try:
+                await asyncio.wait_for(self.wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def ingest(self):
+        # reads whenever the reader's wake fd turns readable (inotify for the
+        # lane files, a pipe for the stream) with something for us - a change
+        # to another file in the directory is drained and ignored. polls only
+        # if there's no fd
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        fd = self.reader.wake_fd()
+        
+        def woken():
+            if self.reader.clear_wake():
+                ready.set()
+        if fd is not None:
+            loop.add_reader(fd, woken)
+        try:
+            while self.running:
+                ready.clear()
+                self.timed("load", self.load_vehicles_from_file)
+                try:
+                    await asyncio.wait_for(ready.wait(), self.reader.idle_timeout())
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if fd is not None:
+                loop.remove_reader(fd)
+        
+    def load_vehicles_from_file(self):
+        with self.load_lock:
+            self.load_batch()
+    
+    def load_batch(self):
+        # only the lines appended since the last read - handed to the engine
+        # as one batch, it routes each vehicle to the right lane queue
+        vehicles = []
+        oldest = None
+        for data in self.reader.read_new():
+            v = Vehicle(data['id'], data['lane'])
+            if 'time' in data:
+                # binary records carry the wall-clock generation time
+                v.generated_at = data['time'] - self.start_time
+                if oldest is None or data['time'] < oldest:
+                    oldest = data['time']
+            vehicles.append(v)
+        if len(vehicles) > 0:
+            self.engine.arrive_many(vehicles)
+            self.last_load = time.time()
+            if oldest is not None:
+                self.ingest_delay = self.last_load - oldest
@@ -0,0 +1,310 @@
+import json
+import multiprocessing as mp
+import os
+import random
+import time
+from demand import DEFAULT_RATES, check_lanes, lane_rate, load_profile, numpy
+from engine import ROADS
+from network import grid_topology, load_topology
+from parallel import ID_STRIDE
+from records import LANE_CODES, RECORD, data_file
+
+# load generator - many worker processes writing lane files for a network
+# at an aggregate target rate
+#
+# the unit of work is one road file of one junction, so every file has a
+# single writer. workers get contiguous runs of them (whole junctions when
+# there are enough to go round) and write under their own directory:
+#   out/shard-03/J1_2/lanea.bin
+# each junction directory is in the usual lane file layout. the target rate
+# is split over the roads by their lane rates (DEFAULT_RATES or a demand
+# profile's), each worker keeps its own share up against the wall clock a
+# tick at a time and the launcher reports whatever it falls short by
+#
+# every worker draws lanes from its own sub-seed of --seed, so for the same
+# seed, network and worker count the vehicle id -> lane sequence in every
+# file is the same whatever the timing (the timestamps are wall clock)
+
+if numpy is not None:
+    from demand import RECORD_DTYPE
+
+def road_units(topology):
+    # (junction, road) for every road file, in topology order
+    return [(spec["name"], road) for spec in topology["junctions"] for road in spec.get("roads", ROADS)]
+
+def shard(topology, workers):
+    # contiguous runs of road files - by junction if there are enough
+    # junctions, otherwise by road
+    names = [spec["name"] for spec in topology["junctions"]]
+    units = road_units(topology)
+    if len(names) >= workers:
+        size = -(-len(names) // workers)
+        parts = [set(names[i:i + size]) for i in range(0, len(names), size)]
+        return [[u for u in units if u[0] in part] for part in parts]
+    size = -(-len(units) // workers)
+    return [units[i:i + size] for i in range(0, len(units), size)]
+
+def sub_seeds(seed, n):
+    # one seed per worker, drawn from a stream seeded with --seed
+    master = random.Random(seed)
+    return [master.getrandbits(63) for _ in range(n)]
+
+def lane_weights(units, rates):
+    # [(junction, road, lane, vehicles/min)] for the lanes of some road files
+    out = []
+    for junction, road in units:
+        for i in (1, 2, 3):
+            lane = f"{road}L{i}"
+            out.append((junction, road, lane, lane_rate(rates, lane)))
+    return out
+
+def check_units(units, rates):
+    # before any worker starts - a road whose lanes have no lane code, or
+    # rates that give nothing to split, would only fail inside the workers
+    check_lanes(rates)
+    for junction, road, lane, _ in lane_weights(units, rates):
+        if lane not in LANE_CODES:
+            raise ValueError(f"{junction} has road {road!r}, lane files only have roads {', '.join(ROADS)}")
+    if sum(w for _, _, _, w in lane_weights(units, rates)) <= 0:
+        raise ValueError("the lane rates add up to nothing - give some lanes a rate above 0")
+
+def shard_dir(out, index):
+    return os.path.join(out, f"shard-{index:02d}")
+
+def road_path(out, index, junction, road, fmt):
+    return os.path.join(shard_dir(out, index), junction, data_file(f"lane{road.lower()}.txt", fmt))
+
+# one worker - owns some road files and a share of the rate
+class ShardWriter:
+    def __init__(self, index, units, rates, rate, seed, out=".", fmt="binary", backend=None):
+        self.index = index
+        self.rate = rate  # vehicles/s for this shard
+        self.fmt = fmt
+        self.backend = backend or ("numpy" if numpy is not None else "python")
+        if self.backend == "numpy" and numpy is None:
+            raise RuntimeError("numpy is needed for --backend numpy (pip install numpy), or use python")
+        self.next_id = index * ID_STRIDE + 1
+        self.written = 0
+
+        lanes = lane_weights(units, rates)
+        total = sum(w for _, _, _, w in lanes) or 1.0  # a shard of zero rate lanes never writes
+        self.fds = []
+        files = {}
+        lane_file = []
+        for junction, road, lane, _ in lanes:
+            key = (junction, road)
+            if key not in files:
+                path = road_path(out, index, junction, road, fmt)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                files[key] = len(self.fds)
+                self.fds.append(os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644))
+            lane_file.append(files[key])
+        self.lane_names = [lane for _, _, lane, _ in lanes]
+        self.lane_codes = [LANE_CODES[lane] for lane in self.lane_names]
+        self.lane_file = lane_file
+        cum = []
+        acc = 0.0
+        for _, _, _, w in lanes:
+            acc += w / total
+            cum.append(acc)
+        cum[-1] = 1.0
+        self.cum = cum
+
+        if self.backend == "numpy":
+            self.rng = numpy.random.default_rng(seed)
+            self.np_cum = numpy.array(cum)
+            self.np_codes = numpy.array(self.lane_codes, dtype=numpy.uint8)
+            self.np_file = numpy.array(lane_file, dtype=numpy.intp)
+        else:
+            self.rng = random.Random(seed)
+
+    def batch(self, n, now):
+        # n vehicles stamped now -> [(file index, bytes)]
+        if self.backend == "numpy":
+            picks = self.np_cum.searchsorted(self.rng.random(n), side='right')
+            recs = numpy.empty(n, dtype=RECORD_DTYPE)
+            recs['num'] = numpy.arange(self.next_id, self.next_id + n, dtype=numpy.uint64)
+            recs['lane'] = self.np_codes[picks]
+            recs['time'] = now
+            self.next_id += n
+            files = self.np_file[picks]
+            order = numpy.argsort(files, kind='stable')
+            counts = numpy.bincount(files, minlength=len(self.fds))
+            recs = recs[order]
+            out = []
+            start = 0
+            for f, count in enumerate(counts.tolist()):
+                if count:
+                    chunk = recs[start:start + count]
+                    if self.fmt == "binary":
+                        out.append((f, chunk.tobytes()))
+                    else:
+                        out.append((f, self.json_lines(chunk['num'].tolist(), chunk['lane'].tolist())))
+                    start += count
+            return out
+        picks = self.rng.choices(range(len(self.cum)), cum_weights=self.cum, k=n)
+        buffers = {}
+        for k, pick in enumerate(picks):
+            num = self.next_id + k
+            if self.fmt == "binary":
+                rec = RECORD.pack(num, self.lane_codes[pick], now)
+            else:
+                rec = (json.dumps({'id': f"V{num}", 'lane': self.lane_names[pick]}) + '\n').encode()
+            buffers.setdefault(self.lane_file[pick], []).append(rec)
+        self.next_id += n
+        return [(f, b''.join(recs)) for f, recs in buffers.items()]
+
+    def json_lines(self, nums, codes):
+        lanes = {code: name for code, name in zip(self.lane_codes, self.lane_names)}
+        return ''.join(f'{{"id": "V{num}", "lane": "{lanes[code]}"}}\n' for num, code in zip(nums, codes)).encode()
+
+    def write(self, n, now):
+        for f, data in self.batch(n, now):
+            # one write per file, O_APPEND keeps it whole against a reader
+            while data:
+                written = os.write(self.fds[f], data)
+                data = data[written:]
+        self.written += n
+
+    def close(self):
+        for fd in self.fds:
+            os.close(fd)
+        self.fds = []
+
+def worker(index, units, rates, rate, seed, out, fmt, backend, duration, tick, start_at, written, busy):
+    writer = ShardWriter(index, units, rates, rate, seed, out, fmt, backend)
+    # catching up is done a few ticks at a time so a lagging worker doesn't
+    # build one huge batch
+    most = max(1, int(rate * tick * 4))
+    try:
+        while time.time() < start_at:
+            time.sleep(min(0.01, max(0, start_at - time.time())))
+        start = time.perf_counter()
+        k = 0
+        while True:
+            elapsed = time.perf_counter() - start
+            if elapsed >= duration:
+                break
+            due = int(rate * elapsed) - writer.written
+            if due > 0:
+                t0 = time.perf_counter()
+                writer.write(min(due, most), time.time())
+                busy[index] += time.perf_counter() - t0
+                written[index] = writer.written
+            k += 1
+            wait = start + k * tick - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            else:
+                k = int((time.perf_counter() - start) / tick)  # behind - don't try to make up ticks
+        # the last part tick, if we're close enough to make it
+        due = int(rate * duration) - writer.written
+        if 0 < due <= most:
+            t0 = time.perf_counter()
+            writer.write(due, time.time())
+            busy[index] += time.perf_counter() - t0
+            written[index] = writer.written
+    finally:
+        writer.close()
+
+def run_fleet(topology, rate, workers, duration, out=".", seed=1, fmt="binary", backend=None, tick=0.05,
+              rates=None, report=None, report_interval=1.0):
+    # start the workers, wait for them and return the totals. report(elapsed,
+    # written) is called every report_interval seconds while they run
+    parts = shard(topology, workers)
+    rates = rates or DEFAULT_RATES
+    check_units(road_units(topology), rates)
+    weights = [sum(w for _, _, _, w in lane_weights(units, rates)) for units in parts]
+    shares = [rate * w / sum(weights) for w in weights]
+    seeds = sub_seeds(seed, len(parts))
+
+    ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+    written = ctx.Array('q', len(parts), lock=False)
+    busy = ctx.Array('d', len(parts), lock=False)
+    start_at = time.time() + 0.2 + 0.02 * len(parts)  # every worker starts its clock together
+    procs = [ctx.Process(target=worker, args=(i, parts[i], rates, shares[i], seeds[i], out, fmt, backend,
+                                              duration, tick, start_at, written, busy))
+             for i in range(len(parts))]
+    for p in procs:
+        p.start()
+    try:
+        while any(p.is_alive() for p in procs):
+            time.sleep(report_interval)
+            if report is not None and time.time() > start_at:
+                report(min(duration, time.time() - start_at), sum(written))
+    finally:
+        for p in procs:
+            p.join()
+    failed = [i for i, p in enumerate(procs) if p.exitcode != 0]
+    if failed:
+        raise RuntimeError(f"worker(s) {', '.join(map(str, failed))} failed")
+
+    shards = []
+    for i, units in enumerate(parts):
+        target = int(shares[i] * duration)
+        shards.append({"shard": i, "roads": len(units), "junctions": len(set(u[0] for u in units)),
+                       "seed": seeds[i], "rate": round(shares[i], 1), "target": target,
+                       "written": written[i], "shortfall": target - written[i],
+                       "busy": round(busy[i] / duration, 3)})
+    target = sum(s["target"] for s in shards)
+    total = sum(written)
+    return {"rate": rate, "duration": duration, "workers": len(parts), "target": target, "written": total,
+            "achieved": round(total / duration, 1), "shortfall": target - total,
+            "shortfall_pct": round((target - total) / target * 100, 2) if target else 0.0, "shards": shards}
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from records import FORMATS
+
+    parser = argparse.ArgumentParser(description="Write lane files for a network from many processes at a target rate")
+    parser.add_argument("--rate", type=float, default=100000, help="vehicles per second over all workers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to keep it up")
+    parser.add_argument("--grid", default=None, help="ROWSxCOLS grid of junctions (default: the single junction)")
+    parser.add_argument("--topology", default=None, help="JSON/YAML topology file (overrides --grid)")
+    parser.add_argument("--out", default="load", help="directory the shard directories go in")
+    parser.add_argument("--format", choices=FORMATS, default="binary")
+    parser.add_argument("--profile", default=None, help="JSON/YAML demand profile whose lane rates weight the roads")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--backend", choices=["numpy", "python"], default=None)
+    parser.add_argument("--tick", type=float, default=0.05, help="seconds between a worker's writes")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="shortfall that counts as a failure")
+    parser.add_argument("--json", default=None, help="write the summary to this file")
+    args = parser.parse_args()
+
+    if args.topology:
+        topology = load_topology(args.topology)
+    elif args.grid:
+        rows, cols = (int(x) for x in args.grid.lower().split('x'))
+        topology = grid_topology(rows, cols)
+    else:
+        topology = {"junctions": [{"name": "J", "roads": list(ROADS)}], "links": []}
+
+    def report(elapsed, written):
+        target = args.rate * elapsed
+        print(f"{elapsed:6.1f}s  {written:>14,} written  {written / max(elapsed, 1e-9):>12,.0f}/s"
+              f"  {(target - written) / max(target, 1) * 100:6.2f}% behind")
+
+    print(f"{len(road_units(topology))} road files, {args.rate:,.0f} vehicles/s for {args.duration:g}s "
+          f"on up to {args.workers} workers -> {args.out}/")
+    try:
+        rates = load_profile(args.profile).get("rates") if args.profile else None
+        check_units(road_units(topology), rates or DEFAULT_RATES)
+    except ValueError as e:
+        parser.error(str(e))
+    res = run_fleet(topology, args.rate, args.workers, args.duration, args.out, args.seed, args.format,
+                    args.backend, args.tick, rates, report)
+
+    print(f"\n{'shard':>5} {'roads':>6} {'rate/s':>12} {'written':>14} {'shortfall':>12} {'busy':>6}")
+    for s in res["shards"]:
+        print(f"{s['shard']:>5} {s['roads']:>6} {s['rate']:>12,.0f} {s['written']:>14,} {s['shortfall']:>12,} "
+              f"{s['busy'] * 100:>5.0f}%")
+    print(f"\n{res['written']:,} of {res['target']:,} vehicles, {res['achieved']:,.0f}/s over {res['workers']} workers "
+          f"(target {args.rate:,.0f}/s), shortfall {res['shortfall']:,} ({res['shortfall_pct']:.2f}%)")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(res, f, indent=2)
+    if res["shortfall_pct"] > args.tolerance * 100:
+        print(f"fell short by more than {args.tolerance * 100:g}% - more workers, a longer --tick or a lower --rate")
+        sys.exit(1)
@@ -0,0 +1,150 @@
+import csv
+import json
+from engine import DEPART, FEED, FREE
+
+# streaming latency metrics - nothing is kept per vehicle
+#
+# LatencyHistogram is an HDR-style log-linear histogram: values (in ms) are
+# grouped by power of two and every power of two is split into SUB_BUCKETS
+# linear buckets, so percentiles are within ~1.5% and memory stays at a few
+# thousand counters no matter how many vehicles go through
+
+SUB_BUCKETS = 64
+SUB_BITS = 6  # log2(SUB_BUCKETS)
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = []
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def index(self, ms):
+        if ms < SUB_BUCKETS:
+            return ms
+        shift = ms.bit_length() - SUB_BITS - 1
+        return SUB_BUCKETS * (shift + 1) + (ms >> shift) - SUB_BUCKETS
+
+    def bucket_value(self, idx):
+        # middle of the bucket, in seconds
+        if idx < SUB_BUCKETS:
+            return idx / 1000.0
+        shift = idx // SUB_BUCKETS - 1
+        low = (idx % SUB_BUCKETS + SUB_BUCKETS) << shift
+        return (low + (1 << shift) / 2) / 1000.0
+
+    def record(self, seconds):
+        if seconds < 0:
+            seconds = 0.0
+        idx = self.index(int(seconds * 1000))
+        if idx >= len(self.counts):
+            self.counts.extend([0] * (idx + 1 - len(self.counts)))
+        self.counts[idx] += 1
+        self.total += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentile(self, pct):
+        if self.total == 0:
+            return 0.0
+        target = max(1, pct / 100.0 * self.total)
+        seen = 0
+        for idx, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return min(self.bucket_value(idx), self.max)
+        return self.max
+
+    def mean(self):
+        return self.sum / self.total if self.total else 0.0
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "mean": round(self.mean(), 3),
+            "p50": round(self.percentile(50), 3),
+            "p95": round(self.percentile(95), 3),
+            "p99": round(self.percentile(99), 3),
+            "max": round(self.max, 3),
+        }
+
+# per-lane queueing delay and throughput, fed as an engine observer
+class MetricsCollector:
+    def __init__(self):
+        self.waits = {}     # lane key -> LatencyHistogram of enqueue -> departure
+        self.served = {}    # lane key -> vehicles served
+        self.latency = LatencyHistogram()  # generation -> departure, all lanes
+        self.start = None
+        self.now = 0.0
+
+    def key(self, v):
+        # plain lane name on a single junction, junction/lane in a network
+        if v.junction is None:
+            return v.lane
+        return f"{v.junction}/{v.lane}"
+
+    def __call__(self, engine, kind, v):
+        self.now = engine.clock
+        if self.start is None:
+            self.start = engine.clock
+        if kind == DEPART or kind == FREE or kind == FEED:
+            # FEED is an L1 vehicle moving up to L2/L3 - its L1 wait counts
+            # for the L1 lane, but it hasn't left the junction yet
+            k = self.key(v)
+            hist = self.waits.get(k)
+            if hist is None:
+                hist = self.waits[k] = LatencyHistogram()
+            hist.record(v.wait_time)
+            self.served[k] = self.served.get(k, 0) + 1
+            if kind != FEED and v.generated_at is not None:
+                self.latency.record(v.departed_at - v.generated_at)
+
+    def elapsed(self):
+        if self.start is None:
+            return 0.0
+        return self.now - self.start
+
+    def snapshot(self):
+        elapsed = self.elapsed()
+        lanes = {}
+        for k in sorted(self.waits):
+            row = self.waits[k].summary()
+            row["served"] = self.served[k]
+            row["per_min"] = round(self.served[k] * 60.0 / elapsed, 2) if elapsed > 0 else 0.0
+            lanes[k] = row
+        return {"elapsed": round(elapsed, 3), "lanes": lanes, "latency": self.latency.summary()}
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def write_csv(self, path):
+        snap = self.snapshot()
+        fields = ["lane", "served", "per_min", "count", "mean", "p50", "p95", "p99", "max"]
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+            writer.writeheader()
+            for lane, row in snap["lanes"].items():
+                writer.writerow(dict(row, lane=lane))
+
+    def write(self, path):
+        if path.endswith(".csv"):
+            self.write_csv(path)
+        else:
+            self.write_json(path)
+
+    def print_table(self):
+        snap = self.snapshot()
+        print(f"{'lane':<10} {'served':>8} {'/min':>7} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8}")
+        for lane, row in snap["lanes"].items():
+            print(f"{lane:<10} {row['served']:>8} {row['per_min']:>7} {row['p50']:>8} {row['p95']:>8} {row['p99']:>8}")
@@ -0,0 +1,199 @@
+import http.server
+import os
+import socket
+import socketserver
+import threading
+import time
+from transport import parse_address
+
+# prometheus text endpoint for a running simulation
+#
+# GET /metrics on a local port (or a unix socket path). a scrape copies the
+# numbers it needs under engine.lock - a few dict lookups per lane, less than
+# one stats panel update - and formats them outside it, so the serve loop
+# barely notices
+
+DEFAULT_METRICS_ADDRESS = "127.0.0.1:9108"
+
+def label_text(labels):
+    if not labels:
+        return ""
+    parts = [f'{k}="{v}"' for k, v in labels.items()]
+    return "{" + ",".join(parts) + "}"
+
+# collects the numbers - everything is read from the engine, the live loops
+# and the reader, so counters run from engine start (or the checkpoint it
+# resumed from), not from when we attached
+class MetricsExporter:
+    def __init__(self, live, app=None):
+        self.live = live
+        self.engine = live.engine
+        self.app = app  # the TrafficSimulator, for frame times
+
+    def collect(self):
+        # (name, type, help, [(labels, value), ...])
+        engine = self.engine
+        queue_rows, served_rows, junction_rows, priority_rows, rejected_rows = [], [], [], [], []
+        with engine.lock:
+            for name, j in engine.junctions.items():
+                for lane, q in j.queues.items():
+                    queue_rows.append(({"junction": name, "lane": lane}, q.size()))
+                for lane, n in j.served.items():
+                    served_rows.append(({"junction": name, "lane": lane}, n))
+                for lane, n in j.rejected.items():
+                    rejected_rows.append(({"junction": name, "lane": lane}, n))
+                junction_rows.append(({"junction": name}, j.total_served))
+                priority_rows.append(({"junction": name}, int(j.is_priority_mode)))
+            clock = engine.clock
+            arrived = engine.arrived
+            rejected = engine.rejected
+
+        metrics = [
+            ("traffic_queue_length", "gauge", "Vehicles waiting in a lane.", queue_rows),
+            ("traffic_lane_served_total", "counter", "Vehicles served from a lane.", served_rows),
+            ("traffic_junction_served_total", "counter", "Vehicles through a junction's light or free lane.",
+             junction_rows),
+            ("traffic_priority_mode", "gauge", "1 while the junction serves its priority lane first.",
+             priority_rows),
+            ("traffic_rejected_total", "counter", "Arrivals turned away from a full lane.", rejected_rows),
+            ("traffic_arrived_total", "counter", "Vehicles handed to the engine from outside.", [({}, arrived)]),
+            ("traffic_engine_rejected_total", "counter", "Arrivals turned away, all lanes.", [({}, rejected)]),
+            ("traffic_engine_clock_seconds", "gauge", "Engine time.", [({}, clock)]),
+            ("traffic_engine_inbox_batches", "gauge", "Batches handed over but not taken in yet.",
+             [({}, engine.inbox.qsize())]),
+        ]
+
+        live = self.live
+        if hasattr(live, "now"):
+            metrics.append(("traffic_engine_lag_seconds", "gauge", "How far the engine clock is behind the wall clock.",
+                            [({}, live.now() - clock)]))
+
+        # ingest - how much is waiting to be read and how stale the last batch was
+        reader = live.reader
+        if reader is not None and hasattr(reader, "backlog"):
+            unit = reader.backlog_unit
+            metrics.append((f"traffic_ingest_backlog_{unit}", "gauge", f"Unread {unit} from the generator.",
+                            [({}, reader.backlog())]))
+        last_load = getattr(live, "last_load", None)
+        if last_load is not None:
+            metrics.append(("traffic_ingest_last_batch_age_seconds", "gauge", "Seconds since vehicles were last loaded.",
+                            [({}, time.time() - last_load)]))
+        delay = getattr(live, "ingest_delay", None)
+        if delay is not None:
+            metrics.append(("traffic_ingest_delay_seconds", "gauge",
+                            "Generation to hand-over for the oldest vehicle of the last batch.", [({}, delay)]))
+
+        # loop timings
+        loop_stats = getattr(live, "loop_stats", {})
+        if loop_stats:
+            rows = sorted(loop_stats.items())
+            metrics.append(("traffic_loop_passes_total", "counter", "Passes of each background loop.",
+                            [({"loop": k}, s[0]) for k, s in rows]))
+            metrics.append(("traffic_loop_seconds_total", "counter", "Seconds spent working in each loop.",
+                            [({"loop": k}, s[1]) for k, s in rows]))
+            metrics.append(("traffic_loop_worst_seconds", "gauge", "Longest single pass of each loop.",
+                            [({"loop": k}, s[2]) for k, s in rows]))
+        if self.app is not None:
+            avg_ms, worst_ms = self.app.frame_stats()
+            metrics.append(("traffic_frame_seconds", "gauge", "Frame draw time over the last 100 frames.",
+                            [({"stat": "avg"}, avg_ms / 1000), ({"stat": "max"}, worst_ms / 1000)]))
+        return metrics
+
+    def render(self):
+        lines = []
+        for name, kind, help_text, rows in self.collect():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in rows:
+                lines.append(f"{name}{label_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.exporter.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # the console is for vehicle output
+
+class UnixHTTPServer(http.server.ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # HTTPServer.server_bind wants a host and port
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = self.server_address
+        self.server_port = 0
+
+# serves an exporter on its own daemon thread; every scrape gets a thread too
+class MetricsServer:
+    def __init__(self, exporter, address=DEFAULT_METRICS_ADDRESS):
+        self.exporter = exporter
+        family, addr = parse_address(address)
+        self.path = None
+        if family == socket.AF_UNIX:
+            if os.path.exists(addr):
+                os.remove(addr)  # stale socket from a previous run
+            self.path = addr
+            self.server = UnixHTTPServer(addr, MetricsHandler)
+        else:
+            self.server = http.server.ThreadingHTTPServer(addr, MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.exporter = exporter
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def address(self):
+        # "host:port" (the real port if 0 was asked for) or the socket path
+        if self.path is not None:
+            return self.path
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+def serve_metrics(live, address=DEFAULT_METRICS_ADDRESS, app=None):
+    return MetricsServer(MetricsExporter(live, app), address)
+
+def scrape(address=DEFAULT_METRICS_ADDRESS, timeout=5.0):
+    # GET /metrics - works for a unix socket path too, which curl needs
+    # --unix-socket for
+    family, addr = parse_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(addr)
+        sock.sendall(b"GET /metrics HTTP/1.0\r\nHost: localhost\r\n\r\n")
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    head, _, body = b"".join(chunks).partition(b"\r\n\r\n")
+    status = head.split(b"\r\n", 1)[0].decode()
+    if status.split()[1:2] != ["200"]:
+        raise RuntimeError(f"{address}: {status}")
+    return body.decode()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print what a simulator's metrics endpoint serves")
+    parser.add_argument("address", nargs="?", default=DEFAULT_METRICS_ADDRESS, help="host:port or unix socket path")
+    parser.add_argument("--grep", default=None, help="only lines containing this")
+    args = parser.parse_args()
+
+    for line in scrape(args.address).splitlines():
+        if args.grep is None or args.grep in line:
+            print(line)
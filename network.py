@@ -0,0 +1,123 @@
+import json
+from controllers import CONTROLLERS, make_controller
+from engine import Junction, JunctionEngine, ROADS
+
+# declarative road networks for the engine
+#
+# topology file (JSON, or YAML if PyYAML is installed):
+# {
+#   "junctions": [{"name": "J0_0", "roads": ["A", "B", "C", "D"], "priority_lane": "AL2",
+#                  "controller": {"name": "max-pressure", "min_green": 10},
+#                  "capacity": 50, "overflow": "spill"}, ...],
+#   "links": [{"from": "J0_0", "exit": "D", "to": "J0_1", "enter": "B", "travel_time": 10}, ...]
+# }
+# a vehicle leaving "from" by road "exit" queues on "to"'s <enter>L1 lane
+# after travel_time seconds - exits without a link leave the network
+
+# grid neighbours: exit road -> (row step, col step, road it enters on)
+GRID_STEPS = {
+    "A": (-1, 0, "C"),  # out the top, into the bottom of the junction above
+    "C": (1, 0, "A"),
+    "B": (0, -1, "D"),
+    "D": (0, 1, "B"),
+}
+
+def grid_name(row, col):
+    return f"J{row}_{col}"
+
+def grid_topology(rows, cols, travel_time=10.0):
+    junctions = []
+    links = []
+    for row in range(rows):
+        for col in range(cols):
+            junctions.append({"name": grid_name(row, col), "roads": list(ROADS)})
+            for road, (dr, dc, enter) in GRID_STEPS.items():
+                r, c = row + dr, col + dc
+                if 0 <= r < rows and 0 <= c < cols:
+                    links.append({"from": grid_name(row, col), "exit": road,
+                                  "to": grid_name(r, c), "enter": enter,
+                                  "travel_time": travel_time})
+    return {"junctions": junctions, "links": links}
+
+def load_config(path, what="topologies"):
+    # JSON, or YAML if PyYAML is installed - topologies and demand profiles
+    with open(path, 'r') as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError(f"PyYAML is needed for YAML {what} (pip install pyyaml), or use JSON")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def load_topology(path):
+    return load_config(path, "topologies")
+
+def build_junctions(topology, only=None, controller=None, capacity=None, overflow="reject", compact=False):
+    # only = set of junction names to build (one partition of a bigger network)
+    # controller = name or config of the signal controller every junction gets
+    # (otherwise a junction's own "controller" entry, or the priority default)
+    # capacity/overflow = lane capacity for junctions that don't set their own
+    # compact = keep lane queues as number buffers
+    names = set(spec["name"] for spec in topology["junctions"])
+    junctions = {}
+    for spec in topology["junctions"]:
+        if only is None or spec["name"] in only:
+            spec_controller = controller or spec.get("controller")
+            j = Junction(spec["name"], spec.get("roads"), spec.get("priority_lane", "AL2"),
+                         controller=make_controller(spec_controller) if spec_controller else None,
+                         capacity=spec.get("capacity", capacity), overflow=spec.get("overflow", overflow),
+                         compact=compact)
+            junctions[j.name] = j
+    for link in topology.get("links", []):
+        if link["to"] not in names:
+            raise ValueError(f"link from {link['from']} goes to unknown junction {link['to']}")
+        src = junctions.get(link["from"])
+        if src is not None:
+            src.link(link["exit"], link["to"], link["enter"], link.get("travel_time", 0.0))
+    return list(junctions.values())
+
+def build_engine(topology, controller=None, capacity=None, overflow="reject", compact=False, **kwargs):
+    return JunctionEngine(build_junctions(topology, controller=controller, capacity=capacity,
+                                          overflow=overflow, compact=compact), **kwargs)
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import time
+    from traffic_generator import VehicleGenerator
+
+    parser = argparse.ArgumentParser(description="Run a junction network headless")
+    parser.add_argument("--grid", default="10x10", help="ROWSxCOLS grid of junctions")
+    parser.add_argument("--topology", default=None, help="JSON/YAML topology file (overrides --grid)")
+    parser.add_argument("--travel-time", type=float, default=10.0, help="seconds between grid neighbours")
+    parser.add_argument("--duration", type=float, default=600, help="junction seconds to simulate")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--controller", choices=list(CONTROLLERS), default=None,
+                        help="signal controller for every junction (default: as in the topology)")
+    parser.add_argument("--capacity", type=int, default=None, help="vehicles per lane before arrivals overflow")
+    parser.add_argument("--overflow", choices=["reject", "spill"], default="reject")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    if args.topology:
+        topology = load_topology(args.topology)
+    else:
+        rows, cols = (int(x) for x in args.grid.lower().split('x'))
+        topology = grid_topology(rows, cols, args.travel_time)
+
+    engine = build_engine(topology, controller=args.controller, capacity=args.capacity, overflow=args.overflow)
+    # one shared generator so vehicle ids stay unique across the network
+    generator = VehicleGenerator(make_files=False)
+    for name in engine.junctions:
+        engine.attach_generator(generator, junction=name)
+
+    start = time.perf_counter()
+    engine.run(args.duration)
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(engine.junctions)} junctions, {args.duration:.0f}s of junction time in {elapsed:.2f}s")
+    print(f"Generated: {generator.vehicle_counter}, served: {engine.total_served}, "
+          f"left the network: {engine.exited}, still queued: {engine.queued()}, rejected: {engine.rejected}")
@@ -0,0 +1,234 @@
+import multiprocessing as mp
+import queue
+import random
+import struct
+import time
+from multiprocessing import shared_memory
+from engine import JunctionEngine, Vehicle
+from network import build_engine, build_junctions, grid_topology, load_topology
+from traffic_generator import VehicleGenerator
+
+# partitioned execution of a big junction network on a pool of processes
+#
+# every worker owns a slice of the junctions and runs its own engine. they
+# advance in lockstep windows no longer than the shortest link between two
+# slices, so nothing sent across a slice boundary can arrive inside the
+# window it was sent in. after each window workers swap boundary vehicles
+# through shared-memory ring buffers (one per ordered pair of workers)
+
+# boundary vehicle: arrival time, vehicle number, junction index, lane code
+BOUNDARY = struct.Struct('<dQIB')
+# ring header: head (next record to read), tail (next record to write)
+RING_HEADER = struct.Struct('<QQ')
+RING_CAPACITY = 1 << 16
+# each worker numbers its vehicles from index * ID_STRIDE so ids stay unique
+ID_STRIDE = 10 ** 12
+
+# single producer / single consumer ring of fixed-size records
+class RingBuffer:
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(create=True, size=RING_HEADER.size + capacity * BOUNDARY.size)
+        RING_HEADER.pack_into(self.shm.buf, 0, 0, 0)
+
+    def slot(self, n):
+        return RING_HEADER.size + (n % self.capacity) * BOUNDARY.size
+
+    def push(self, records):
+        # write as many as fit, then publish the new tail - returns how many went in
+        buf = self.shm.buf
+        head, tail = RING_HEADER.unpack_from(buf, 0)
+        n = min(self.capacity - (tail - head), len(records))
+        for i in range(n):
+            BOUNDARY.pack_into(buf, self.slot(tail + i), *records[i])
+        struct.pack_into('<Q', buf, 8, tail + n)
+        return n
+
+    def pop_all(self):
+        buf = self.shm.buf
+        head, tail = RING_HEADER.unpack_from(buf, 0)
+        records = [BOUNDARY.unpack_from(buf, self.slot(n)) for n in range(head, tail)]
+        struct.pack_into('<Q', buf, 0, tail)
+        return records
+
+    def close(self, unlink=False):
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+def partition(topology, workers):
+    # contiguous chunks in topology order - row bands for a row-major grid,
+    # which keeps the number of cut links low
+    names = [spec["name"] for spec in topology["junctions"]]
+    size = -(-len(names) // workers)
+    return [names[i:i + size] for i in range(0, len(names), size)]
+
+def lookahead(topology, parts):
+    # the window length: shortest travel time on a link that crosses slices
+    owner = {name: i for i, part in enumerate(parts) for name in part}
+    times = [link.get("travel_time", 0.0) for link in topology.get("links", [])
+             if owner[link["from"]] != owner[link["to"]]]
+    if len(times) == 0:
+        return None  # slices are independent
+    window = min(times)
+    if window <= 0:
+        raise ValueError("links between partitions need a travel time > 0")
+    return window
+
+def lane_table(topology):
+    # every lane name in the network, numbered for the boundary records -
+    # built from the topology, so roads beyond A-D cross slices too
+    lanes = sorted({lane for j in build_junctions(topology) for lane in j.queues})
+    if len(lanes) > 256:
+        raise ValueError(f"{len(lanes)} lane names in the topology, boundary records hold at most 256")
+    return lanes
+
+def exchange(index, engine, outgoing, rings, barrier, pending, junction_names, lanes, rounds):
+    # rounds of write / barrier / read / barrier until every worker has
+    # pushed everything (a full ring just means another round). rounds[0]
+    # counts on across windows - every worker runs the same rounds, so the
+    # flags a fast worker writes next are never the ones a slow one is
+    # still reading
+    while True:
+        flags = pending[rounds[0] % 2]
+        left = False
+        for dest, recs in outgoing.items():
+            n = rings[index][dest].push(recs)
+            outgoing[dest] = recs[n:]
+            if len(outgoing[dest]) > 0:
+                left = True
+        flags[index] = 1 if left else 0
+        barrier.wait()
+        for src in range(len(rings)):
+            if src == index:
+                continue
+            for t, num, j_index, lane_code in rings[src][index].pop_all():
+                engine.arrive(Vehicle(f"V{num}", lanes[lane_code], junction_names[j_index]), t)
+        barrier.wait()
+        rounds[0] += 1
+        if not any(flags[:]):
+            return
+
+def worker(index, topology, parts, lanes, rings, barrier, pending, window, duration, seed, interval, results):
+    try:
+        run_worker(index, topology, parts, lanes, rings, barrier, pending, window, duration, seed, interval,
+                   results)
+    except BaseException:
+        barrier.abort()  # the others would wait for us forever
+        raise
+
+def run_worker(index, topology, parts, lanes, rings, barrier, pending, window, duration, seed, interval, results):
+    random.seed(seed * 1000 + index)
+    junction_names = [spec["name"] for spec in topology["junctions"]]
+    j_index = {name: i for i, name in enumerate(junction_names)}
+    lane_codes = {lane: code for code, lane in enumerate(lanes)}
+    owner = {name: i for i, part in enumerate(parts) for name in part}
+
+    engine = JunctionEngine(build_junctions(topology, only=set(parts[index])))
+    engine.outbox = []
+    generator = VehicleGenerator(make_files=False)
+    generator.vehicle_counter = index * ID_STRIDE
+    for name in parts[index]:
+        engine.attach_generator(generator, interval, name)
+
+    t = 0.0
+    rounds = [0]
+    while t < duration:
+        t = min(t + window, duration)
+        engine.run_until(t)
+        outgoing = {dest: [] for dest in range(len(parts)) if dest != index}
+        for arrival, v in engine.outbox:
+            outgoing[owner[v.junction]].append((arrival, int(v.id[1:]), j_index[v.junction], lane_codes[v.lane]))
+        engine.outbox = []
+        exchange(index, engine, outgoing, rings, barrier, pending, junction_names, lanes, rounds)
+
+    results.put((index, generator.vehicle_counter - index * ID_STRIDE,
+                 engine.total_served, engine.exited, engine.queued()))
+
+def run_parallel(topology, workers, duration, seed=1, interval=5.0):
+    parts = partition(topology, workers)
+    workers = len(parts)
+    lanes = lane_table(topology)
+    window = lookahead(topology, parts)
+    if window is None:
+        window = duration
+
+    ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+    rings = [[RingBuffer() if src != dest else None for dest in range(workers)] for src in range(workers)]
+    barrier = ctx.Barrier(workers)
+    pending = [ctx.Array('b', workers, lock=False), ctx.Array('b', workers, lock=False)]
+    results = ctx.Queue()
+
+    procs = [ctx.Process(target=worker, args=(i, topology, parts, lanes, rings, barrier, pending,
+                                              window, duration, seed, interval, results))
+             for i in range(workers)]
+    try:
+        for p in procs:
+            p.start()
+        totals = [0, 0, 0, 0]
+        got = 0
+        while got < len(procs):
+            try:
+                _, generated, served, exited, queued = results.get(timeout=1.0)
+            except queue.Empty:
+                failed = [i for i, p in enumerate(procs) if p.exitcode not in (None, 0)]
+                if failed:
+                    barrier.abort()
+                    for p in procs:
+                        if p.is_alive():
+                            p.terminate()
+                    raise RuntimeError(f"worker(s) {', '.join(map(str, failed))} failed")
+                continue
+            got += 1
+            totals = [a + b for a, b in zip(totals, [generated, served, exited, queued])]
+        for p in procs:
+            p.join()
+    finally:
+        for row in rings:
+            for ring in row:
+                if ring is not None:
+                    ring.close(unlink=True)
+    generated, served, exited, queued = totals
+    return {"generated": generated, "served": served, "exited": exited, "queued": queued}
+
+def run_single(topology, duration, seed=1, interval=5.0):
+    random.seed(seed)
+    engine = build_engine(topology)
+    generator = VehicleGenerator(make_files=False)
+    for name in engine.junctions:
+        engine.attach_generator(generator, interval, name)
+    engine.run(duration)
+    return {"generated": generator.vehicle_counter, "served": engine.total_served,
+            "exited": engine.exited, "queued": engine.queued()}
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a junction network across worker processes")
+    parser.add_argument("--grid", default="40x40", help="ROWSxCOLS grid of junctions")
+    parser.add_argument("--topology", default=None, help="JSON/YAML topology file (overrides --grid)")
+    parser.add_argument("--travel-time", type=float, default=10.0, help="seconds between grid neighbours")
+    parser.add_argument("--duration", type=float, default=120, help="junction seconds to simulate")
+    parser.add_argument("--workers", default="1,2,4,8", help="comma separated worker counts to time")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.topology:
+        topology = load_topology(args.topology)
+    else:
+        rows, cols = (int(x) for x in args.grid.lower().split('x'))
+        topology = grid_topology(rows, cols, args.travel_time)
+
+    print(f"{len(topology['junctions'])} junctions, {args.duration:.0f}s of junction time, "
+          f"{mp.cpu_count()} cpus\n")
+
+    start = time.perf_counter()
+    res = run_single(topology, args.duration, args.seed)
+    base = time.perf_counter() - start
+    print(f"{'single engine':<16} {base:8.2f}s            served {res['served']:>10,}")
+
+    for n in (int(x) for x in args.workers.split(',')):
+        start = time.perf_counter()
+        res = run_parallel(topology, n, args.duration, args.seed)
+        elapsed = time.perf_counter() - start
+        print(f"{f'{n} workers':<16} {elapsed:8.2f}s {base / elapsed:6.2f}x    served {res['served']:>10,}")
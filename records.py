@@ -0,0 +1,80 @@
+import json
+import mmap
+import os
+import struct
+
+# fixed-width binary vehicle record - an alternative to one JSON line per car
+#   Q  vehicle number (the 123 in "V123")
+#   B  lane code (index into LANES)
+#   d  arrival timestamp (time.time() at generation)
+RECORD = struct.Struct('<QBd')
+RECORD_SIZE = RECORD.size
+
+LANES = [
+    "AL1", "AL2", "AL3",
+    "BL1", "BL2", "BL3",
+    "CL1", "CL2", "CL3",
+    "DL1", "DL2", "DL3"
+]
+LANE_CODES = {lane: code for code, lane in enumerate(LANES)}
+
+FORMATS = ["json", "binary"]
+
+def data_file(fname, fmt):
+    # lanea.txt stays the JSON file, the binary one is lanea.bin
+    if fmt == "binary":
+        return fname.rsplit('.', 1)[0] + ".bin"
+    return fname
+
+def encode_json(v_data):
+    return (json.dumps(v_data) + '\n').encode()
+
+def encode_binary(v_data):
+    return RECORD.pack(int(v_data['id'][1:]), LANE_CODES[v_data['lane']], v_data.get('time', 0.0))
+
+def encode(v_data, fmt):
+    if fmt == "binary":
+        return encode_binary(v_data)
+    return encode_json(v_data)
+
+def decode_json(chunk):
+    # whole lines only - returns (vehicles, bytes used); a partial last line is left
+    end = chunk.rfind(b'\n')
+    if end < 0:
+        return [], 0
+    vehicles = []
+    for line in chunk[:end].split(b'\n'):
+        line = line.strip()
+        if line:
+            try:
+                vehicles.append(json.loads(line))
+            except ValueError:
+                pass  # skip a corrupt line, keep the rest
+    return vehicles, end + 1
+
+def decode_binary(chunk):
+    # whole records only - returns (vehicles, bytes used)
+    used = len(chunk) - len(chunk) % RECORD_SIZE
+    vehicles = []
+    for num, code, t in RECORD.iter_unpack(memoryview(chunk)[:used]):
+        vehicles.append({'id': f"V{num}", 'lane': LANES[code], 'time': t})
+    return vehicles, used
+
+def decode(chunk, fmt):
+    if fmt == "binary":
+        return decode_binary(chunk)
+    return decode_json(chunk)
+
+def iter_records_mmap(path, offset=0):
+    # raw (number, lane code, time) tuples straight off a memory-mapped file
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            used = len(m) - (len(m) - offset) % RECORD_SIZE
+            view = memoryview(m)
+            try:
+                for rec in RECORD.iter_unpack(view[offset:used]):
+                    yield rec
+            finally:
+                view.release()
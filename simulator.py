@@ -1,624 +1,520 @@
 import tkinter as tk
 from tkinter import font
-import random
-import json
 import os
-from collections import deque
-import threading
 import time
+from collections import deque
+from engine import Junction, JunctionEngine
+from engine import DEPART, FREE
+from checkpoint import Checkpointer, restore_checkpoint
+from history import HistoryStore
+from ingest import LaneFileReader
+from layout import junction_bounds, junction_layout, network_centers, overlaps, road_of
+from live import LiveSimulation
+from metrics import MetricsCollector
+from monitor import serve_metrics
+from network import build_engine, grid_topology
+from records import FORMATS
+from tracing import TraceRecorder, TraceReplayer
+from traffic_generator import VehicleGenerator
+from transport import DEFAULT_ADDRESS, StreamReceiver
 
-# vehicle class
-class Vehicle:
-    def __init__(self, vid, lane):
-        self.id = vid
-        self.lane = lane
-        self.wait_time = 0
-        self.color = random.choice(['red', 'blue', 'green', 'yellow', 'orange', 'purple'])
-    
-    def to_dict(self):
-        return {'id': self.id, 'lane': self.lane}
+VISIBLE_VEHICLES = 8
+GRAPH_POINTS = 240  # history buckets across the stats panel graph, a pixel each
+GRAPH_COLORS = ['cyan', 'yellow', 'magenta', 'lightgreen', 'orange', 'white']
 
-# queue for vehicles
-class VehicleQueue:
-    def __init__(self, lane_name):
-        self.lane = lane_name
-        self.q = deque()
-    
-    def add_vehicle(self, v):
-        self.q.append(v)
-    
-    def remove_vehicle(self):
-        if len(self.q) > 0:
-            return self.q.popleft()
-        return None
-    
-    def size(self):
-        return len(self.q)
-    
-    def get_all(self):
-        return list(self.q)
+def span_text(seconds):
+    if seconds < 3600:
+        return f"{seconds // 60} min"
+    if seconds < 86400:
+        return f"{seconds // 3600} h"
+    return f"{seconds // 86400} days"
 
-# priority queue for lanes
-class LaneQueue:
-    def __init__(self):
-        self.lanes = []
-    
-    def add_lane(self, lane_name, q, priority=0):
-        self.lanes.append([priority, lane_name, q])
-    
-    def update_priority(self, lane_name, new_priority):
-        for lane_data in self.lanes:
-            if lane_data[1] == lane_name:
-                lane_data[0] = new_priority
-                break
-    
-    def get_next_lane(self):
-        # sort by priority then size
-        self.lanes.sort(key=lambda x: (-x[0], -x[2].size()))
-        if len(self.lanes) > 0:
-            return self.lanes[0]
-        return None
+# console output for the live simulator
+def print_events(engine, kind, data):
+    if kind == DEPART:
+        print(f"Served: {data.id} from {data.lane}")
+    elif kind == FREE:
+        print(f"Free left turn: {data.id} from {data.lane}")
 
-# traffic light
-class TrafficLight:
-    def __init__(self):
-        self.state = 1  # 1=red, 2=green
-        self.current_lane = None
-    
-    def set_green(self, lane):
-        self.state = 2
-        self.current_lane = lane
-    
-    def set_red(self):
-        self.state = 1
-        self.current_lane = None
+# canvas items for one junction, all placed from its layout table. tagged
+# with the junction so it can be moved or deleted in one go
+class JunctionView:
+    def __init__(self, canvas, junction, layout, dx, dy):
+        self.canvas = canvas
+        self.junction = junction
+        self.layout = layout
+        self.tag = f"junction:{junction.name}"
+        # vehicle ids and light labels only fit when drawn near full size
+        self.labels = layout.scale >= 0.6
+        self.draw_road(dx, dy)
+        self.create_vehicle_slots(dx, dy)
+        self.create_traffic_lights(dx, dy)
+
+    def shift(self, points, dx, dy):
+        # world -> screen coordinates for a flat (x, y, x, y, ...) sequence
+        return [p - (dx if i % 2 == 0 else dy) for i, p in enumerate(points)]
+
+    def draw_road(self, dx, dy):
+        # static - junction box, road surfaces and lane dividers
+        for road, polygon, dividers in self.layout.roads:
+            points = [c for point in polygon for c in point]
+            self.canvas.create_polygon(*self.shift(points, dx, dy), fill='gray', outline='white', tags=self.tag)
+            for line in dividers:
+                self.canvas.create_line(*self.shift(line, dx, dy), fill='yellow', width=4,
+                                        dash=(20, 20), tags=self.tag)
+        self.canvas.create_rectangle(*self.shift(self.layout.box, dx, dy), fill='#404040',
+                                     outline='white', tags=self.tag)
+
+    def create_vehicle_slots(self, dx, dy):
+        # 8 hidden rectangle+text pairs per lane, moved into place once
+        self.vehicle_slots = {}
+        self.lane_shown = {}
+        for lane, lane_layout in self.layout.lanes.items():
+            slots = []
+            for idx in range(VISIBLE_VEHICLES):
+                x1, y1, x2, y2 = self.shift(lane_layout.slot_box(idx), dx, dy)
+                rect = self.canvas.create_rectangle(x1, y1, x2, y2, fill='gray', outline='black',
+                                                    width=2, state='hidden', tags=self.tag)
+                text = self.canvas.create_text((x1 + x2) // 2, (y1 + y2) // 2, text='', fill='black',
+                                               font=('Arial', 8), state='hidden', tags=self.tag)
+                slots.append((rect, text))
+            self.vehicle_slots[lane] = slots
+            self.lane_shown[lane] = []
+        self.lane_versions = {}  # lane -> queue version last drawn
 
+    def create_traffic_lights(self, dx, dy):
+        # only lanes with a light in the layout get one
+        self.light_items = {}
+        for lane, lane_layout in self.layout.lanes.items():
+            if lane_layout.light is None:
+                continue
+            oval = self.canvas.create_oval(*self.shift(lane_layout.light, dx, dy), fill='red',
+                                           outline='white', width=3, tags=self.tag)
+            if self.labels:
+                self.canvas.create_text(*self.shift(lane_layout.label, dx, dy), text=lane, fill='white',
+                                        font=('Arial', 11, 'bold'), tags=self.tag)
+            self.light_items[lane] = [oval, 'red']
+
+    def draw(self):
+        self.draw_vehicles()
+        self.draw_traffic_lights()
+
+    def draw_vehicles(self):
+        # only touch a lane's items when the front of its queue changed
+        for lane, slots in self.vehicle_slots.items():
+            q = self.junction.queues[lane]
+            if self.lane_versions.get(lane) == q.version:
+                continue  # nothing happened on this lane since the last frame
+            self.lane_versions[lane] = q.version
+            vehicles = q.head(VISIBLE_VEHICLES)
+            shown = [(v.id, v.color) for v in vehicles]
+            if shown == self.lane_shown[lane]:
+                continue
+            old = self.lane_shown[lane]
+            for idx, (rect, text) in enumerate(slots):
+                if idx < len(shown):
+                    if idx >= len(old) or old[idx] != shown[idx]:
+                        vid, color = shown[idx]
+                        self.canvas.itemconfigure(rect, fill=color, state='normal')
+                        if self.labels:
+                            self.canvas.itemconfigure(text, text=vid[-3:], state='normal')
+                elif idx < len(old):
+                    self.canvas.itemconfigure(rect, state='hidden')
+                    self.canvas.itemconfigure(text, state='hidden')
+            self.lane_shown[lane] = shown
+
+    def draw_traffic_lights(self):
+        for lane, item in self.light_items.items():
+            light_color = 'green' if self.junction.lights.current_lane == lane else 'red'
+            if item[1] != light_color:
+                self.canvas.itemconfigure(item[0], fill=light_color)
+                item[1] = light_color
+
+    def move(self, dx, dy):
+        self.canvas.move(self.tag, dx, dy)
+
+    def delete(self):
+        self.canvas.delete(self.tag)
+
+# tkinter view - only reads engine state, the engine doesn't know about it
+#
+# one junction is drawn in the middle of the window. a network is laid out on
+# a grid in world coordinates and culled to the viewport: only junctions whose
+# area overlaps the window have canvas items, the arrow keys pan and clicking
+# a junction shows its lanes in the stats panel
 class TrafficSimulator:
-    def __init__(self, root):
+    def __init__(self, root, live, scale=1.0):
         self.root = root
-        self.root.title("Traffic Junction Simulator - 12 Lanes")
+        self.live = live
+        self.engine = live.engine
+        self.scale = scale
+        self.width = 1400
+        self.height = 850
+        if len(self.engine.junctions) > 1:
+            self.root.title(f"Traffic Junction Simulator - {len(self.engine.junctions)} Junctions")
+        else:
+            self.root.title(f"Traffic Junction Simulator - {len(self.engine.junction.queues)} Lanes")
         self.root.geometry("1400x900")
         self.root.configure(bg='black')
         
         # canvas for drawing
-        self.canvas = tk.Canvas(root, width=1400, height=850, bg='black', highlightthickness=0)
+        self.canvas = tk.Canvas(root, width=self.width, height=self.height, bg='black', highlightthickness=0)
         self.canvas.pack()
         
-        # 12 queues - 3 lanes per road (only lane 2 matters for traffic lights)
-        # Road A (top)
-        self.al1_queue = VehicleQueue("AL1")  # incoming
-        self.al2_queue = VehicleQueue("AL2")  # priority lane - needs light
-        self.al3_queue = VehicleQueue("AL3")  # free left turn lane
-        
-        # Road B (left)
-        self.bl1_queue = VehicleQueue("BL1")  # incoming
-        self.bl2_queue = VehicleQueue("BL2")  # needs light
-        self.bl3_queue = VehicleQueue("BL3")  # free left turn
-        
-        # Road C (bottom)
-        self.cl1_queue = VehicleQueue("CL1")  # incoming
-        self.cl2_queue = VehicleQueue("CL2")  # needs light
-        self.cl3_queue = VehicleQueue("CL3")  # free left turn
-        
-        # Road D (right)
-        self.dl1_queue = VehicleQueue("DL1")  # incoming
-        self.dl2_queue = VehicleQueue("DL2")  # needs light
-        self.dl3_queue = VehicleQueue("DL3")  # free left turn
-        
-        # lane priority queue - only for lane 2s that need traffic lights
-        self.lane_q = LaneQueue()
-        self.lane_q.add_lane("AL2", self.al2_queue, priority=0)  # priority lane
-        self.lane_q.add_lane("BL2", self.bl2_queue, priority=0)
-        self.lane_q.add_lane("CL2", self.cl2_queue, priority=0)
-        self.lane_q.add_lane("DL2", self.dl2_queue, priority=0)
-        
-        self.lights = TrafficLight()
-        self.running = True
-        
-        # timing stuff
-        self.last_load_time = time.time()
-        self.last_serve_time = time.time()
-        self.serving = False
-        self.serve_count = 0
-        self.vehicles_to_serve = 0
-        self.current_serving_lane = None
-        
-        self.is_priority_mode = False
-        self.total_served = 0
-        
-        # start background threads
-        self.start_background_tasks()
+        # retained mode - everything is created once and only updated when
+        # the value behind it changes, instead of delete("all") every frame
+        self.centers = network_centers(list(self.engine.junctions), scale=scale)
+        self.offset = [0, 0]  # world position of the window's top left corner
+        self.views = {}       # junction name -> JunctionView, only for what's on screen
+        self.focus = self.engine.junction  # junction in the stats panel
+        self.panel = self.canvas.create_rectangle(20, 20, 300, 500, fill='#323232', outline='white',
+                                                  width=2, tags='panel')
+        self.stat_items = {}  # key -> [item id, last (x, y, text, fill, font, anchor)]
+        self.frame_times = deque(maxlen=100)
+        self.graph_items = {}    # history graph lines, created on first use
+        self.graph_key = None    # what the graph last showed, None = hidden
+        self.graph_peak = 0
+        self.history_view = 0    # which history tier the graph shows
+        self.update_views()
+        
+        step = 200
+        self.root.bind('<Left>', lambda e: self.pan(-step, 0))
+        self.root.bind('<Right>', lambda e: self.pan(step, 0))
+        self.root.bind('<Up>', lambda e: self.pan(0, -step))
+        self.root.bind('<Down>', lambda e: self.pan(0, step))
+        self.canvas.bind('<Button-1>', self.on_click)
+        self.root.bind('<h>', self.zoom_history)
         
         # start drawing loop
         self.draw()
-        
-    def start_background_tasks(self):
-        # thread for loading vehicles
-        def load_loop():
-            while self.running:
-                self.load_vehicles_from_file()
-                time.sleep(2)
-        
-        # thread for serving vehicles
-        def serve_loop():
-            while self.running:
-                self.update_serving()
-                time.sleep(0.5)
-        
-        # thread for free lanes (L3s can go anytime)
-        def free_lane_loop():
-            while self.running:
-                # AL3, BL3, CL3, DL3 can turn left freely without waiting
-                for q in [self.al3_queue, self.bl3_queue, self.cl3_queue, self.dl3_queue]:
-                    if q.size() > 0:
-                        v = q.remove_vehicle()
-                        if v:
-                            self.total_served += 1
-                            print(f"Free left turn: {v.id} from {q.lane}")
-                time.sleep(2)
-        
-        load_thread = threading.Thread(target=load_loop, daemon=True)
-        serve_thread = threading.Thread(target=serve_loop, daemon=True)
-        free_thread = threading.Thread(target=free_lane_loop, daemon=True)
-        
-        load_thread.start()
-        serve_thread.start()
-        free_thread.start()
-        
-    def load_vehicles_from_file(self):
-        # read vehicle data from files
-        files = {
-            "lanea.txt": [self.al1_queue, self.al2_queue, self.al3_queue],
-            "laneb.txt": [self.bl1_queue, self.bl2_queue, self.bl3_queue],
-            "lanec.txt": [self.cl1_queue, self.cl2_queue, self.cl3_queue],
-            "laned.txt": [self.dl1_queue, self.dl2_queue, self.dl3_queue]
-        }
-        
-        for fname, queues in files.items():
-            if os.path.exists(fname):
-                try:
-                    with open(fname, 'r') as f:
-                        lines = f.readlines()
-                        for line in lines:
-                            line = line.strip()
-                            if line:
-                                data = json.loads(line)
-                                v = Vehicle(data['id'], data['lane'])
-                                # distribute to the appropriate lane queue
-                                if 'L1' in data['lane']:
-                                    queues[0].add_vehicle(v)
-                                elif 'L2' in data['lane']:
-                                    queues[1].add_vehicle(v)
-                                elif 'L3' in data['lane']:
-                                    queues[2].add_vehicle(v)
-                    # clear file
-                    open(fname, 'w').close()
-                except:
-                    pass
     
-    def calc_vehicles_to_serve(self):
-        # calculate average based on normal lanes (excluding AL2 if priority)
-        normal_lanes = []
-        
-        al2_size = self.al2_queue.size()
-        if al2_size <= 5:
-            normal_lanes.append(al2_size)
-        
-        normal_lanes.append(self.bl2_queue.size())
-        normal_lanes.append(self.cl2_queue.size())
-        normal_lanes.append(self.dl2_queue.size())
-        
-        if len(normal_lanes) > 0:
-            avg = sum(normal_lanes) / len(normal_lanes)
-            return max(1, int(avg))
-        return 1
+    def update_views(self):
+        # build views for junctions that came on screen, drop the ones that left
+        ox, oy = self.offset
+        viewport = (ox, oy, ox + self.width, oy + self.height)
+        for name, center in self.centers.items():
+            on_screen = overlaps(junction_bounds(center, self.scale), viewport)
+            if on_screen and name not in self.views:
+                j = self.engine.junctions[name]
+                self.views[name] = JunctionView(self.canvas, j, junction_layout(j, center, self.scale), ox, oy)
+            elif not on_screen and name in self.views:
+                self.views.pop(name).delete()
+        self.canvas.tag_raise('panel')
     
-    def check_priority_condition(self):
-        al2_size = self.al2_queue.size()
-        if al2_size > 10:
-            self.lane_q.update_priority("AL2", 100)
-            self.is_priority_mode = True
-            return True
-        elif al2_size < 5:
-            self.lane_q.update_priority("AL2", 0)
-            self.is_priority_mode = False
-            return False
-        return self.is_priority_mode
+    def pan(self, dx, dy):
+        with self.engine.lock:
+            self.offset[0] += dx
+            self.offset[1] += dy
+            for view in self.views.values():
+                view.move(-dx, -dy)
+            self.update_views()
     
-    def update_serving(self):
-        current_time = time.time()
+    def on_click(self, event):
+        # focus the junction nearest the click
+        x, y = event.x + self.offset[0], event.y + self.offset[1]
+        name = min(self.views, key=lambda n: (self.centers[n][0] - x) ** 2 + (self.centers[n][1] - y) ** 2,
+                   default=None)
+        if name is not None:
+            self.focus = self.engine.junctions[name]
+        
+    def zoom_history(self, event=None):
+        # the graph steps through 1 s, 1 min and 1 h buckets
+        history = getattr(self.live, "history", None)
+        if history is not None:
+            self.history_view = (self.history_view + 1) % len(history.tiers)
         
-        if not self.serving:
-            # check priority
-            self.check_priority_condition()
-            
-            # get next lane to serve
-            next_lane_data = self.lane_q.get_next_lane()
-            
-            if next_lane_data and next_lane_data[2].size() > 0:
-                lane_name = next_lane_data[1]
-                priority = next_lane_data[0]
-                
-                # set green light
-                self.lights.set_green(lane_name)
-                self.current_serving_lane = next_lane_data
-                
-                # calc how many to serve
-                if lane_name == "AL2" and priority > 0:
-                    self.vehicles_to_serve = max(0, next_lane_data[2].size() - 4)
-                else:
-                    self.vehicles_to_serve = self.calc_vehicles_to_serve()
-                
-                self.serve_count = 0
-                self.serving = True
-                self.last_serve_time = current_time
-        else:
-            # serving in progress
-            if current_time - self.last_serve_time > 1.5:
-                if self.serve_count < self.vehicles_to_serve:
-                    if self.current_serving_lane[2].size() > 0:
-                        v = self.current_serving_lane[2].remove_vehicle()
-                        if v:
-                            self.serve_count += 1
-                            self.total_served += 1
-                            print(f"Served: {v.id} from {self.current_serving_lane[1]}")
-                    else:
-                        self.serving = False
-                        self.lights.set_red()
-                else:
-                    self.serving = False
-                    self.lights.set_red()
-                
-                self.last_serve_time = current_time
-    
     def draw(self):
-        self.canvas.delete("all")
+        start = time.perf_counter()
         
-        self.draw_road()
-        self.draw_vehicles()
-        self.draw_traffic_lights()
-        self.draw_stats()
+        # hold the engine lock so queues don't change under us mid-frame
+        with self.engine.lock:
+            for view in self.views.values():
+                view.draw()
+            self.draw_stats()
+        
+        self.frame_times.append(time.perf_counter() - start)
         
         # redraw every 100ms
         self.root.after(100, self.draw)
     
-    def draw_road(self):
-        center_x = 700
-        center_y = 425
-        junction_size = 200
-        road_width = 180  # wider for 3 lanes
-        
-        # junction box
-        self.canvas.create_rectangle(
-            center_x - junction_size//2, center_y - junction_size//2,
-            center_x + junction_size//2, center_y + junction_size//2,
-            fill='#404040', outline='white'
-        )
-        
-        # Road A - Top
-        self.canvas.create_rectangle(
-            center_x - road_width//2, 0,
-            center_x + road_width//2, center_y - junction_size//2,
-            fill='gray', outline='white'
-        )
-        
-        # Road B - Left
-        self.canvas.create_rectangle(
-            0, center_y - road_width//2,
-            center_x - junction_size//2, center_y + road_width//2,
-            fill='gray', outline='white'
-        )
-        
-        # Road C - Bottom
-        self.canvas.create_rectangle(
-            center_x - road_width//2, center_y + junction_size//2,
-            center_x + road_width//2, 850,
-            fill='gray', outline='white'
-        )
-        
-        # Road D - Right
-        self.canvas.create_rectangle(
-            center_x + junction_size//2, center_y - road_width//2,
-            1400, center_y + road_width//2,
-            fill='gray', outline='white'
-        )
-        
-        # lane dividers - show 3 lanes clearly
-        lane_div = road_width // 3
-        
-        # vertical lane dividers for A and C
-        for offset in [-lane_div, lane_div]:
-            for i in range(0, 850, 40):
-                self.canvas.create_rectangle(
-                    center_x + offset - 2, i, 
-                    center_x + offset + 2, i + 20,
-                    fill='yellow', outline=''
-                )
-        
-        # horizontal lane dividers for B and D
-        for offset in [-lane_div, lane_div]:
-            for i in range(0, 1400, 40):
-                self.canvas.create_rectangle(
-                    i, center_y + offset - 2,
-                    i + 20, center_y + offset + 2,
-                    fill='yellow', outline=''
-                )
-    
-    def draw_vehicles(self):
-        center_x = 700
-        center_y = 425
-        lane_width = 60
-        
-        # Road A - top (3 lanes: L1, L2, L3)
-        # AL1 - left lane
-        vehicles = self.al1_queue.get_all()
-        for idx, v in enumerate(vehicles[:8]):
-            y_pos = center_y - 300 + (idx * 30)
-            self.canvas.create_rectangle(
-                center_x - 75, y_pos, center_x - 45, y_pos + 25,
-                fill=v.color, outline='black', width=2
-            )
-            self.canvas.create_text(center_x - 60, y_pos + 12, text=v.id[-3:], fill='black', font=('Arial', 8))
-        
-        # AL2 - middle lane (PRIORITY)
-        vehicles = self.al2_queue.get_all()
-        for idx, v in enumerate(vehicles[:8]):
-            y_pos = center_y - 300 + (idx * 30)
-            self.canvas.create_rectangle(
-                center_x - 15, y_pos, center_x + 15, y_pos + 25,
-                fill=v.color, outline='black', width=2
-            )
-            self.canvas.create_text(center_x, y_pos + 12, text=v.id[-3:], fill='black', font=('Arial', 8))
-        
-        # AL3 - right lane (free left)
-        vehicles = self.al3_queue.get_all()
-        for idx, v in enumerate(vehicles[:8]):
-            y_pos = center_y - 300 + (idx * 30)
-            self.canvas.create_rectangle(
-                center_x + 45, y_pos, center_x + 75, y_pos + 25,
-                fill=v.color, outline='black', width=2
-            )
-            self.canvas.create_text(center_x + 60, y_pos + 12, text=v.id[-3:], fill='black', font=('Arial', 8))
-        
-        # Road B - left (3 lanes)
-        # BL1
-        vehicles = self.bl1_queue.get_all()
-        for idx, v in enumerate(vehicles[:8]):
-            x_pos = center_x - 300 + (idx * 30)
-            self.canvas.create_rectangle(
-                x_pos, center_y - 75, x_pos + 25, center_y - 45,
-                fill=v.color, outline='black', width=2
-            )
-            self.canvas.create_text(x_pos + 12, center_y - 60, text=v.id[-3:], fill='black', font=('Arial', 8))
-        
-        # BL2
-        vehicles = self.bl2_queue.get_all()
-        for idx, v in enumerate(vehicles[:8]):
-            x_pos = center_x - 300 + (idx * 30)
-            self.canvas.create_rectangle(
-                x_pos, center_y - 15, x_pos + 25, center_y + 15,
-                fill=v.color, outline='black', width=2
-            )
-            self.canvas.create_text(x_pos + 12, center_y, text=v.id[-3:], fill='black', font=('Arial', 8))
-        
-        # BL3
-        vehicles = self.bl3_queue.get_all()
-        for idx, v in enumerate(vehicles[:8]):
-            x_pos = center_x - 300 + (idx * 30)
-            self.canvas.create_rectangle(
-                x_pos, center_y + 45, x_pos + 25, center_y + 75,
-                fill=v.color, outline='black', width=2
-            )
-            self.canvas.create_text(x_pos + 12, center_y + 60, text=v.id[-3:], fill='black', font=('Arial', 8))
-        
-        # Road C - bottom (3 lanes)
-        # CL1
-        vehicles = self.cl1_queue.get_all()
-        for idx, v in enumerate(vehicles[:8]):
-            y_pos = center_y + 300 - (idx * 30)
-            self.canvas.create_rectangle(
-                center_x + 45, y_pos, center_x + 75, y_pos + 25,
-                fill=v.color, outline='black', width=2
-            )
-            self.canvas.create_text(center_x + 60, y_pos + 12, text=v.id[-3:], fill='black', font=('Arial', 8))
-        
-        # CL2
-        vehicles = self.cl2_queue.get_all()
-        for idx, v in enumerate(vehicles[:8]):
-            y_pos = center_y + 300 - (idx * 30)
-            self.canvas.create_rectangle(
-                center_x - 15, y_pos, center_x + 15, y_pos + 25,
-                fill=v.color, outline='black', width=2
-            )
-            self.canvas.create_text(center_x, y_pos + 12, text=v.id[-3:], fill='black', font=('Arial', 8))
-        
-        # CL3
-        vehicles = self.cl3_queue.get_all()
-        for idx, v in enumerate(vehicles[:8]):
-            y_pos = center_y + 300 - (idx * 30)
-            self.canvas.create_rectangle(
-                center_x - 75, y_pos, center_x - 45, y_pos + 25,
-                fill=v.color, outline='black', width=2
-            )
-            self.canvas.create_text(center_x - 60, y_pos + 12, text=v.id[-3:], fill='black', font=('Arial', 8))
-        
-        # Road D - right (3 lanes)
-        # DL1
-        vehicles = self.dl1_queue.get_all()
-        for idx, v in enumerate(vehicles[:8]):
-            x_pos = center_x + 300 - (idx * 30)
-            self.canvas.create_rectangle(
-                x_pos, center_y + 45, x_pos + 25, center_y + 75,
-                fill=v.color, outline='black', width=2
-            )
-            self.canvas.create_text(x_pos + 12, center_y + 60, text=v.id[-3:], fill='black', font=('Arial', 8))
-        
-        # DL2
-        vehicles = self.dl2_queue.get_all()
-        for idx, v in enumerate(vehicles[:8]):
-            x_pos = center_x + 300 - (idx * 30)
-            self.canvas.create_rectangle(
-                x_pos, center_y - 15, x_pos + 25, center_y + 15,
-                fill=v.color, outline='black', width=2
-            )
-            self.canvas.create_text(x_pos + 12, center_y, text=v.id[-3:], fill='black', font=('Arial', 8))
-        
-        # DL3
-        vehicles = self.dl3_queue.get_all()
-        for idx, v in enumerate(vehicles[:8]):
-            x_pos = center_x + 300 - (idx * 30)
-            self.canvas.create_rectangle(
-                x_pos, center_y - 75, x_pos + 25, center_y - 45,
-                fill=v.color, outline='black', width=2
-            )
-            self.canvas.create_text(x_pos + 12, center_y - 60, text=v.id[-3:], fill='black', font=('Arial', 8))
+    def frame_stats(self):
+        # (average, worst) frame time in ms over the last 100 frames
+        if len(self.frame_times) == 0:
+            return 0.0, 0.0
+        return (sum(self.frame_times) / len(self.frame_times) * 1000, max(self.frame_times) * 1000)
     
-    def draw_traffic_lights(self):
-        center_x = 700
-        center_y = 425
-        
-        # only lane 2s have traffic lights
-        # AL2 light - top
-        light_color = 'green' if self.lights.current_lane == "AL2" else 'red'
-        self.canvas.create_oval(
-            center_x - 20, center_y - 135,
-            center_x + 20, center_y - 95,
-            fill=light_color, outline='white', width=3
-        )
-        self.canvas.create_text(center_x, center_y - 80, text="AL2", fill='white', font=('Arial', 11, 'bold'))
-        
-        # BL2 light - left
-        light_color = 'green' if self.lights.current_lane == "BL2" else 'red'
-        self.canvas.create_oval(
-            center_x - 135, center_y - 20,
-            center_x - 95, center_y + 20,
-            fill=light_color, outline='white', width=3
-        )
-        self.canvas.create_text(center_x - 80, center_y, text="BL2", fill='white', font=('Arial', 11, 'bold'))
-        
-        # CL2 light - bottom
-        light_color = 'green' if self.lights.current_lane == "CL2" else 'red'
-        self.canvas.create_oval(
-            center_x - 20, center_y + 95,
-            center_x + 20, center_y + 135,
-            fill=light_color, outline='white', width=3
-        )
-        self.canvas.create_text(center_x, center_y + 150, text="CL2", fill='white', font=('Arial', 11, 'bold'))
-        
-        # DL2 light - right
-        light_color = 'green' if self.lights.current_lane == "DL2" else 'red'
-        self.canvas.create_oval(
-            center_x + 95, center_y - 20,
-            center_x + 135, center_y + 20,
-            fill=light_color, outline='white', width=3
-        )
-        self.canvas.create_text(center_x + 150, center_y, text="DL2", fill='white', font=('Arial', 11, 'bold'))
+    def put_text(self, key, x, y, text, fill, font, anchor='center'):
+        # create the text item the first time, afterwards only update what changed
+        spec = (x, y, text, fill, font, anchor)
+        item = self.stat_items.get(key)
+        if item is None:
+            item_id = self.canvas.create_text(x, y, text=text, fill=fill, font=font, anchor=anchor, tags='panel')
+            self.stat_items[key] = [item_id, spec]
+        else:
+            item_id, old = item
+            if old != spec:
+                if old is None or old[:2] != spec[:2]:
+                    self.canvas.coords(item_id, x, y)
+                self.canvas.itemconfigure(item_id, text=text, fill=fill, font=font, anchor=anchor, state='normal')
+                item[1] = spec
+        self.stats_touched.add(key)
     
     def draw_stats(self):
-        # stats panel
+        # stats panel for the focused junction, one row per lane in its layout
+        j = self.focus
         panel_x = 20
         panel_y = 20
-        panel_width = 280
-        panel_height = 480
-        
-        self.canvas.create_rectangle(
-            panel_x, panel_y, panel_x + panel_width, panel_y + panel_height,
-            fill='#323232', outline='white', width=2
-        )
+        self.stats_touched = set()
         
         # title
-        self.canvas.create_text(
-            panel_x + 140, panel_y + 25,
-            text="TRAFFIC STATUS", fill='yellow',
-            font=('Arial', 16, 'bold')
-        )
-        
-        self.canvas.create_text(
-            panel_x + 140, panel_y + 45,
-            text="(12 Lanes Total)", fill='cyan',
-            font=('Arial', 10)
-        )
+        self.put_text("title", panel_x + 140, panel_y + 25, "TRAFFIC STATUS", 'yellow', ('Arial', 16, 'bold'))
+        if len(self.engine.junctions) > 1:
+            subtitle = f"{j.name} ({len(j.queues)} Lanes)"
+        else:
+            subtitle = f"({len(j.queues)} Lanes Total)"
+        self.put_text("subtitle", panel_x + 140, panel_y + 45, subtitle, 'cyan', ('Arial', 10))
         
         y_offset = 75
         
-        # Road A stats
-        self.canvas.create_text(panel_x + 20, panel_y + y_offset, text="ROAD A:", fill='cyan', font=('Arial', 12, 'bold'), anchor='w')
-        y_offset += 25
-        
-        self.canvas.create_text(panel_x + 30, panel_y + y_offset, text=f"AL1: {self.al1_queue.size()}", fill='white', font=('Arial', 10), anchor='w')
-        y_offset += 20
-        
-        al2_color = 'orange' if self.is_priority_mode else 'white'
-        self.canvas.create_text(panel_x + 30, panel_y + y_offset, text=f"AL2: {self.al2_queue.size()} (Priority)", fill=al2_color, font=('Arial', 10), anchor='w')
-        if self.is_priority_mode:
-            self.canvas.create_text(panel_x + 35, panel_y + y_offset + 15, text="[PRIORITY MODE]", fill='red', font=('Arial', 9), anchor='w')
-            y_offset += 15
-        y_offset += 20
-        
-        self.canvas.create_text(panel_x + 30, panel_y + y_offset, text=f"AL3: {self.al3_queue.size()} (Free L)", fill='lightgreen', font=('Arial', 10), anchor='w')
-        y_offset += 30
-        
-        # Road B stats
-        self.canvas.create_text(panel_x + 20, panel_y + y_offset, text="ROAD B:", fill='cyan', font=('Arial', 12, 'bold'), anchor='w')
-        y_offset += 25
-        self.canvas.create_text(panel_x + 30, panel_y + y_offset, text=f"BL1: {self.bl1_queue.size()}", fill='white', font=('Arial', 10), anchor='w')
-        y_offset += 20
-        self.canvas.create_text(panel_x + 30, panel_y + y_offset, text=f"BL2: {self.bl2_queue.size()}", fill='white', font=('Arial', 10), anchor='w')
-        y_offset += 20
-        self.canvas.create_text(panel_x + 30, panel_y + y_offset, text=f"BL3: {self.bl3_queue.size()} (Free L)", fill='lightgreen', font=('Arial', 10), anchor='w')
-        y_offset += 30
-        
-        # Road C stats
-        self.canvas.create_text(panel_x + 20, panel_y + y_offset, text="ROAD C:", fill='cyan', font=('Arial', 12, 'bold'), anchor='w')
-        y_offset += 25
-        self.canvas.create_text(panel_x + 30, panel_y + y_offset, text=f"CL1: {self.cl1_queue.size()}", fill='white', font=('Arial', 10), anchor='w')
-        y_offset += 20
-        self.canvas.create_text(panel_x + 30, panel_y + y_offset, text=f"CL2: {self.cl2_queue.size()}", fill='white', font=('Arial', 10), anchor='w')
-        y_offset += 20
-        self.canvas.create_text(panel_x + 30, panel_y + y_offset, text=f"CL3: {self.cl3_queue.size()} (Free L)", fill='lightgreen', font=('Arial', 10), anchor='w')
-        y_offset += 30
-        
-        # Road D stats
-        self.canvas.create_text(panel_x + 20, panel_y + y_offset, text="ROAD D:", fill='cyan', font=('Arial', 12, 'bold'), anchor='w')
-        y_offset += 25
-        self.canvas.create_text(panel_x + 30, panel_y + y_offset, text=f"DL1: {self.dl1_queue.size()}", fill='white', font=('Arial', 10), anchor='w')
-        y_offset += 20
-        self.canvas.create_text(panel_x + 30, panel_y + y_offset, text=f"DL2: {self.dl2_queue.size()}", fill='white', font=('Arial', 10), anchor='w')
-        y_offset += 20
-        self.canvas.create_text(panel_x + 30, panel_y + y_offset, text=f"DL3: {self.dl3_queue.size()} (Free L)", fill='lightgreen', font=('Arial', 10), anchor='w')
-        y_offset += 35
+        lanes_by_road = {}
+        for lane in j.queues:
+            lanes_by_road.setdefault(road_of(lane), []).append(lane)
+        for road in j.roads:
+            self.put_text(f"road{road}", panel_x + 20, panel_y + y_offset, f"ROAD {road}:", 'cyan', ('Arial', 12, 'bold'), 'w')
+            y_offset += 25
+            
+            for lane in lanes_by_road.get(road, []):
+                size = j.queues[lane].size()
+                if lane == j.priority_lane:
+                    lane_color = 'orange' if j.is_priority_mode else 'white'
+                    self.put_text(lane, panel_x + 30, panel_y + y_offset, f"{lane}: {size} (Priority)", lane_color, ('Arial', 10), 'w')
+                    if j.is_priority_mode:
+                        self.put_text("priority", panel_x + 35, panel_y + y_offset + 15, "[PRIORITY MODE]", 'red', ('Arial', 9), 'w')
+                        y_offset += 15
+                elif lane in j.free_lanes:
+                    self.put_text(lane, panel_x + 30, panel_y + y_offset, f"{lane}: {size} (Free L)", 'lightgreen', ('Arial', 10), 'w')
+                else:
+                    self.put_text(lane, panel_x + 30, panel_y + y_offset, f"{lane}: {size}", 'white', ('Arial', 10), 'w')
+                y_offset += 20
+            y_offset += 10
+        y_offset += 5
         
         # current light status
-        if self.lights.current_lane:
-            status_text = f"GREEN: {self.lights.current_lane}"
+        if j.lights.current_lane:
+            status_text = f"GREEN: {j.lights.current_lane}"
             status_color = 'green'
         else:
             status_text = "All RED"
             status_color = 'red'
-        
-        self.canvas.create_text(
-            panel_x + 20, panel_y + y_offset,
-            text=status_text, fill=status_color,
-            font=('Arial', 12, 'bold'), anchor='w'
-        )
+        self.put_text("status", panel_x + 20, panel_y + y_offset, status_text, status_color, ('Arial', 12, 'bold'), 'w')
         y_offset += 25
         
         # total served
-        self.canvas.create_text(
-            panel_x + 20, panel_y + y_offset,
-            text=f"Total Served: {self.total_served}",
-            fill='white', font=('Arial', 11), anchor='w'
-        )
+        self.put_text("served", panel_x + 20, panel_y + y_offset, f"Total Served: {self.engine.total_served}", 'white', ('Arial', 11), 'w')
+        y_offset += 20
+        if j.capacity is not None:
+            self.put_text("rejected", panel_x + 20, panel_y + y_offset,
+                          f"Rejected: {sum(j.rejected.values())}  Spilled: {sum(j.spilled.values())}", 'orange', ('Arial', 10), 'w')
+            y_offset += 20
+        if len(self.engine.junctions) > 1:
+            self.put_text("junction_served", panel_x + 20, panel_y + y_offset, f"{j.name} Served: {j.total_served}", 'white', ('Arial', 11), 'w')
+            y_offset += 20
+            self.put_text("views", panel_x + 20, panel_y + y_offset,
+                          f"Drawing {len(self.views)} of {len(self.engine.junctions)} junctions", 'gray', ('Arial', 9), 'w')
+            y_offset += 20
+        
+        # how long the last frames took to draw
+        avg_ms, worst_ms = self.frame_stats()
+        self.put_text("frame", panel_x + 20, panel_y + y_offset, f"Frame: {avg_ms:.2f}ms avg, {worst_ms:.2f}ms max", 'gray', ('Arial', 9), 'w')
+        y_offset += 20
+        
+        # history graph, if the focused junction is being sampled
+        history = getattr(self.live, "history", None)
+        if history is not None and j.name in history.junctions:
+            y_offset = self.draw_history(history, j, panel_x, panel_y + y_offset + 5) - panel_y
+        elif self.graph_key is not None:
+            for item in self.graph_items.values():
+                self.canvas.itemconfigure(item, state='hidden')
+            self.graph_key = None
+        
+        # panel grows with the number of lanes
+        bottom = max(500, panel_y + y_offset)
+        if self.canvas.coords(self.panel)[3] != bottom:
+            self.canvas.coords(self.panel, 20, 20, 300, bottom)
+        
+        # hide anything not drawn this frame (e.g. the priority mode line, or
+        # lanes of the junction that had focus before)
+        for key, item in self.stat_items.items():
+            if key not in self.stats_touched and item[1] is not None:
+                self.canvas.itemconfigure(item[0], state='hidden')
+                item[1] = None
+    
+    def draw_history(self, history, j, x, y):
+        # the light lanes' queue lengths over time, priority mode as a red
+        # strip underneath - only replotted when the tier finishes a bucket
+        tier = history.tiers[self.history_view]
+        self.put_text("history", x + 20, y, f"HISTORY - last {span_text(tier.step * GRAPH_POINTS)} (h: zoom)",
+                      'cyan', ('Arial', 10, 'bold'), 'w')
+        left, top = x + 20, y + 15
+        bottom = top + 70
+        key = (j.name, self.history_view, tier.last, top)
+        if key != self.graph_key:
+            self.graph_key = key
+            self.graph_peak = self.plot_history(history, tier, j, left, top, bottom)
+        self.put_text("history_peak", left + GRAPH_POINTS, top - 2, f"max {self.graph_peak:g}", 'gray',
+                      ('Arial', 8), 'ne')
+        for i, lane in enumerate(j.light_lanes):
+            self.put_text(f"history_{i}", left + i * 50, bottom + 22, lane, GRAPH_COLORS[i % len(GRAPH_COLORS)],
+                          ('Arial', 9), 'w')
+        self.put_text("history_priority", left + len(j.light_lanes) * 50, bottom + 22, "priority", 'red',
+                      ('Arial', 9), 'w')
+        return bottom + 35
+    
+    def plot_history(self, history, tier, j, left, top, bottom):
+        # newest bucket at the right edge, gaps (NaN) skipped
+        def points(values, base, height):
+            xs = left + GRAPH_POINTS - len(values)
+            return [c for k, v in enumerate(values) if v == v for c in (xs + k, base - v * height)]
+        
+        series = [tier.column(history.index[f"{j.name}/{lane}/queue"], GRAPH_POINTS)[1] for lane in j.light_lanes]
+        peak = max((v for values in series for v in values if v == v), default=0)
+        used = {"frame"}
+        self.graph_item("frame", self.canvas.create_rectangle, outline='#606060')
+        self.canvas.coords(self.graph_items["frame"], left - 1, top - 1, left + GRAPH_POINTS + 1, bottom + 1)
+        self.canvas.itemconfigure(self.graph_items["frame"], state='normal')
+        for i, values in enumerate(series):
+            used.add(i)
+            self.graph_line(i, points(values, bottom, (bottom - top) / (peak or 1)), GRAPH_COLORS[i % len(GRAPH_COLORS)])
+        priority = tier.column(history.index[f"{j.name}/priority"], GRAPH_POINTS)[1]
+        used.add("priority")
+        self.graph_line("priority", points(priority, bottom + 10, 6), 'red')
+        for key, item in self.graph_items.items():
+            if key not in used:
+                self.canvas.itemconfigure(item, state='hidden')
+        return round(peak, 1)
+    
+    def graph_item(self, key, create, **options):
+        if key not in self.graph_items:
+            self.graph_items[key] = create(0, 0, 0, 0, tags='panel', **options)
+    
+    def graph_line(self, key, points, color):
+        self.graph_item(key, self.canvas.create_line)
+        item = self.graph_items[key]
+        if len(points) < 4:
+            self.canvas.itemconfigure(item, state='hidden')  # not two buckets yet
+            return
+        self.canvas.coords(item, *points)
+        self.canvas.itemconfigure(item, fill=color, state='normal')
     
     def on_closing(self):
-        self.running = False
+        avg_ms, worst_ms = self.frame_stats()
+        print(f"Frame time: {avg_ms:.2f}ms avg, {worst_ms:.2f}ms max over the last {len(self.frame_times)} frames")
+        self.live.stop()
+        checkpointer = getattr(self.live, "checkpointer", None)
+        if checkpointer is not None:
+            checkpointer.close()  # one last snapshot
+            print(f"Checkpoint saved to {checkpointer.path}")
+        if self.live.reader is not None:
+            self.live.reader.close()
         self.root.destroy()
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Traffic junction simulator")
+    parser.add_argument("--format", choices=FORMATS, default="json", help="lane file format written by the generator")
+    parser.add_argument("--transport", choices=["file", "stream"], default="file", help="tail the lane files or listen on a socket")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="unix socket path or host:port for --transport stream")
+    parser.add_argument("--metrics", default=None, help="write per-lane wait percentiles to .json or .csv on exit")
+    parser.add_argument("--grid", default=None, help="ROWSxCOLS network fed by the engine's own generator instead of lane files")
+    parser.add_argument("--scale", type=float, default=1.0, help="drawing scale, e.g. 0.5 to fit more junctions on screen")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the --grid generator")
+    parser.add_argument("--trace", default=None, help="record everything the engine takes in and decides to this file")
+    parser.add_argument("--capacity", type=int, default=None, help="vehicles per lane before arrivals overflow")
+    parser.add_argument("--overflow", choices=["reject", "spill"], default="reject")
+    parser.add_argument("--compact", action="store_true", help="keep lane queues as number buffers")
+    parser.add_argument("--replay", default=None, help="play back a trace instead of running live")
+    parser.add_argument("--speed", type=float, default=1.0, help="engine seconds per wall second for --replay")
+    parser.add_argument("--checkpoint", default=None, help="snapshot the simulation to this file and resume from it on start")
+    parser.add_argument("--checkpoint-interval", type=float, default=30.0, help="seconds between snapshots")
+    parser.add_argument("--history", default=None, help="write the sampled history to .json or .csv on exit")
+    parser.add_argument("--history-step", type=int, choices=[1, 60, 3600], default=1, help="bucket seconds for a .csv history")
+    parser.add_argument("--history-junctions", default=None,
+                        help="comma separated junctions to sample, or 'all' (default: the first one)")
+    parser.add_argument("--serve-metrics", default=None, metavar="ADDRESS",
+                        help="serve prometheus metrics on host:port (e.g. 127.0.0.1:9108) or a unix socket path")
+    args = parser.parse_args()
+    
+    recorder = None
+    if args.replay:
+        live = TraceReplayer(args.replay)
+        engine = live.engine
+        engine.add_observer(print_events)
+    else:
+        reader = None
+        if args.grid:
+            rows, cols = (int(x) for x in args.grid.lower().split('x'))
+            engine = build_engine(grid_topology(rows, cols), capacity=args.capacity, overflow=args.overflow,
+                                  compact=args.compact)
+        else:
+            if args.transport == "stream":
+                reader = StreamReceiver(args.address)
+            else:
+                reader = LaneFileReader(fmt=args.format)
+            engine = JunctionEngine([Junction(capacity=args.capacity, overflow=args.overflow, compact=args.compact)])
+            engine.add_observer(print_events)
+        generators = [VehicleGenerator(make_files=False, seed=args.seed)] if args.grid else None
+        restored = args.checkpoint is not None and os.path.exists(args.checkpoint)
+        if restored:
+            # queues, lights, counters and lane file offsets as they were
+            restore_checkpoint(args.checkpoint, engine, reader, generators)
+            print(f"Resumed from {args.checkpoint} at {engine.clock:.1f}s, {engine.queued()} vehicles queued")
+            if args.trace:
+                parser.error("--trace needs a fresh start, not a resumed checkpoint")
+        # the recorder has to see the engine before anything goes into it
+        if args.trace:
+            recorder = TraceRecorder(engine, args.trace)
+        if args.grid and not restored:
+            for name in engine.junctions:
+                engine.attach_generator(generators[0], junction=name)
+        live = LiveSimulation(engine, reader)
+        if args.checkpoint:
+            live.checkpointer = Checkpointer(live, args.checkpoint, args.checkpoint_interval)
+        # ~2.4 MB per junction, so a grid only samples the first unless asked
+        if args.history_junctions == "all":
+            live.history = HistoryStore(engine)
+        else:
+            names = args.history_junctions.split(',') if args.history_junctions else [engine.junction.name]
+            for name in names:
+                if name not in engine.junctions:
+                    parser.error(f"no junction {name!r} to sample")
+            live.history = HistoryStore(engine, names)
+    metrics = MetricsCollector()
+    engine.add_observer(metrics)
+    if args.replay:
+        live.start(args.speed)
+    else:
+        live.start()
+    
+    metrics_server = serve_metrics(live, args.serve_metrics) if args.serve_metrics else None
+    
     root = tk.Tk()
-    app = TrafficSimulator(root)
+    app = TrafficSimulator(root, live, args.scale)
+    if metrics_server is not None:
+        metrics_server.exporter.app = app
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
-    root.mainloop()# edit
+    root.mainloop()
+    
+    if metrics_server is not None:
+        metrics_server.close()
+    if recorder is not None:
+        recorder.close()
+    history = getattr(live, "history", None)
+    if args.history and history is not None:
+        history.write(args.history, args.history_step)
+    metrics.print_table()
+    if args.metrics:
+        metrics.write(args.metrics)# edit
 # more
 # update
 # change
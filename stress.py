@@ -0,0 +1,89 @@
+import argparse
+import threading
+import time
+from engine import Junction, JunctionEngine, Vehicle
+from traffic_generator import VehicleGenerator
+
+# pushes vehicles through the live threading setup as hard as it can:
+#   loader thread  -> engine.arrive_many() batches (like LiveSimulation's ingest)
+#   engine thread  -> run_until() on a virtual clock with very short service times,
+#                     in short slices so the reader gets the lock in between
+#   reader thread  -> takes the lock and copies every queue (like the tkinter draw)
+# then checks nothing was lost or double counted: generated = served + queued + rejected
+
+def stress(total, batch_cycles=20, serve_interval=0.001, free_interval=0.001, capacity=None, step=0.1,
+           limit=1000, min_frames=100):
+    engine = JunctionEngine([Junction(capacity=capacity)], serve_interval=serve_interval,
+                            free_interval=free_interval, feed_interval=serve_interval)
+    generator = VehicleGenerator(make_files=False)
+    done = threading.Event()      # loader finished
+    finished = threading.Event()  # runner finished
+    frames = [0]
+
+    def loader():
+        while generator.vehicle_counter < total:
+            vehicles = []
+            for _ in range(batch_cycles):
+                for _, v_data in generator.generate_cycle():
+                    vehicles.append(Vehicle(v_data['id'], v_data['lane']))
+            engine.arrive_many(vehicles)
+        done.set()
+
+    def runner():
+        # short slices of at most limit events - run_until holds engine.lock
+        # the whole time, and the reader should get in between them (the
+        # lock isn't fair, so give up the GIL after each one)
+        def run_for(seconds):
+            t = engine.clock + seconds
+            while not engine.run_until(t, limit):
+                time.sleep(0)
+            time.sleep(0)
+
+        while not done.is_set():
+            run_for(step)
+        # pick up the last batch and serve every lane out
+        while True:
+            run_for(step)
+            if engine.queued() == 0:
+                break
+        finished.set()
+
+    def reader():
+        while not finished.is_set():
+            with engine.lock:
+                for q in engine.queues.values():
+                    q.head(8)
+                    q.size()
+            frames[0] += 1
+            time.sleep(0.001)
+
+    threads = [threading.Thread(target=fn) for fn in (loader, runner, reader)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    generated = generator.vehicle_counter
+    served = engine.total_served
+    queued = engine.queued()
+    print(f"generated {generated:,}  arrived {engine.arrived:,}  served {served:,}  "
+          f"queued {queued:,}  rejected {engine.rejected:,}  dropped {engine.dropped}  "
+          f"reader frames {frames[0]:,}  ({elapsed:.1f}s)")
+    assert engine.arrived == generated, "arrivals lost between the loader and the engine"
+    assert engine.dropped == 0, "arrivals dropped"
+    assert generated == served + queued + engine.rejected, "vehicles lost or double counted"
+    assert frames[0] >= min_frames, f"reader only got in {frames[0]} times (want {min_frames})"
+    print("conservation holds")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stress the threaded queue layer and check conservation")
+    parser.add_argument("-n", type=int, default=1000000, help="vehicles to push through")
+    parser.add_argument("--capacity", type=int, default=None, help="lane capacity (arrivals over it are rejected)")
+    parser.add_argument("--step", type=float, default=0.1, help="engine seconds per run_until call (one lock hold)")
+    parser.add_argument("--limit", type=int, default=1000, help="most events per run_until call")
+    parser.add_argument("--min-frames", type=int, default=100, help="reader passes needed for the run to count")
+    args = parser.parse_args()
+    stress(args.n, capacity=args.capacity, step=args.step, limit=args.limit,
+           min_frames=args.min_frames)
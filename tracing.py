@@ -0,0 +1,395 @@
+import json
+import struct
+import threading
+import time
+from collections import deque
+from controllers import make_controller
+from engine import AVG_RULES, DEPART, FREE, LIGHT, Junction, JunctionEngine, Vehicle
+from metrics import LatencyHistogram
+
+# append-only event trace of an engine run, and deterministic replay
+#
+# the engine itself has no randomness, so everything that happens in a run
+# follows from the vehicles that came in from outside and when the engine
+# saw them. the trace records those inputs on the engine clock, plus the
+# light changes and departures they led to. replaying feeds the same inputs
+# to a fresh engine at the same points and checks it makes the same decisions
+#
+# file: a stream of records, each a 9 byte header (kind, engine time) then a
+# fixed payload for the kind. lane and junction names go in a string table
+# (NAME records) and are referred to by number. vehicle ids are "V<number>"
+
+HEADER = struct.Struct('<Bd')
+CONFIG = 0     # uint32 length + JSON engine/junction setup, always first
+NAME = 1       # uint16 index, uint8 length + utf-8 name
+ATTACH = 2     # generator chain, interval, junction
+INPUT = 3      # arrival time, vehicle, lane, junction - handed over via arrive()
+GENERATED = 4  # generator chain, vehicle, lane, junction
+SWITCH = 5     # junction, lane (NONE = all red)
+SERVED = 6     # vehicle, lane, junction - through the light
+TURNED = 7     # vehicle, lane, junction - free left turn
+PAYLOADS = {
+    NAME: struct.Struct('<HB'),
+    ATTACH: struct.Struct('<HdH'),
+    INPUT: struct.Struct('<dQHH'),
+    GENERATED: struct.Struct('<HQHH'),
+    SWITCH: struct.Struct('<HH'),
+    SERVED: struct.Struct('<QHH'),
+    TURNED: struct.Struct('<QHH'),
+}
+LENGTH = struct.Struct('<I')
+NONE = 0xFFFF
+KIND_NAMES = {CONFIG: "config", NAME: "name", ATTACH: "attach", INPUT: "input",
+              GENERATED: "generated", SWITCH: "light", SERVED: "served", TURNED: "turned"}
+
+def engine_config(engine):
+    # enough to build an identical engine (queues start empty)
+    junctions = []
+    for j in engine.junctions.values():
+        junctions.append({
+            "name": j.name, "roads": j.roads, "priority_lane": j.priority_lane,
+            "priority_on": j.priority_on, "priority_off": j.priority_off,
+            "priority_keep": j.priority_keep, "avg_rule": j.avg_rule,
+            "exits": {road: list(link) for road, link in j.exits.items()},
+            "controller": j.controller.config(),
+            "capacity": j.capacity, "overflow": j.overflow, "left_share": j.left_share,
+            "compact": j.compact,
+        })
+    return {"serve_interval": engine.serve_interval, "free_interval": engine.free_interval,
+            "feed_interval": engine.feed_interval, "junctions": junctions}
+
+def build_from_config(config, **policy):
+    # policy overrides (priority_on=8, controller="max-pressure", ...) apply to
+    # every junction, to see what a policy change would have done with the
+    # same arrivals
+    junctions = []
+    for spec in config["junctions"]:
+        kwargs = {k: spec[k] for k in ("priority_on", "priority_off", "priority_keep", "avg_rule")}
+        kwargs["controller"] = spec.get("controller", "priority")
+        for key, default in (("capacity", None), ("overflow", "reject"), ("left_share", 0.3), ("compact", False)):
+            kwargs[key] = spec.get(key, default)
+        kwargs.update(policy)
+        kwargs["controller"] = make_controller(kwargs["controller"])  # one each, they can keep state
+        j = Junction(spec["name"], spec["roads"], spec["priority_lane"], **kwargs)
+        for road, (to_junction, to_road, travel_time) in spec["exits"].items():
+            j.link(road, to_junction, to_road, travel_time)
+        junctions.append(j)
+    # traces from before L1 lanes were served have no feed_interval
+    return JunctionEngine(junctions, config["serve_interval"], config["free_interval"],
+                          config.get("feed_interval"))
+
+def vehicle_number(vid):
+    return int(vid[1:])
+
+# records a run - create it on a fresh engine, before attaching generators
+class TraceRecorder:
+    def __init__(self, engine, path):
+        if engine.clock != 0 or engine.arrived != 0:
+            raise ValueError("a trace has to start from a fresh engine")
+        self.engine = engine
+        self.f = open(path, 'wb')
+        self.names = {}
+        self.chains = {}  # id of a GENERATE event's data -> chain number
+        self.count = 0
+        blob = json.dumps(engine_config(engine)).encode()
+        self.f.write(HEADER.pack(CONFIG, 0.0) + LENGTH.pack(len(blob)) + blob)
+        engine.recorder = self
+        engine.add_observer(self)
+
+    def name(self, text):
+        if text is None:
+            return NONE
+        idx = self.names.get(text)
+        if idx is None:
+            idx = self.names[text] = len(self.names)
+            raw = text.encode()
+            self.f.write(HEADER.pack(NAME, 0.0) + PAYLOADS[NAME].pack(idx, len(raw)) + raw)
+        return idx
+
+    def write(self, kind, t, *fields):
+        self.f.write(HEADER.pack(kind, t) + PAYLOADS[kind].pack(*fields))
+        self.count += 1
+
+    # inputs - called by the engine
+    def attach(self, t, data):
+        chain = self.chains[id(data)] = len(self.chains)
+        generator, interval, junction = data
+        self.write(ATTACH, t, chain, interval, self.name(junction))
+
+    def input(self, t, arrival, v):
+        self.write(INPUT, t, arrival, vehicle_number(v.id), self.name(v.lane), self.name(v.junction))
+
+    def generated(self, t, data, v):
+        self.write(GENERATED, t, self.chains[id(data)], vehicle_number(v.id),
+                   self.name(v.lane), self.name(v.junction))
+
+    # outputs - as an engine observer
+    def __call__(self, engine, kind, data):
+        if kind == LIGHT:
+            junction, lane = data
+            self.write(SWITCH, engine.clock, self.name(junction), self.name(lane))
+        elif kind == DEPART or kind == FREE:
+            self.write(SERVED if kind == DEPART else TURNED, engine.clock, vehicle_number(data.id),
+                       self.name(data.lane), self.name(data.junction))
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        # detach first so an engine thread still running can't write to a closed file
+        with self.engine.lock:
+            self.engine.recorder = None
+            self.engine.observers.remove(self)
+            self.f.close()
+
+def read_trace(path):
+    # yields (kind, time, fields) with names already looked up
+    names = []
+    with open(path, 'rb') as f:
+        data = f.read()
+    pos = 0
+    while pos + HEADER.size <= len(data):
+        kind, t = HEADER.unpack_from(data, pos)
+        pos += HEADER.size
+        if kind == CONFIG:
+            n, = LENGTH.unpack_from(data, pos)
+            pos += LENGTH.size
+            yield kind, t, json.loads(data[pos:pos + n])
+            pos += n
+            continue
+        payload = PAYLOADS[kind]
+        if pos + payload.size > len(data):
+            return  # cut off mid-record (e.g. the recording process died)
+        fields = payload.unpack_from(data, pos)
+        pos += payload.size
+        if kind == NAME:
+            idx, n = fields
+            names.append(data[pos:pos + n].decode())
+            pos += n
+            continue
+        look = lambda i: None if i == NONE else names[i]
+        if kind == ATTACH:
+            fields = (fields[0], fields[1], look(fields[2]))
+        elif kind == INPUT:
+            fields = (fields[0], f"V{fields[1]}", look(fields[2]), look(fields[3]))
+        elif kind == GENERATED:
+            fields = (fields[0], f"V{fields[1]}", look(fields[2]), look(fields[3]))
+        elif kind == SWITCH:
+            fields = (look(fields[0]), look(fields[1]))
+        else:
+            fields = (f"V{fields[0]}", look(fields[1]), look(fields[2]))
+        yield kind, t, fields
+
+# stands in for a generator on replay - hands back what the recorded one made
+class ReplayGenerator:
+    def __init__(self, engine):
+        self.engine = engine
+        self.pending = deque()  # (time, vehicle data)
+
+    def generate_cycle(self):
+        cycle = []
+        while len(self.pending) > 0 and self.pending[0][0] <= self.engine.clock:
+            cycle.append((None, self.pending.popleft()[1]))
+        return cycle
+
+# feeds a trace back into an engine, as fast as possible or paced against
+# the wall clock, and compares what the engine does with what was recorded
+class TraceReplayer:
+    def __init__(self, path, engine=None, **policy):
+        self.path = path
+        self.engine = engine
+        self.policy = policy
+        self.reader = None  # same shape as LiveSimulation for the tkinter view
+        self.running = False
+        self.expected = deque()
+        self.produced = deque()
+        self.matched = 0
+        self.mismatched = 0
+        self.divergence = None  # first (time, recorded, replayed) that differ
+        self.records = read_trace(path)
+        kind, _, config = next(self.records)
+        if kind != CONFIG:
+            raise ValueError(f"{path} is not a trace file")
+        if self.engine is None:
+            self.engine = build_from_config(config, **policy)
+        self.engine.add_observer(self)
+        self.chains = {}
+        self.end = 0.0
+
+    def __call__(self, engine, kind, data):
+        if kind == LIGHT:
+            self.produced.append((engine.clock, SWITCH, data))
+        elif kind == DEPART or kind == FREE:
+            self.produced.append((engine.clock, SERVED if kind == DEPART else TURNED,
+                                  (data.id, data.lane, data.junction)))
+        self.compare()
+
+    def compare(self):
+        while len(self.expected) > 0 and len(self.produced) > 0:
+            rec = self.expected.popleft()
+            got = self.produced.popleft()
+            if rec == got:
+                self.matched += 1
+            else:
+                self.mismatched += 1
+                if self.divergence is None:
+                    self.divergence = (rec[0], rec, got)
+
+    def advance(self, t, speed=None, start=None):
+        # bring the engine to where the recording was when it took the next
+        # input. the recording only ever took inputs with everything up to
+        # its clock already done, apart from events due at exactly that time
+        # that no run_until() had reached yet - so only run when time moves
+        if t <= self.engine.clock:
+            return
+        if speed is not None:
+            while self.running:
+                now = (time.perf_counter() - start) * speed
+                if now >= t:
+                    break
+                self.engine.run_until(now)
+                self.unsent = False
+                time.sleep(min(0.05, (t - now) / speed))
+        self.engine.run_until(t)
+        self.unsent = False
+
+    def flush(self):
+        # inputs the recording drained on their own, before something else
+        # happened at the same time, go in on their own run_until() as well
+        if self.unsent:
+            self.engine.run_until(self.engine.clock)
+            self.unsent = False
+
+    def run(self, speed=None):
+        # speed=None replays as fast as it can, otherwise engine seconds per wall second
+        self.running = True
+        self.unsent = False  # inputs in the engine's inbox not drained yet
+        start = time.perf_counter()
+        split = False  # something was recorded since the last input
+        for kind, t, fields in self.records:
+            if not self.running:
+                return
+            self.end = max(self.end, t)
+            if kind == INPUT:
+                self.advance(t, speed, start)
+                if split:
+                    self.flush()
+                split = False
+                arrival, vid, lane, junction = fields
+                self.engine.arrive(Vehicle(vid, lane, junction), arrival)
+                self.unsent = True
+            elif kind == GENERATED:
+                chain, vid, lane, junction = fields
+                self.chains[chain].pending.append((t, {'id': vid, 'lane': lane}))
+            elif kind == ATTACH:
+                self.advance(t, speed, start)
+                self.flush()
+                chain, interval, junction = fields
+                self.chains[chain] = ReplayGenerator(self.engine)
+                self.engine.attach_generator(self.chains[chain], interval, junction)
+            else:
+                split = True
+                self.expected.append((t, kind, fields))
+        self.advance(self.end, speed, start)
+        self.flush()
+        self.compare()
+        self.running = False
+
+    def start(self, speed=None):
+        threading.Thread(target=self.run, args=(speed,), daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def report(self):
+        # recorded events the replay never produced (or the other way round)
+        # count as differences too
+        differ = self.mismatched + len(self.expected) + len(self.produced)
+        return {"matched": self.matched, "different": differ, "divergence": self.divergence,
+                "served": self.engine.total_served, "queued": self.engine.queued(), "end": self.end}
+
+def trace_info(path):
+    counts = {}
+    end = 0.0
+    for kind, t, _ in read_trace(path):
+        counts[KIND_NAMES[kind]] = counts.get(KIND_NAMES[kind], 0) + 1
+        end = max(end, t)
+    return counts, end
+
+def replay_summary(path, **policy):
+    # replay flat out and boil the run down to one row for comparisons
+    replayer = TraceReplayer(path, **policy)
+    waits = LatencyHistogram()
+    def collect(engine, kind, v):
+        if kind == DEPART or kind == FREE:
+            waits.record(v.wait_time)
+    replayer.engine.add_observer(collect)
+    replayer.run()
+    res = replayer.report()
+    hours = res["end"] / 3600.0
+    return {"served": res["served"], "per_hour": round(res["served"] / hours, 1) if hours > 0 else 0.0,
+            "wait_mean": round(waits.mean(), 2), "wait_p95": round(waits.percentile(95), 2),
+            "queued": res["queued"], "matched": res["matched"], "different": res["different"]}
+
+if __name__ == "__main__":
+    import argparse
+    from metrics import MetricsCollector
+
+    parser = argparse.ArgumentParser(description="Inspect, replay or compare controllers on an engine trace")
+    parser.add_argument("command", choices=["info", "replay", "compare"])
+    parser.add_argument("path", help="trace written with --trace by engine.py or simulator.py")
+    parser.add_argument("--speed", type=float, default=None, help="engine seconds per wall second (default: flat out)")
+    parser.add_argument("--priority-on", type=int, default=None, help="replay under a different policy")
+    parser.add_argument("--priority-off", type=int, default=None)
+    parser.add_argument("--priority-keep", type=int, default=None)
+    parser.add_argument("--avg-rule", choices=AVG_RULES, default=None)
+    parser.add_argument("--controller", default=None,
+                        help="replay with this controller, or a comma list for compare (default: priority,max-pressure)")
+    parser.add_argument("--min-green", type=float, default=None, help="max-pressure minimum green seconds")
+    parser.add_argument("--max-green", type=float, default=None, help="max-pressure maximum green seconds")
+    parser.add_argument("--switch-ratio", type=float, default=None, help="max-pressure early switch ratio")
+    args = parser.parse_args()
+
+    policy = {k: v for k, v in (("priority_on", args.priority_on), ("priority_off", args.priority_off),
+                                ("priority_keep", args.priority_keep), ("avg_rule", args.avg_rule))
+              if v is not None}
+    def controller_spec(name):
+        spec = {"name": name}
+        if name == "max-pressure":
+            for key, value in (("min_green", args.min_green), ("max_green", args.max_green),
+                               ("switch_ratio", args.switch_ratio)):
+                if value is not None:
+                    spec[key] = value
+        return spec
+
+    if args.command == "info":
+        counts, end = trace_info(args.path)
+        print(f"{args.path}: {end:.1f}s of engine time")
+        for name, n in counts.items():
+            print(f"  {name:<10} {n:>10,}")
+    elif args.command == "compare":
+        names = (args.controller or "priority,max-pressure").split(',')
+        print(f"{'controller':<14} {'served':>8} {'/hour':>8} {'wait s':>8} {'p95 s':>8} {'queued':>8}")
+        for name in names:
+            row = replay_summary(args.path, controller=controller_spec(name), **policy)
+            print(f"{name:<14} {row['served']:>8} {row['per_hour']:>8} {row['wait_mean']:>8} "
+                  f"{row['wait_p95']:>8} {row['queued']:>8}")
+    else:
+        if args.controller:
+            policy["controller"] = controller_spec(args.controller)
+        replayer = TraceReplayer(args.path, **policy)
+        metrics = MetricsCollector()
+        replayer.engine.add_observer(metrics)
+        start = time.perf_counter()
+        replayer.run(args.speed)
+        elapsed = time.perf_counter() - start
+        res = replayer.report()
+        print(f"Replayed {res['end']:.1f}s of engine time in {elapsed:.2f}s")
+        print(f"Total served: {res['served']}, still queued: {res['queued']}")
+        print(f"Events matching the recording: {res['matched']}, different: {res['different']}")
+        if res["divergence"] is not None:
+            t, rec, got = res["divergence"]
+            print(f"First difference at {t:.3f}s: recorded {KIND_NAMES[rec[1]]} {rec[2]}, "
+                  f"replayed {KIND_NAMES[got[1]]} {got[2]} at {got[0]:.3f}s")
+        print()
+        metrics.print_table()
@@ -1,12 +1,35 @@
 import random
 import time
-import json
 import os
+from records import FORMATS, data_file, encode
 
 # vehicle generator - now generates for all 3 lanes per road
 class VehicleGenerator:
-    def __init__(self):
+    def __init__(self, make_files=True, batched=False, fsync='never', log='vehicle', fmt='json', sender=None, seed=None,
+                 demand=None):
         self.vehicle_counter = 0
+        # a seed gives the generator its own random stream, so a run can be
+        # repeated whatever else in the process uses random
+        self.rng = random.Random(seed) if seed is not None else random
+        # a demand.DemandModel draws every lane's count for a cycle at once
+        # instead of the hardcoded ranges in lane_count
+        self.demand = demand
+        # a transport.StreamSender pushes each cycle to the simulator as one
+        # frame instead of writing the lane files
+        self.sender = sender
+        if sender is not None:
+            make_files = False
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown lane file format: {fmt}")
+        self.fmt = fmt  # 'json' lines or fixed-width 'binary' records (see records.py)
+        
+        # batched mode keeps one handle per road file open and writes a whole
+        # cycle with a single write() per file
+        self.batched = batched
+        self.fsync = fsync  # 'never', 'cycle' (after every cycle) or 'close'
+        self.log = log      # 'vehicle' (every car), 'summary' (per cycle) or 'quiet'
+        self.handles = {}
+        self.total_written = 0
         # all 12 lanes
         self.lanes = [
             "AL1", "AL2", "AL3",  # Road A
@@ -15,16 +38,17 @@ class VehicleGenerator:
             "DL1", "DL2", "DL3"   # Road D
         ]
         self.files = {
-            "lanea.txt": ["AL1", "AL2", "AL3"],
-            "laneb.txt": ["BL1", "BL2", "BL3"],
-            "lanec.txt": ["CL1", "CL2", "CL3"],
-            "laned.txt": ["DL1", "DL2", "DL3"]
+            data_file("lanea.txt", fmt): ["AL1", "AL2", "AL3"],
+            data_file("laneb.txt", fmt): ["BL1", "BL2", "BL3"],
+            data_file("lanec.txt", fmt): ["CL1", "CL2", "CL3"],
+            data_file("laned.txt", fmt): ["DL1", "DL2", "DL3"]
         }
         
-        # make sure files exist
-        for f in self.files.keys():
-            if not os.path.exists(f):
-                open(f, 'w').close()
+        # make sure files exist (the headless engine doesn't need them)
+        if make_files:
+            for f in self.files.keys():
+                if not os.path.exists(f):
+                    open(f, 'w').close()
     
     def generate_vehicle(self, lane):
         self.vehicle_counter += 1
@@ -32,62 +56,168 @@ class VehicleGenerator:
             'id': f"V{self.vehicle_counter}",
             'lane': lane
         }
+        if self.fmt == 'binary':
+            v_data['time'] = time.time()  # the binary record carries the arrival time
         return v_data
     
     def write_to_file(self, fname, vehicle_data):
-        with open(fname, 'a') as f:
-            f.write(json.dumps(vehicle_data) + '\n')
+        with open(fname, 'ab') as f:
+            f.write(encode(vehicle_data, self.fmt))
     
-    def random_generation(self):
-        # generate vehicles for each road file
+    def get_handle(self, fname):
+        # reopen if the simulator rotated the file out from under us
+        fd = self.handles.get(fname)
+        if fd is not None:
+            try:
+                if os.stat(fname).st_ino == os.fstat(fd).st_ino:
+                    return fd
+            except OSError:
+                pass
+            os.close(fd)
+        fd = os.open(fname, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.handles[fname] = fd
+        return fd
+    
+    def write_batch(self, fname, records):
+        # one buffer, one syscall - O_APPEND keeps it atomic against other writers
+        data = b''.join(records)
+        fd = self.get_handle(fname)
+        while data:
+            n = os.write(fd, data)
+            data = data[n:]
+        if self.fsync == 'cycle':
+            os.fsync(fd)
+    
+    def close(self):
+        if self.sender is not None:
+            self.sender.close()
+        for fd in self.handles.values():
+            if self.fsync != 'never':
+                os.fsync(fd)
+            os.close(fd)
+        self.handles = {}
+    
+    def lane_count(self, lane):
+        # how many vehicles arrive on this lane in one cycle
+        num_vehicles = 0
+        
+        # L1 lanes (incoming) - moderate traffic
+        if 'L1' in lane:
+            num_vehicles = self.rng.randint(1, 3)
+        
+        # AL2 is priority lane - give it more vehicles sometimes to trigger priority mode
+        elif lane == "AL2":
+            if self.rng.random() > 0.65:
+                num_vehicles = self.rng.randint(4, 7)  # burst for priority mode
+            else:
+                num_vehicles = self.rng.randint(1, 3)
+        
+        # L2 lanes (need traffic light) - regular traffic
+        elif 'L2' in lane:
+            num_vehicles = self.rng.randint(1, 4)
+        
+        # L3 lanes (free left turn) - light to moderate traffic
+        elif 'L3' in lane:
+            num_vehicles = self.rng.randint(1, 3)
+        
+        return num_vehicles
+    
+    def generate_cycle(self):
+        # one generation cycle as (file, vehicle data) pairs
+        cycle = []
+        if self.demand is not None:
+            lane_files = {lane: fname for fname, lane_list in self.files.items() for lane in lane_list}
+            for lane, n in zip(self.demand.lanes, self.demand.next_counts()):
+                for _ in range(n):
+                    cycle.append((lane_files[lane], self.generate_vehicle(lane)))
+            return cycle
         for fname, lane_list in self.files.items():
             for lane in lane_list:
-                # default vehicles per lane
-                num_vehicles = 0
-                
-                # L1 lanes (incoming) - moderate traffic
-                if 'L1' in lane:
-                    num_vehicles = random.randint(1, 3)
-                
-                # AL2 is priority lane - give it more vehicles sometimes to trigger priority mode
-                elif lane == "AL2":
-                    if random.random() > 0.65:
-                        num_vehicles = random.randint(4, 7)  # burst for priority mode
-                    else:
-                        num_vehicles = random.randint(1, 3)
-                
-                # L2 lanes (need traffic light) - regular traffic
-                elif 'L2' in lane:
-                    num_vehicles = random.randint(1, 4)
-                
-                # L3 lanes (free left turn) - light to moderate traffic
-                elif 'L3' in lane:
-                    num_vehicles = random.randint(1, 3)
-                
-                for _ in range(num_vehicles):
-                    v = self.generate_vehicle(lane)
-                    self.write_to_file(fname, v)
-                    print(f"Generated {v['id']} for {lane}")
+                for _ in range(self.lane_count(lane)):
+                    cycle.append((fname, self.generate_vehicle(lane)))
+        return cycle
+    
+    def random_generation(self):
+        # generate vehicles for each road file
+        cycle = self.generate_cycle()
+        if self.sender is not None:
+            self.sender.send(b''.join(encode(v, self.fmt) for _, v in cycle), self.fmt)
+        elif self.batched:
+            buffers = {}
+            for fname, v in cycle:
+                buffers.setdefault(fname, []).append(encode(v, self.fmt))
+            for fname, lines in buffers.items():
+                self.write_batch(fname, lines)
+        else:
+            for fname, v in cycle:
+                self.write_to_file(fname, v)
+        
+        if self.log == 'vehicle':
+            for fname, v in cycle:
+                print(f"Generated {v['id']} for {v['lane']}")
+        elif self.log == 'summary':
+            print(f"Generated {len(cycle)} vehicles (total {self.total_written + len(cycle)})")
+        self.total_written += len(cycle)
+        return len(cycle)
     
-    def run(self):
-        print("Vehicle Generator Started...")
-        print("Generating vehicles for 12 lanes (3 per road)")
-        print("AL2 is priority lane, L3 lanes are free left turn\n")
+    def run(self, interval=5, cycles=None):
+        if self.log != 'quiet':
+            print("Vehicle Generator Started...")
+            print("Generating vehicles for 12 lanes (3 per road)")
+            print("AL2 is priority lane, L3 lanes are free left turn\n")
         
         gen_cycle = 0
-        while True:
-            gen_cycle += 1
-            print(f"\n--- Generation Cycle {gen_cycle} ---")
-            
-            self.random_generation()
-            
-            time.sleep(5)  # generate new vehicles every 5 sec
+        start = time.perf_counter()
+        busy = 0.0
+        try:
+            while cycles is None or gen_cycle < cycles:
+                gen_cycle += 1
+                if self.log == 'vehicle':
+                    print(f"\n--- Generation Cycle {gen_cycle} ---")
+                
+                t0 = time.perf_counter()
+                self.random_generation()
+                busy += time.perf_counter() - t0
+                
+                if interval > 0:
+                    time.sleep(interval)  # generate new vehicles every 5 sec
+            if self.sender is not None:
+                self.sender.flush()  # don't stop before the simulator has everything
+        finally:
+            self.close()
+            elapsed = time.perf_counter() - start
+            # throughput of the generate+write work itself, ignoring the sleeps
+            rate = self.total_written / busy if busy > 0 else 0
+            print(f"\n{self.total_written} vehicles in {gen_cycle} cycles over {elapsed:.1f}s "
+                  f"({rate:,.0f} vehicles/s while writing)")
 
 if __name__ == "__main__":
-    generator = VehicleGenerator()
+    import argparse
+    from transport import DEFAULT_ADDRESS, StreamSender
+    
+    parser = argparse.ArgumentParser(description="Write random vehicles to the lane files")
+    parser.add_argument("--batched", action="store_true", help="keep files open and write one buffer per file per cycle")
+    parser.add_argument("--fsync", choices=["never", "cycle", "close"], default="never")
+    parser.add_argument("--log", choices=["vehicle", "summary", "quiet"], default="vehicle")
+    parser.add_argument("--interval", type=float, default=5, help="seconds between cycles")
+    parser.add_argument("--format", choices=FORMATS, default="json", help="JSON lines (lane*.txt) or binary records (lane*.bin)")
+    parser.add_argument("--transport", choices=["file", "stream"], default="file", help="lane files or a socket to the simulator")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="unix socket path or host:port for --transport stream")
+    parser.add_argument("--cycles", type=int, default=None, help="stop after this many cycles")
+    parser.add_argument("--seed", type=int, default=None, help="repeatable vehicle counts")
+    parser.add_argument("--demand", default=None, help="JSON/YAML demand profile (Poisson arrivals, see demand.py)")
+    args = parser.parse_args()
+    
+    demand = None
+    if args.demand:
+        from demand import DemandModel
+        demand = DemandModel.from_file(args.demand, cycle=args.interval, seed=args.seed)
+    sender = StreamSender(args.address) if args.transport == "stream" else None
+    generator = VehicleGenerator(batched=args.batched, fsync=args.fsync, log=args.log, fmt=args.format,
+                                 sender=sender, seed=args.seed, demand=demand)
     try:
-        generator.run()
+        generator.run(interval=args.interval, cycles=args.cycles)
     except KeyboardInterrupt:
         print("\n\nGenerator stopped by user")# works now
 # change
-# done
+# done
\ No newline at end of file
@@ -0,0 +1,308 @@
+import os
+import queue
+import select
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from records import FORMATS, decode
+
+# streaming transport between the generator and the simulator
+# frames are length-prefixed: 4 byte length, 1 byte format, then the encoded
+# records (JSON lines or binary records, same as the lane files). the
+# simulator answers every frame it has queued with one ACK byte, and the
+# generator keeps each frame until it is acked
+#
+# the address is either a unix socket path ("traffic.sock") or "host:port"
+# for TCP (windows has no unix sockets)
+
+HEADER = struct.Struct('!IB')
+MAX_FRAME = 64 << 20
+DEFAULT_ADDRESS = "traffic.sock"
+ACK = b'\x06'
+
+def parse_address(address):
+    if ':' in address and os.path.sep not in address:
+        host, port = address.rsplit(':', 1)
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    return socket.AF_UNIX, address
+
+def recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+# simulator side - same wait()/wake_fd()/read_new()/close() interface as
+# LaneFileReader so LiveSimulation can take either
+class StreamReceiver:
+    def __init__(self, address=DEFAULT_ADDRESS, max_pending=256):
+        self.address = address
+        # frames waiting for the simulator - when this fills up the reader
+        # threads block, stop draining their sockets and the generator's
+        # sendall() stalls until we catch up (backpressure)
+        self.frames = queue.Queue(maxsize=max_pending)
+        self.held = None  # frame taken off the queue by wait()
+        self.running = True
+        self.conns = set()  # open generator connections, shut down by close()
+        self.conns_lock = threading.Lock()
+        # a byte goes down this pipe for every frame, so an event loop can
+        # watch it instead of blocking in wait()
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_r, False)
+        os.set_blocking(self.wake_w, False)
+
+        family, addr = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.remove(addr)  # stale socket from a previous run
+        self.server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(addr)
+        self.server.listen()
+
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while self.running:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                break
+            threading.Thread(target=self.connection_loop, args=(conn,), daemon=True).start()
+
+    def connection_loop(self, conn):
+        with self.conns_lock:
+            if not self.running:
+                conn.close()
+                return
+            self.conns.add(conn)
+        try:
+            self.serve_connection(conn)
+        except OSError:
+            pass  # reset, or shut down by close()
+        finally:
+            with self.conns_lock:
+                self.conns.discard(conn)
+            conn.close()
+
+    def serve_connection(self, conn):
+        while self.running:
+            header = recv_exact(conn, HEADER.size)
+            if header is None:
+                break  # generator went away - it will reconnect
+            length, fmt_code = HEADER.unpack(header)
+            if length > MAX_FRAME or fmt_code >= len(FORMATS):
+                break  # garbage on the wire - drop the connection
+            payload = recv_exact(conn, length)
+            if payload is None:
+                break
+            self.frames.put((FORMATS[fmt_code], payload))
+            if not self.running:
+                break  # closed while we were blocked - don't ack it
+            conn.sendall(ACK)
+            try:
+                os.write(self.wake_w, b'x')
+            except (BlockingIOError, OSError):
+                pass  # pipe full (already readable) or closed
+
+    backlog_unit = "frames"
+
+    def backlog(self):
+        # frames received but not read yet
+        return self.frames.qsize() + (self.held is not None)
+
+    def wait(self, timeout):
+        # block until a frame arrives or the timeout runs out
+        if not self.frames.empty():
+            return True
+        try:
+            frame = self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        # keep it for read_new so ordering is preserved
+        self.held = frame
+        return True
+
+    def wake_fd(self):
+        return self.wake_r
+
+    def clear_wake(self):
+        woken = False
+        try:
+            while os.read(self.wake_r, 4096):
+                woken = True
+        except BlockingIOError:
+            pass
+        return woken
+
+    def idle_timeout(self):
+        return None
+
+    def read_new(self):
+        vehicles = []
+        frame = self.held
+        self.held = None
+        while True:
+            if frame is None:
+                try:
+                    frame = self.frames.get_nowait()
+                except queue.Empty:
+                    break
+            fmt, payload = frame
+            new, _ = decode(payload, fmt)
+            vehicles.extend(new)
+            frame = None
+        return vehicles
+
+    def close(self):
+        self.running = False
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)  # wakes accept() so the port is free again
+        except OSError:
+            pass
+        self.server.close()
+        # so generators see the connection go and resend what wasn't acked
+        with self.conns_lock:
+            for conn in self.conns:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        os.close(self.wake_r)
+        os.close(self.wake_w)
+        family, addr = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.remove(addr)
+
+# generator side - reconnects on its own and resends every frame the
+# simulator hasn't acked. a send into a connection the simulator has just
+# dropped can still succeed (it only reaches our socket buffer), so a frame
+# only counts as delivered once its ack comes back
+class StreamSender:
+    def __init__(self, address=DEFAULT_ADDRESS, retry_max=5.0, window=64):
+        self.address = address
+        self.retry_max = retry_max
+        self.window = window  # frames in flight before send() waits for acks
+        self.sock = None
+        self.unacked = deque()
+
+    def connect(self):
+        # back off up to retry_max seconds between attempts until the simulator is up
+        delay = 0.1
+        while True:
+            family, addr = parse_address(self.address)
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                sock.connect(addr)
+                self.sock = sock
+                return
+            except OSError:
+                sock.close()
+                time.sleep(delay)
+                delay = min(delay * 2, self.retry_max)
+
+    def read_acks(self, limit):
+        # take acks off the socket until at most limit frames are in flight
+        while self.unacked:
+            wait = None if len(self.unacked) > limit else 0
+            readable, _, _ = select.select([self.sock], [], [], wait)
+            if not readable:
+                return
+            acks = self.sock.recv(4096)
+            if not acks:
+                raise ConnectionResetError("simulator closed the connection")
+            for _ in range(min(len(acks), len(self.unacked))):
+                self.unacked.popleft()
+
+    def send(self, records, fmt, limit=None):
+        # records is the already-encoded payload for one frame (None just
+        # waits for the acks)
+        if records is not None:
+            self.unacked.append(HEADER.pack(len(records), FORMATS.index(fmt)) + records)
+            pending = [self.unacked[-1]]
+        else:
+            pending = []
+        limit = self.window if limit is None else limit
+        while True:
+            if self.sock is None:
+                self.connect()
+                pending = list(self.unacked)  # new connection - resend everything not acked
+            try:
+                # blocks while the simulator is behind
+                for frame in pending:
+                    self.sock.sendall(frame)
+                pending = []
+                self.read_acks(limit)
+                return
+            except OSError:
+                # simulator restarted - keep any acks it sent before going
+                self.drain_acks()
+                self.sock.close()
+                self.sock = None
+
+    def drain_acks(self):
+        try:
+            self.read_acks(len(self.unacked))
+        except OSError:
+            pass
+
+    def flush(self):
+        # wait until the simulator has acked everything
+        if self.unacked:
+            self.send(None, None, limit=0)
+
+    def close(self):
+        # frames still unacked are dropped - flush() first to keep them
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+    from records import encode
+
+    # restart check: frames sent around a simulator restart all arrive
+    parser = argparse.ArgumentParser(description="Check no frame is lost when the simulator restarts")
+    parser.add_argument("--address", default=None, help="unix socket path or host:port (default: a temp socket)")
+    parser.add_argument("-n", type=int, default=5, help="frames to send, the first one before the restart")
+    args = parser.parse_args()
+
+    address = args.address or os.path.join(tempfile.mkdtemp(), "restart.sock")
+
+    def frame(i):
+        return encode({'id': f"V{i}", 'lane': "AL2", 'time': 0.0}, "json")
+
+    def take(receiver, n):
+        got = []
+        deadline = time.monotonic() + 10
+        while len(got) < n and time.monotonic() < deadline:
+            if receiver.wait(0.1):
+                got.extend(v['id'] for v in receiver.read_new())
+        return got
+
+    receiver = StreamReceiver(address)
+    sender = StreamSender(address)
+    sender.send(frame(1), "json")
+    first = take(receiver, 1)
+    receiver.close()
+    receiver = StreamReceiver(address)
+    rest = []
+    # read while sending, or a full frame queue stalls the sender
+    taker = threading.Thread(target=lambda: rest.extend(take(receiver, args.n - 1)))
+    taker.start()
+    for i in range(2, args.n + 1):
+        sender.send(frame(i), "json")
+    sender.flush()
+    taker.join()
+    sender.close()
+    receiver.close()
+    print(f"before restart: {len(first)} frame(s), after: {len(rest)} of {args.n - 1}")
+    assert first == ["V1"], "frame lost before the restart"
+    assert rest == [f"V{i}" for i in range(2, args.n + 1)], "frames lost or repeated across the restart"
+    print("every frame arrived")